@@ -0,0 +1,98 @@
+import argparse
+import json
+import sys
+from itertools import product
+
+from .driver import DOWNLOADERS, STORAGE_HANDLERS, run_case
+
+
+def get_arguments():
+    parser = argparse.ArgumentParser(prog="python -m benchmarks")
+    parser.add_argument("-u", "--urls", dest="urls", type=int, nargs="+",
+                        default=[10, 1000])
+    parser.add_argument("-r", "--rules", dest="rules", type=int, nargs="+",
+                        default=[1, 5])
+    parser.add_argument("-d", "--downloaders", dest="downloaders",
+                        nargs="+", choices=list(DOWNLOADERS.keys()),
+                        default=list(DOWNLOADERS.keys()))
+    parser.add_argument("-s", "--storages", dest="storages", nargs="+",
+                        choices=list(STORAGE_HANDLERS.keys()),
+                        default=list(STORAGE_HANDLERS.keys()))
+    parser.add_argument("-w", "--workers", dest="workers", type=int,
+                        default=0)
+    parser.add_argument("--concurrency", dest="concurrency", type=int,
+                        default=32)
+    parser.add_argument("--rounds", dest="rounds", type=int, default=2)
+    parser.add_argument("--size", dest="size", type=int, default=16384)
+    parser.add_argument("--depth", dest="depth", type=int, default=8)
+    parser.add_argument("--latency", dest="latency", type=float, default=0)
+    parser.add_argument("--changed-share", dest="changed_share", type=float,
+                        default=0.1)
+    parser.add_argument("--error-share", dest="error_share", type=float,
+                        default=0)
+    parser.add_argument("--no-etag", dest="etag", action="store_false")
+    parser.add_argument("-o", "--output", dest="output")
+    parser.add_argument("--compare", dest="compare")
+    parser.add_argument("--tolerance", dest="tolerance", type=float,
+                        default=0.2)
+    return parser.parse_args()
+
+def get_cases(args):
+    for urls, rules, downloader, storage in product(
+            args.urls, args.rules, args.downloaders, args.storages):
+        yield (f"{downloader}/{storage}/urls={urls}/rules={rules}",
+               {"urls": urls, "rules": rules, "downloader": downloader,
+                "storage": storage, "workers": args.workers,
+                "concurrency": args.concurrency, "rounds": args.rounds,
+                "size": args.size, "depth": args.depth,
+                "latency": args.latency,
+                "changed_share": args.changed_share,
+                "error_share": args.error_share, "etag": args.etag})
+
+def print_result(name, rounds):
+    for i, r in enumerate(rounds):
+        times = " ".join(f"{stage}={t:.3f}s" for stage, t in
+                         r["times"].items())
+        stages = " ".join(f"{stage}={t:.3f}s" for stage, t in
+                          r["stages"].items())
+        print(f"{name} round={i}: {r['pages_per_s']:.1f} pages/s "
+              f"peak_rss={r['peak_rss_mb']:.1f}MB {times}", flush=True)
+        print(f"{name} round={i} stages: {stages}", flush=True)
+
+def compare(results, baseline, tolerance):
+    """
+    Return the regressions of the results compared to a baseline: rounds
+    that processed fewer pages per second or needed more memory than
+    allowed by the tolerance.
+    """
+
+    regressions = []
+    for name, rounds in results.items():
+        for i, (r, b) in enumerate(zip(rounds, baseline.get(name, []))):
+            if r["pages_per_s"] < b["pages_per_s"] * (1 - tolerance):
+                regressions.append(f"{name} round={i}: {r['pages_per_s']:.1f}"
+                                   f" pages/s, baseline "
+                                   f"{b['pages_per_s']:.1f}")
+            if r["peak_rss_mb"] > b["peak_rss_mb"] * (1 + tolerance):
+                regressions.append(f"{name} round={i}: peak_rss "
+                                   f"{r['peak_rss_mb']:.1f}MB, baseline "
+                                   f"{b['peak_rss_mb']:.1f}MB")
+    return regressions
+
+if __name__ == "__main__":
+    args = get_arguments()
+    results = {}
+    for name, case in get_cases(args):
+        results[name] = run_case(case)
+        print_result(name, results[name])
+
+    if args.output:
+        with open(args.output, "w") as file:
+            json.dump(results, file, indent=2)
+    if args.compare:
+        with open(args.compare, "r") as file:
+            regressions = compare(results, json.load(file), args.tolerance)
+        for regression in regressions:
+            print(f"Regression: {regression}", file=sys.stderr)
+        if regressions:
+            sys.exit(1)
@@ -0,0 +1,223 @@
+from __future__ import annotations
+
+from concurrent.futures import ProcessPoolExecutor
+from json import dump
+from multiprocessing import get_context
+from os import path
+from resource import RUSAGE_SELF, getrusage
+from tempfile import TemporaryDirectory
+from time import perf_counter
+from typing import Any, Iterable, Iterator
+
+from crawler import Crawler, Fingerprinter, Metrics, set_metrics
+from crawler.config_parser import StreamingJSONParser
+from crawler.config_parser.json_types import JsonConf, JsonConfFun
+from crawler.default_functions import SELECT_FUNCTIONS, FILTER_FUNCTIONS
+from crawler.pages_downloader import (AsyncDownloader, BaseDownloader,
+                                      FuturesDownloader, HostScheduler)
+from crawler.storage_handler import (BaseHandler, BlobHandler, JSONHandler,
+                                     SQLiteHandler)
+from main import crawl
+
+from .server import BenchmarkServer, PageGenerator
+
+
+DOWNLOADERS = {"futures": FuturesDownloader, "async": AsyncDownloader}
+STORAGE_HANDLERS = {"json": JSONHandler, "sqlite": SQLiteHandler,
+                    "blob": BlobHandler}
+
+# Select chains of the generated rules, used in turns
+SELECT_CHAINS = [
+    [{"function": "find", "args": ["div"], "kwargs": {"id": "content"}},
+     {"function": "find", "args": ["p"], "kwargs": {"class": "revision"}}],
+    [{"function": "find", "args": ["h1"], "kwargs": {}}],
+    [{"function": "find_all", "args": ["li"], "kwargs": {"limit": 8}}],
+    [{"function": "select", "args": ["#content p.revision"], "kwargs": {}}],
+    [{"function": "find", "args": ["ul"], "kwargs": {}},
+     {"function": "children", "args": [], "kwargs": {}}]
+]
+
+# Number of times the actions ran in the current process
+_actions = 0
+
+
+def count_action(tags: Any) -> None:
+    """
+    Action counting how often actions ran instead of printing the tags.
+
+    :param tags: The new and old selected tags.
+    """
+
+    global _actions
+    _actions += 1
+
+
+ACTION_FUNCTIONS = {"count": count_action}
+
+
+def get_select_chain(k: int) -> list[JsonConfFun]:
+    """
+    Return the select chain of a url's k-th generated rule. The chains of
+    a url's rules are all different.
+
+    :param k: The rule's index.
+
+    :return: The select chain.
+    """
+
+    if k < len(SELECT_CHAINS):
+        return SELECT_CHAINS[k]
+    return [{"function": "find", "args": ["ul"], "kwargs": {}},
+            {"function": "find", "args": ["a"],
+             "kwargs": {"href": f"/item/{k - len(SELECT_CHAINS)}"}}]
+
+
+def generate_config(urls: Iterable[str], rules: int) -> JsonConf:
+    """
+    Generate a config with the same number of rules for every url.
+
+    :param urls: The urls.
+    :param rules: The number of rules per url.
+
+    :return: The config.
+    """
+
+    tfas = [{"select-chain": get_select_chain(k),
+             "filters-actions-pairs": [
+                 {"filters": [{"function": "re_search",
+                               "args": ["Revision|Item|Page"],
+                               "kwargs": {}}],
+                  "actions": [{"function": "count", "args": [],
+                               "kwargs": {}}]}]}
+            for k in range(rules)]
+    return dict((url, tfas) for url in urls)
+
+
+class TimedDownloader(BaseDownloader):
+    """
+    Wraps a downloader and measures the time spent waiting for it, which
+    is the time the crawler is limited by the downloads.
+
+    :param downloader: The wrapped downloader.
+    """
+
+    __slots__ = ["_downloader", "wait", "pages"]
+
+    def __init__(self: TimedDownloader, downloader: BaseDownloader) -> None:
+        self._downloader = downloader
+        self.wait = 0.0
+        self.pages = 0
+
+    def init_download(self: TimedDownloader, urls: Iterable[str], *args: Any,
+                      **kwargs: Any) -> None:
+        start = perf_counter()
+        self._downloader.init_download(urls, *args, **kwargs)
+        self.wait += perf_counter() - start
+
+    def __iter__(self: TimedDownloader) -> Iterator[Any]:
+        return self
+
+    def __next__(self: TimedDownloader) -> Any:
+        start = perf_counter()
+        try:
+            future = next(self._downloader)
+        finally:
+            self.wait += perf_counter() - start
+        self.pages += 1
+        return future
+
+    def __enter__(self: TimedDownloader) -> TimedDownloader:
+        self._downloader.__enter__()
+        return self
+
+    def __exit__(self: TimedDownloader, *args: Any) -> None:
+        self._downloader.__exit__(*args)
+
+
+def run_round(case: dict[str,Any], config_path: str,
+              storage_path: str) -> dict[str,Any]:
+    """
+    Run the crawler once like main.py does. Runs in its own process, so
+    the peak memory usage belongs to this round.
+
+    :param case: The benchmark case.
+    :param config_path: The path of the config.
+    :param storage_path: The path of the storage.
+
+    :return: The round's measurements.
+    """
+
+    handler: BaseHandler = STORAGE_HANDLERS[case["storage"]]
+    metrics = Metrics()
+    set_metrics(metrics)
+    times = {}
+
+    start = perf_counter()
+    storage = handler.load_storage(storage_path)
+    times["load"] = perf_counter() - start
+
+    config_parser = StreamingJSONParser.create_parser(config_path,
+                                                      SELECT_FUNCTIONS,
+                                                      FILTER_FUNCTIONS,
+                                                      ACTION_FUNCTIONS)
+    downloader = TimedDownloader(DOWNLOADERS[case["downloader"]]())
+    crawler = Crawler(config_parser, downloader, storage, Fingerprinter(),
+                      case["workers"])
+    start = perf_counter()
+    crawl(crawler, handler, storage_path, storage_path,
+          {"max_concurrency": case["concurrency"],
+           "scheduler": HostScheduler(case["concurrency"], 0, False)})
+    duration = perf_counter() - start
+    storage.close()
+    # Saving is part of processing, the pages are saved while they are
+    # processed
+    times["download"] = downloader.wait
+    times["process"] = duration - downloader.wait
+
+    return {"pages": downloader.pages,
+            "pages_per_s": downloader.pages / duration if duration else 0,
+            "times": times,
+            "stages": dict((stage, values["seconds"]) for stage, values
+                           in metrics.report()["stages"].items()),
+            "actions": _actions,
+            # Kilobytes on Linux
+            "peak_rss_mb": getrusage(RUSAGE_SELF).ru_maxrss / 1024}
+
+
+def run_case(case: dict[str,Any]) -> list[dict[str,Any]]:
+    """
+    Serve generated pages and crawl them in several rounds. The first
+    round downloads every page, the server's revision is increased before
+    every later round, so only the changing pages change.
+
+    :param case: The benchmark case: the number of urls, rules per url,
+                 downloader, storage handler, workers, concurrency,
+                 rounds and the arguments of the page generator and
+                 server.
+
+    :return: The measurements of every round.
+    """
+
+    generator = PageGenerator(case["size"], case["depth"],
+                              case["changed_share"], case["error_share"])
+    results = []
+    with BenchmarkServer(generator, case["latency"], case["etag"]) as server, \
+            TemporaryDirectory() as directory:
+        urls = [server.get_url(i) for i in range(case["urls"])]
+        config_path = path.join(directory, "config.json")
+        with open(config_path, "w") as file:
+            dump(generate_config(urls, case["rules"]), file)
+        storage_path = path.join(directory, f"storage.{case['storage']}")
+        if case["storage"] == "json":
+            with open(storage_path, "w") as file:
+                file.write("{}")
+
+        for i in range(case["rounds"]):
+            if i:
+                server.revision += 1
+            # Every round gets a fresh process like every run of main.py
+            with ProcessPoolExecutor(
+                    max_workers=1, mp_context=get_context("spawn")) as pool:
+                results.append(pool.submit(run_round, case,
+                                           config_path, storage_path).result())
+    return results
@@ -0,0 +1,254 @@
+from __future__ import annotations
+
+from hashlib import sha256
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from random import Random
+from threading import Thread
+from time import sleep
+from typing import Any, Optional
+
+
+class _HTTPServer(ThreadingHTTPServer):
+    """
+    Threading HTTP server accepting many connections at once.
+    """
+
+    daemon_threads = True
+    # Crawlers open many connections at the same time
+    request_queue_size = 1024
+
+
+class PageGenerator:
+    """
+    Generates the pages served by the benchmark server. Every page is
+    identified by its index and changes with the server's revision if it
+    is one of the changing pages. The same arguments always generate the
+    same pages.
+
+    :param size: The approximate size of every page in bytes.
+    :param depth: The number of nested divs around the page's content.
+    :param changed_share: The share of pages that change with every
+                          revision.
+    :param error_share: The share of pages answered with an error status.
+    :param seed: Seed choosing the changing and failing pages.
+    """
+
+    __slots__ = ["_head", "_tail", "_changed_share", "_error_share",
+                 "_seed"]
+
+    def __init__(self: PageGenerator, size: int = 16384, depth: int = 8,
+                 changed_share: float = 0.1, error_share: float = 0,
+                 seed: int = 0) -> None:
+        assert size > 0, "The page size has to be positive"
+        assert depth >= 0, "The depth can't be negative"
+        assert 0 <= changed_share <= 1, "The changed share has to be a share"
+        assert 0 <= error_share <= 1, "The error share has to be a share"
+
+        self._changed_share = changed_share
+        self._error_share = error_share
+        self._seed = seed
+        # The filler is shared by all pages, only the ids and revisions
+        # differ
+        items = []
+        length = 0
+        while length < size:
+            item = (f'<li class="item"><a href="/item/{len(items)}">Item '
+                    f'{len(items)}</a> <span>filler text</span></li>')
+            items.append(item)
+            length += len(item)
+        self._head = ("<!DOCTYPE html><html><head><meta charset=\"utf-8\">"
+                      "<title>Benchmark page</title></head><body>"
+                      + "<div class=\"level\">" * depth
+                      + "<div id=\"content\">")
+        self._tail = ("<ul class=\"items\">" + "".join(items) + "</ul></div>"
+                      + "</div>" * depth + "</body></html>")
+
+    def _share(self: PageGenerator, i: int, salt: str) -> float:
+        """
+        Return a pseudo random number of a page.
+
+        :param i: The page's index.
+        :param salt: Distinguishes the numbers of different properties.
+
+        :return: A number between 0 and 1.
+        """
+
+        return Random(f"{self._seed}/{salt}/{i}").random()
+
+    def is_changing(self: PageGenerator, i: int) -> bool:
+        """
+        Return whether a page changes with every revision.
+
+        :param i: The page's index.
+
+        :return: True if the page changes.
+        """
+
+        return self._share(i, "changed") < self._changed_share
+
+    def get_status(self: PageGenerator, i: int) -> int:
+        """
+        Return the status code of a page.
+
+        :param i: The page's index.
+
+        :return: The status code.
+        """
+
+        share = self._share(i, "error")
+        if share >= self._error_share:
+            return 200
+        return 404 if share < self._error_share / 2 else 500
+
+    def get_page(self: PageGenerator, i: int, revision: int) -> bytes:
+        """
+        Return the content of a page.
+
+        :param i: The page's index.
+        :param revision: The server's revision.
+
+        :return: The page's content.
+        """
+
+        page_revision = revision if self.is_changing(i) else 0
+        return (f"{self._head}<h1 class=\"title\">Page {i}</h1>"
+                f"<p class=\"revision\">Revision {page_revision}</p>"
+                f"{self._tail}").encode()
+
+
+class BenchmarkServer:
+    """
+    Local HTTP server serving generated pages under /page/<index> from a
+    background thread. Responses can be delayed and carry an ETag, which
+    is answered with 304 Not Modified if it still matches.
+
+    :param generator: The generator of the pages.
+    :param latency: Seconds every response is delayed by.
+    :param etag: Whether responses have an ETag.
+    """
+
+    __slots__ = ["_generator", "_latency", "_etag", "_server", "_thread",
+                 "revision"]
+
+    def __init__(self: BenchmarkServer, generator: PageGenerator,
+                 latency: float = 0, etag: bool = True) -> None:
+        assert latency >= 0, "The latency can't be negative"
+
+        self._generator = generator
+        self._latency = latency
+        self._etag = etag
+        self._server: Optional[ThreadingHTTPServer] = None
+        self._thread: Optional[Thread] = None
+        # Changing pages change whenever the revision is increased
+        self.revision = 0
+
+    def start(self: BenchmarkServer) -> None:
+        """
+        Start serving on a free port of the loopback interface.
+        """
+
+        server = self
+        class Handler(BaseHTTPRequestHandler):
+            # Connections are kept alive like by real servers
+            protocol_version = "HTTP/1.1"
+
+            def do_GET(self: Handler) -> None:
+                server.handle(self)
+
+            def log_message(self: Handler, *args: Any) -> None:
+                pass
+
+        self._server = _HTTPServer(("127.0.0.1", 0), Handler)
+        self._thread = Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+
+    def handle(self: BenchmarkServer,
+               request: BaseHTTPRequestHandler) -> None:
+        """
+        Answer a request for a page.
+
+        :param request: The request's handler.
+        """
+
+        if self._latency:
+            sleep(self._latency)
+        parts = request.path.split("/")
+        if len(parts) != 3 or parts[1] != "page" or not parts[2].isdigit():
+            BenchmarkServer.respond(request, 404, b"")
+            return
+
+        i = int(parts[2])
+        status = self._generator.get_status(i)
+        if status != 200:
+            BenchmarkServer.respond(request, status, b"")
+            return
+        content = self._generator.get_page(i, self.revision)
+        headers = {"Content-Type": "text/html; charset=utf-8"}
+        if self._etag:
+            headers["ETag"] = f'"{sha256(content).hexdigest()[:16]}"'
+            if request.headers.get("If-None-Match", None) == headers["ETag"]:
+                BenchmarkServer.respond(request, 304, b"", headers)
+                return
+        BenchmarkServer.respond(request, 200, content, headers)
+
+    @staticmethod
+    def respond(request: BaseHTTPRequestHandler, status: int, content: bytes,
+                headers: dict[str,str] = {}) -> None:
+        """
+        Send a response.
+
+        :param request: The request's handler.
+        :param status: The response's status code.
+        :param content: The response's body.
+        :param headers: Additional response headers.
+        """
+
+        request.send_response(status)
+        for name, value in headers.items():
+            request.send_header(name, value)
+        if status != 304:
+            request.send_header("Content-Length", str(len(content)))
+        request.end_headers()
+        request.wfile.write(content)
+
+    def get_url(self: BenchmarkServer, i: int) -> str:
+        """
+        Return the url of a page.
+
+        :param i: The page's index.
+
+        :return: The url.
+        """
+
+        assert self._server is not None, "The server was not started"
+
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}/page/{i}"
+
+    def close(self: BenchmarkServer) -> None:
+        """
+        Stop serving.
+        """
+
+        if self._server is None:
+            return
+
+        self._server.shutdown()
+        self._server.server_close()
+        self._thread.join()
+        self._server = None
+
+    def __enter__(self: BenchmarkServer) -> BenchmarkServer:
+        """
+        Enable use in contexts.
+        """
+
+        self.start()
+        return self
+
+    def __exit__(self: BenchmarkServer, *args: Any) -> None:
+        """
+        Enable use in contexts.
+        """
+
+        self.close()
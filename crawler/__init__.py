@@ -1,4 +1,8 @@
 from .crawler import Crawler
+from .fingerprint import Fingerprinter
+from .metrics import Metrics, get_metrics, set_metrics
+from .profiler import PageProfiler
+from .watcher import Watcher
 from . import config_parser
 from . import default_functions
 from . import pages_downloader
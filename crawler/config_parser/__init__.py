@@ -1,4 +1,6 @@
 from .parsed_types import (FiltersActions, TagFiltersActions, SelectFun,
-                           FilterFun, ActionFun)
+                           FilterFun, ActionFun, Config)
 from .base_parser import BaseParser
 from .json_parser import JSONParser
+from .streaming_json_parser import StreamingJSONParser
+from .shard_parser import ShardParser, get_shard
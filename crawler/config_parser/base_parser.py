@@ -1,6 +1,7 @@
 from __future__ import annotations
 
 from abc import ABC, abstractmethod
+from typing import Iterable
 
 from .parsed_types import SelectFun, FilterFun, ActionFun, Config
 
@@ -25,13 +26,14 @@ class BaseParser(ABC):
         raise NotImplementedError()
 
     @abstractmethod
-    def get_urls(self: BaseParser) -> list[str]:
+    def get_urls(self: BaseParser) -> Iterable[str]:
         """
-        Return urls from config as list.
-        For performance reasons, this function should return the list of
-        urls even before before the config is parsed completely.
+        Return urls from config as iterable.
+        For performance reasons, this function should return the urls even
+        before before the config is parsed completely. The iterable may
+        yield the urls while the config is still being read.
 
-        :return: The list of urls in the config.
+        :return: The iterable of urls in the config.
         """
 
         raise NotImplementedError()
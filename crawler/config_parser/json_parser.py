@@ -1,8 +1,9 @@
 from __future__ import annotations
 
-from typing import Callable, Any, Type
+from typing import Callable, Any, Optional, Type
 from concurrent.futures import ThreadPoolExecutor
-from json import load
+from hashlib import sha256
+from json import dumps, load
 from requests.utils import requote_uri
 from bs4 import Tag
 
@@ -11,11 +12,36 @@ from .parsed_types import (SelectFun, FilterFun, ActionFun,
                            FiltersActions, TagFiltersActions, Config)
 from .json_types import JsonConf, JsonConfFA, JsonConfTFA, JsonConfFun
 from .json_errors import JSONErrors
+from .lxml_select import compile_lxml_select
+from .parse_only import get_parse_only
+from .select_trie import SelectNode
+
+
+class PreparedFun:
+    """
+    Single arg function calling a base function with prepared arguments.
+    The arguments stay accessible, so functions like the regex filters
+    can be evaluated together.
+
+    :param base_fun: The base function.
+    :param args: The prepared variable arguments.
+    :param kwargs: The prepared keyword arguments.
+    """
+
+    __slots__ = ["base_fun", "args", "kwargs"]
+
+    def __init__(self: PreparedFun, base_fun: Callable, args: tuple,
+                 kwargs: dict[str,Any]) -> None:
+        self.base_fun = base_fun
+        self.args = args
+        self.kwargs = kwargs
+
+    def __call__(self: PreparedFun, x: Any) -> Any:
+        return self.base_fun(x, *self.args, **self.kwargs)
 
 
 # TODO Strings in different file
 # TODO Mix selects and filters to allow filter on tags other than the final tag
-# TODO Maybe add option to load config in background?
 
 
 class JSONParser(BaseParser):
@@ -32,7 +58,8 @@ class JSONParser(BaseParser):
     """
 
     __slots__ = ["_json_config", "_select_funs", "_filter_funs",
-                 "_action_funs", "_executor", "_parsed_config_future"]
+                 "_action_funs", "_prepared_funs", "_executor",
+                 "_parsed_config_future"]
 
     def __init__(self: JSONParser, json_config: JsonConf,
                  select_funs: dict[str,SelectFun],
@@ -42,17 +69,37 @@ class JSONParser(BaseParser):
         if (errors := JSONParser.check_json_config(json_config)):
             raise ValueError("\n".join(errors))
 
-        # Save values needed for config parsing and returning values needed
-        # in rest of program
         self._json_config = JSONParser.merge_duplicate_urls(json_config)
+        self._init_parsing(select_funs, filter_funs, action_funs)
+        # Start parsing config in background
+        self._parsed_config_future = self._executor.submit(self.parse_config)
+
+    def _init_parsing(self: JSONParser, select_funs: dict[str,SelectFun],
+                      filter_funs: dict[str,FilterFun],
+                      action_funs: dict[str,ActionFun],
+                      max_workers: Optional[int] = None) -> None:
+        """
+        Save the values needed for parsing the config and create the
+        executor parsing it in the background. Shared by all subclasses.
+
+        :param select_funs: Dictionary mapping select function names to the
+                            respective functions.
+        :param filter_funs: Dictionary mapping filter function names to the
+                            respective functions.
+        :param action_funs: Dictionary mapping action function names to the
+                            respective functions.
+        :param max_workers: The number of threads parsing the config or
+                            None for the default.
+        """
+
         self._select_funs = select_funs
         self._filter_funs = filter_funs
         self._action_funs = action_funs
-
+        # Prepared functions by base function and arguments, shared by
+        # identical function specifications across the config
+        self._prepared_funs: dict[tuple[Callable,str],PreparedFun] = {}
         # ThreadPoolExecutor used to parse config in background
-        self._executor = ThreadPoolExecutor()
-        # Start parsing config in background
-        self._parsed_config_future = self._executor.submit(self.parse_config)
+        self._executor = ThreadPoolExecutor(max_workers=max_workers)
 
     def parse_config(self: JSONParser) -> None:
         """
@@ -63,11 +110,16 @@ class JSONParser(BaseParser):
 
         parsed_config: JsonConf = {}
         for url,tfa_list in self._json_config.items():
+            # The select chains of a url share their common prefixes
+            select_trie = SelectNode()
             # Parse each select-filter-action triple for url
             parsed_config[url] = [JSONParser.get_tfa(tfa, self._select_funs,
                                                      self._filter_funs,
-                                                     self._action_funs)
-                                  for tfa in tfa_list]
+                                                     self._action_funs,
+                                                     select_trie,
+                                                     f"toplevel -> {url} -> {i}",
+                                                     self._prepared_funs)
+                                  for i,tfa in enumerate(tfa_list)]
         return parsed_config
 
     def get_urls(self: JSONParser) -> list[str]:
@@ -155,7 +207,7 @@ class JSONParser(BaseParser):
                 if isinstance(fa[k], list):
                     for i,f in enumerate(fa[k]):
                         errors += JSONParser.check_json_fun(f,
-                                f"{path} -> [k] -> {i}")
+                                f"{path} -> {k} -> {i}")
                 else:
                     errors.append(
                             f"{path} -> {k}: {JSONErrors.NO_LIST.value}")
@@ -308,30 +360,58 @@ class JSONParser(BaseParser):
         :return: Prepared function that takes single argument.
         """
 
-        # TODO Add Cache
-        # Avoid mistake from last time: List and dict are not hashable
-        return (lambda x: base_fun(x, *args, **kwargs))
+        # Arguments are prepared once instead of in every call
+        if hasattr(base_fun, "prepare"):
+            args, kwargs = base_fun.prepare(*args, **kwargs)
+        return PreparedFun(base_fun, args, kwargs)
 
     @staticmethod
     def parse_funs(fun_specs: list[JsonConfFunType],
-                   fun_dict: dict[str,Callable]) -> list[Callable[[Any],Any]]:
+                   fun_dict: dict[str,Callable],
+                   prepared_funs: dict[tuple[Callable,str],PreparedFun] = None
+                  ) -> list[Callable[[Any],Any]]:
         """
         Parse and return functions specified in json config.
 
         :param fun_specs: List of function specifications from json config.
         :param fun_dict: Dictionary mapping function names used in
                          fun_specs to the respective functions.
+        :param prepared_funs: Dictionary mapping base functions and
+                              arguments to prepared functions, shared by
+                              the whole config. Identical specifications
+                              share one function. None to not share them.
 
         :return: The list of parsed functions.
         """
 
-        return [JSONParser.create_single_arg_fun(fun_dict[fun_spec["function"]],
-            *fun_spec["args"], **fun_spec["kwargs"])
-            for fun_spec in fun_specs]
+        if prepared_funs is None:
+            prepared_funs = {}
+        funs = []
+        for fun_spec in fun_specs:
+            base_fun = fun_dict[fun_spec["function"]]
+            # Avoid mistake from last time: List and dict are not hashable
+            try:
+                key = (base_fun, dumps([fun_spec["args"], fun_spec["kwargs"]],
+                                       sort_keys=True))
+            except TypeError:
+                key = None
+            if key is not None and key in prepared_funs:
+                funs.append(prepared_funs[key])
+                continue
+
+            fun = JSONParser.create_single_arg_fun(base_fun, *fun_spec["args"],
+                                                   **fun_spec["kwargs"])
+            if key is not None:
+                prepared_funs[key] = fun
+            funs.append(fun)
+        return funs
 
     @staticmethod
     def get_fa(config_entry: JsonConfFA, filter_funs: dict[str,FilterFun],
-               action_funs: dict[str,ActionFun]) -> FiltersActions:
+               action_funs: dict[str,ActionFun],
+               path: str = "toplevel",
+               prepared_funs: dict[tuple[Callable,str],PreparedFun] = None
+              ) -> FiltersActions:
         """
         Parse and return a filter-action pair from a config entry.
 
@@ -340,28 +420,41 @@ class JSONParser(BaseParser):
                             respective functions.
         :param action_funs: Dictionary mapping action function names to the
                             respective functions.
+        :param path: The pair's path in the config.
+        :param prepared_funs: The prepared functions shared by the config
+                              (see parse_funs).
 
         :return: The filter-action pair.
         """
 
         try:
             filters = JSONParser.parse_funs(config_entry["filters"],
-                                            filter_funs)
+                                            filter_funs, prepared_funs)
         except KeyError as e:
             raise ValueError(f"{e.args[0]}: {JSONErrors.INV_FUN} in filter functions")
         try:
             actions = JSONParser.parse_funs(config_entry["actions"],
-                                            action_funs)
+                                            action_funs, prepared_funs)
         except KeyError as e:
             raise ValueError(f"{e.args[0]}: {JSONErrors.INV_FUN} in action functions")
 
-        return FiltersActions(filters=filters, actions=actions)
+        return FiltersActions(filters=filters, actions=actions, path=path,
+                              filter_paths=JSONParser.get_fun_paths(
+                                      config_entry["filters"],
+                                      f"{path} -> filters"),
+                              action_paths=JSONParser.get_fun_paths(
+                                      config_entry["actions"],
+                                      f"{path} -> actions"))
 
     @staticmethod
     def get_tfa(config_entry: JsonConfTFA,
                 select_funs: dict[str,SelectFun],
                 filter_funs: dict[str,FilterFun],
-                action_funs: dict[str,ActionFun]) -> TagFiltersActions:
+                action_funs: dict[str,ActionFun],
+                select_trie: SelectNode = None,
+                path: str = "toplevel",
+                prepared_funs: dict[tuple[Callable,str],PreparedFun] = None
+               ) -> TagFiltersActions:
         """
         Parse and return a tag-filter-action triple from a config entry.
 
@@ -372,16 +465,67 @@ class JSONParser(BaseParser):
                             respective functions.
         :param action_funs: Dictionary mapping action function names to the
                             respective functions.
+        :param select_trie: The root of the trie the select chain is added
+                            to, shared by all rules of the same url.
+        :param path: The triple's path in the config, like the paths of
+                     check_json_config.
+        :param prepared_funs: The prepared functions shared by the config
+                              (see parse_funs).
 
         :return: The tag-filter-action triple.
         """
 
         try:
             selects = JSONParser.parse_funs(config_entry["select-chain"],
-                                            select_funs)
+                                            select_funs, prepared_funs)
         except KeyError as e:
             raise ValueError(f"{e.args[0]}: {JSONErrors.INV_FUN} in select functions")
-        filters_actions = [JSONParser.get_fa(ce, filter_funs, action_funs)
-                           for ce in config_entry["filters-actions-pairs"]]
-        return TagFiltersActions(select=selects,
-                                 filters_actions=filters_actions)
+        select_path = (select_trie or SelectNode()).add_chain(
+                config_entry["select-chain"], selects, select_funs)
+        filters_actions = [JSONParser.get_fa(
+                                   ce, filter_funs, action_funs,
+                                   f"{path} -> filters-actions-pairs -> {i}",
+                                   prepared_funs)
+                           for i,ce in enumerate(
+                                   config_entry["filters-actions-pairs"])]
+        return TagFiltersActions(select=[node.fun for node in select_path],
+                                 select_path=select_path,
+                                 lxml_select=compile_lxml_select(
+                                         config_entry["select-chain"],
+                                         select_funs),
+                                 parse_only=get_parse_only(
+                                         config_entry["select-chain"],
+                                         select_funs),
+                                 filters_actions=filters_actions,
+                                 key=JSONParser.get_select_key(
+                                         config_entry["select-chain"]),
+                                 path=path,
+                                 select_paths=JSONParser.get_fun_paths(
+                                         config_entry["select-chain"],
+                                         f"{path} -> select-chain"))
+
+    @staticmethod
+    def get_fun_paths(fun_specs: list[JsonConfFun], path: str) -> list[str]:
+        """
+        Return the paths of function specifications in the config.
+
+        :param fun_specs: The function specifications.
+        :param path: The path of the list of specifications.
+
+        :return: The paths of the specifications.
+        """
+
+        return [f"{path} -> {i}" for i in range(len(fun_specs))]
+
+    @staticmethod
+    def get_select_key(fun_specs: list[JsonConfFun]) -> str:
+        """
+        Return a stable identity of a select chain, which stays the same
+        across runs as long as the chain's specification doesn't change.
+
+        :param fun_specs: The select chain's function specifications.
+
+        :return: The select chain's key.
+        """
+
+        return sha256(dumps(fun_specs, sort_keys=True).encode()).hexdigest()
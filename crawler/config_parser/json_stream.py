@@ -0,0 +1,125 @@
+from __future__ import annotations
+
+from json import JSONDecoder, JSONDecodeError
+from re import compile
+from typing import Any, Iterator, TextIO
+
+
+WHITESPACE = compile(r"[ \t\n\r]*")
+
+
+class JSONObjectStream:
+    """
+    Reads the entries of a json file's top-level object one by one, so
+    the entries can be processed before the whole file is read. Only the
+    entry being decoded is kept in memory.
+
+    :param file: The json file.
+    :param chunk_size: The minimum number of characters read at once.
+    """
+
+    __slots__ = ["_file", "_chunk_size", "_decoder", "_buffer", "_pos",
+                 "_eof"]
+
+    def __init__(self: JSONObjectStream, file: TextIO,
+                 chunk_size: int = 1 << 16) -> None:
+        self._file = file
+        self._chunk_size = chunk_size
+        self._decoder = JSONDecoder()
+        self._buffer = ""
+        self._pos = 0
+        self._eof = False
+
+    def _read_more(self: JSONObjectStream) -> bool:
+        """
+        Append the next chunk of the file to the buffer. The chunks grow
+        with the current entry, so decoding large entries stays linear.
+
+        :return: False if the end of the file was reached.
+        """
+
+        # Drop everything that was already decoded
+        self._buffer = self._buffer[self._pos:]
+        self._pos = 0
+        chunk = self._file.read(max(self._chunk_size, len(self._buffer)))
+        if not chunk:
+            self._eof = True
+            return False
+        self._buffer += chunk
+        return True
+
+    def _next_char(self: JSONObjectStream) -> str:
+        """
+        Skip whitespace and return the next character without consuming it.
+
+        :return: The next character or an empty string at the end of the
+                 file.
+        """
+
+        while True:
+            self._pos = WHITESPACE.match(self._buffer, self._pos).end()
+            if self._pos < len(self._buffer):
+                return self._buffer[self._pos]
+            if not self._read_more():
+                return ""
+
+    def _expect(self: JSONObjectStream, chars: str) -> str:
+        """
+        Consume the next character, which has to be one of chars.
+
+        :param chars: The allowed characters.
+
+        :return: The consumed character.
+        """
+
+        char = self._next_char()
+        if not char or char not in chars:
+            raise JSONDecodeError(f"Expecting one of {chars!r}", self._buffer,
+                                  self._pos)
+        self._pos += 1
+        return char
+
+    def _decode(self: JSONObjectStream) -> Any:
+        """
+        Decode the next json value, reading more of the file until the
+        value is complete.
+
+        :return: The decoded value.
+        """
+
+        self._next_char()
+        while True:
+            try:
+                value, end = self._decoder.raw_decode(self._buffer, self._pos)
+            except JSONDecodeError:
+                if self._read_more():
+                    continue
+                raise
+            # Numbers might continue in the next chunk
+            if end == len(self._buffer) and self._read_more():
+                continue
+            self._pos = end
+            return value
+
+    def __iter__(self: JSONObjectStream) -> Iterator[tuple[str,Any]]:
+        """
+        Enable conversion to iterator. Yields the top-level object's keys
+        and values in the order they appear in the file.
+        """
+
+        self._expect("{")
+        if self._next_char() == "}":
+            self._pos += 1
+        else:
+            while True:
+                key = self._decode()
+                if not isinstance(key, str):
+                    raise JSONDecodeError("Expecting property name",
+                                          self._buffer, self._pos)
+                self._expect(":")
+                yield key, self._decode()
+                if self._expect(",}") == "}":
+                    break
+
+        if self._next_char():
+            raise JSONDecodeError("Extra data", self._buffer, self._pos)
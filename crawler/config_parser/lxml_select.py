@@ -0,0 +1,425 @@
+from __future__ import annotations
+
+from inspect import signature
+from re import compile
+from typing import Any, Callable, Optional
+from bs4 import BeautifulSoup, Tag
+from bs4.builder import HTMLTreeBuilder
+from lxml.etree import XPath, XPathSyntaxError, _Element
+from lxml.html import tostring
+
+from ..default_functions import getitem
+from .json_types import JsonConfFun
+from .parsed_types import SelectFun
+
+# cssselect is optional, select is run by BeautifulSoup without it
+try:
+    from cssselect import GenericTranslator, SelectorError
+except ImportError:
+    GenericTranslator = None
+
+
+# Tag and attribute names that can be used in XPath expressions
+NAME = compile(r"[A-Za-z_][\w.-]*")
+# Attributes BeautifulSoup splits into lists of values, by tag name
+MULTI_VALUED = HTMLTreeBuilder.DEFAULT_CDATA_LIST_ATTRIBUTES
+# Parameters of the search functions
+FIND_PARAMETERS = list(signature(Tag.find).parameters)[1:-1]
+FIND_ALL_PARAMETERS = list(signature(Tag.find_all).parameters)[1:-1]
+SELECT_PARAMETERS = list(signature(Tag.select).parameters)[1:-1]
+
+
+class Untranslatable(Exception):
+    """
+    Raised if a select chain can't be run by lxml.
+    """
+
+
+class _Document:
+    """
+    The document a select chain starts at. Unlike BeautifulSoup, lxml has
+    no element above the html element, so searches starting at the
+    document include the root element itself.
+
+    :param root: The document's root element.
+    """
+
+    __slots__ = ["root"]
+
+    def __init__(self: _Document, root: _Element) -> None:
+        self.root = root
+
+
+class LxmlSelect:
+    """
+    A select chain compiled to XPath expressions, which is run on a page
+    parsed by lxml instead of BeautifulSoup. The result is converted to
+    the result BeautifulSoup would return, but the selected tags are
+    detached from the page.
+
+    :param steps: The compiled steps of the chain.
+    :param first_match: Test whether an element is the tag found by the
+                        chain's first step or None if the chain doesn't
+                        start with a recursive find. The chain's result
+                        is complete as soon as the first element passing
+                        the test is parsed completely.
+    """
+
+    __slots__ = ["_steps", "first_match"]
+
+    def __init__(self: LxmlSelect, steps: list[Callable[[Any],Any]],
+                 first_match: Optional[Callable[[_Element],bool]] = None
+                ) -> None:
+        self._steps = steps
+        self.first_match = first_match
+
+    def __call__(self: LxmlSelect, root: _Element) -> Any:
+        """
+        Run the select chain on a page.
+
+        :param root: The root element of the page parsed by lxml.
+
+        :return: The select chain's result.
+        """
+
+        base = _Document(root)
+        for step in self._steps:
+            # Elements without children are falsy in lxml
+            if base is None or (not isinstance(base, (_Document, _Element))
+                                and not base):
+                break
+            base = step(base)
+        return LxmlSelect.to_bs4(base)
+
+    @staticmethod
+    def to_bs4(result: Any) -> Any:
+        """
+        Convert the elements in a result to BeautifulSoup tags. All
+        elements of a list are parsed at once.
+
+        :param result: The result returned by lxml.
+
+        :return: The converted result.
+        """
+
+        if isinstance(result, _Element):
+            return LxmlSelect.to_bs4([result])[0]
+        if isinstance(result, list) and any(isinstance(r, _Element)
+                                            for r in result):
+            # html.parser does not add html and body tags around the tags
+            tags = iter(BeautifulSoup("".join(
+                    tostring(r, encoding="unicode", with_tail=False)
+                    for r in result if isinstance(r, _Element)),
+                    features="html.parser").contents)
+            return [next(tags) if isinstance(r, _Element) else r
+                    for r in result]
+        return result
+
+
+def bind_args(parameters: list[str], args: list[Any],
+              kwargs: dict[str,Any]) -> tuple[dict[str,Any],dict[str,Any]]:
+    """
+    Assign the arguments of a function specification to the function's
+    named parameters.
+
+    :param parameters: The names of the function's parameters.
+    :param args: The specification's arguments.
+    :param kwargs: The specification's keyword arguments.
+
+    :return: The named arguments and the remaining keyword arguments.
+    """
+
+    if len(args) > len(parameters):
+        raise Untranslatable()
+    named = dict(zip(parameters, args))
+    rest = {}
+    for k, v in kwargs.items():
+        if k in named:
+            raise Untranslatable()
+        if k in parameters:
+            named[k] = v
+        else:
+            rest[k] = v
+    return named, rest
+
+
+def get_variable(variables: dict[str,str], value: str) -> str:
+    """
+    Add a string to the variables of an XPath expression, so it doesn't
+    have to be quoted.
+
+    :param variables: The expression's variables.
+    :param value: The string.
+
+    :return: The variable's reference.
+    """
+
+    name = f"v{len(variables)}"
+    variables[name] = value
+    return f"${name}"
+
+
+def get_attr_predicate(tag_name: Optional[str], attr: str, value: Any,
+                       variables: dict[str,str]) -> str:
+    """
+    Translate an attribute filter of find or find_all to an XPath
+    predicate.
+
+    :param tag_name: The searched tag name or None if it is not a single
+                     name.
+    :param attr: The attribute's name.
+    :param value: The value the attribute has to match.
+    :param variables: The expression's variables.
+
+    :return: The predicate.
+    """
+
+    if not NAME.fullmatch(attr):
+        raise Untranslatable()
+    if value is True:
+        return f"[@{attr}]"
+    if not isinstance(value, str):
+        raise Untranslatable()
+
+    multi_valued = attr in MULTI_VALUED["*"]
+    if any(attr in attrs for name, attrs in MULTI_VALUED.items()
+           if name != "*"):
+        if tag_name is None:
+            raise Untranslatable()
+        multi_valued = attr in MULTI_VALUED.get(tag_name, ())
+    if not multi_valued:
+        return f"[@{attr}={get_variable(variables, value)}]"
+
+    # BeautifulSoup matches single values and the whole value
+    if not value or value != " ".join(value.split()):
+        raise Untranslatable()
+    ref = get_variable(variables, value)
+    if " " in value:
+        return f"[normalize-space(@{attr})={ref}]"
+    return (f"[normalize-space(@{attr})={ref} or contains(concat(' ', "
+            f"normalize-space(@{attr}), ' '), concat(' ', {ref}, ' '))]")
+
+
+def get_node_test(named: dict[str,Any],
+                  rest: dict[str,Any]) -> tuple[str,str,dict[str,str]]:
+    """
+    Translate the tag name and attribute filters of find or find_all to an
+    XPath node test and predicates.
+
+    :param named: The step's named arguments.
+    :param rest: The step's keyword arguments filtering attributes.
+
+    :return: The node test, the predicates and their variables.
+    """
+
+    name = named.get("name", None)
+    attrs = named.get("attrs", None) or {}
+    if named.get("string", None) is not None or "text" in rest:
+        raise Untranslatable()
+    # A string instead of attributes filters the class
+    if isinstance(attrs, str):
+        attrs = {"class": attrs}
+    if not isinstance(attrs, dict):
+        raise Untranslatable()
+    attrs = {**attrs, **dict(("class" if k == "class_" else k, v)
+                             for k, v in rest.items())}
+
+    if name is None or name is True:
+        names = []
+    elif isinstance(name, str):
+        names = [name]
+    elif isinstance(name, list) and all(isinstance(n, str) for n in name):
+        names = name
+    else:
+        raise Untranslatable()
+    if not all(NAME.fullmatch(n) for n in names):
+        raise Untranslatable()
+
+    if len(names) == 1:
+        node_test = names[0]
+    elif names:
+        node_test = f"*[{' or '.join(f'self::{n}' for n in names)}]"
+    else:
+        node_test = "*"
+    variables: dict[str,str] = {}
+    predicates = "".join(get_attr_predicate(
+            names[0] if len(names) == 1 else None, k, v, variables)
+                         for k, v in attrs.items())
+    return node_test, predicates, variables
+
+
+def compile_search(named: dict[str,Any], rest: dict[str,Any],
+                   first: bool) -> Callable[[Any],Any]:
+    """
+    Compile a find or find_all step.
+
+    :param named: The step's named arguments.
+    :param rest: The step's keyword arguments filtering attributes.
+    :param first: Whether only the first matching tag is returned.
+
+    :return: The compiled step.
+    """
+
+    node_test, predicates, variables = get_node_test(named, rest)
+    limit = None if first else named.get("limit", None)
+    if limit is not None and not isinstance(limit, int):
+        raise Untranslatable()
+
+    recursive = named.get("recursive", True)
+    axes = (("descendant", "descendant-or-self") if recursive
+            else ("child", "self"))
+    xpaths = []
+    for axis in axes:
+        path = f"{axis}::{node_test}{predicates}"
+        xpaths.append(XPath(f"({path})[1]" if first else path))
+    element_xpath, document_xpath = xpaths
+
+    def search(base: Any) -> Any:
+        if isinstance(base, _Document):
+            results = document_xpath(base.root, **variables)
+        elif isinstance(base, _Element):
+            results = element_xpath(base, **variables)
+        else:
+            raise AttributeError(
+                    f"'{type(base).__name__}' object can't be searched")
+        if first:
+            return results[0] if results else None
+        return results[:limit] if limit else results
+
+    return search
+
+
+def compile_match(named: dict[str,Any],
+                  rest: dict[str,Any]) -> Callable[[_Element],bool]:
+    """
+    Compile a test whether a single element is found by a find step. Only
+    the element's name and attributes are tested, so the element can be
+    tested as soon as its start tag was parsed.
+
+    :param named: The step's named arguments.
+    :param rest: The step's keyword arguments filtering attributes.
+
+    :return: The test.
+    """
+
+    node_test, predicates, variables = get_node_test(named, rest)
+    xpath = XPath(f"self::{node_test}{predicates}")
+    return lambda element: bool(xpath(element, **variables))
+
+
+def compile_css(named: dict[str,Any],
+                rest: dict[str,Any]) -> Callable[[Any],Any]:
+    """
+    Compile a select step.
+
+    :param named: The step's named arguments.
+    :param rest: The step's remaining keyword arguments.
+
+    :return: The compiled step.
+    """
+
+    selector = named.get("selector", None)
+    limit = named.get("limit", None)
+    # Pseudo-classes are not supported the same way by cssselect
+    if (GenericTranslator is None or rest or named.get("namespaces", None)
+            or not isinstance(selector, str) or ":" in selector
+            or (limit is not None and not isinstance(limit, int))):
+        raise Untranslatable()
+
+    try:
+        translator = GenericTranslator()
+        element_xpath, document_xpath = [
+                XPath(translator.css_to_xpath(selector, prefix=f"{axis}::"))
+                for axis in ("descendant", "descendant-or-self")]
+    except (SelectorError, XPathSyntaxError):
+        raise Untranslatable()
+
+    def select(base: Any) -> Any:
+        if isinstance(base, _Document):
+            results = document_xpath(base.root)
+        elif isinstance(base, _Element):
+            results = element_xpath(base)
+        else:
+            raise AttributeError(
+                    f"'{type(base).__name__}' object can't be searched")
+        return results[:limit] if limit else results
+
+    return select
+
+
+def compile_getitem(named: dict[str,Any],
+                    rest: dict[str,Any]) -> Callable[[Any],Any]:
+    """
+    Compile a getitem step.
+
+    :param named: The step's named arguments.
+    :param rest: The step's remaining keyword arguments.
+
+    :return: The compiled step.
+    """
+
+    if rest or "item" not in named:
+        raise Untranslatable()
+    item = named["item"]
+
+    def get(base: Any) -> Any:
+        if isinstance(base, _Document):
+            raise KeyError(item)
+        if not isinstance(base, _Element):
+            return base[item]
+        value = base.get(item) if isinstance(item, str) else None
+        if value is None:
+            raise KeyError(item)
+        if (item in MULTI_VALUED["*"]
+                or item in MULTI_VALUED.get(base.tag, ())):
+            return value.split()
+        return value
+
+    return get
+
+
+def compile_lxml_select(fun_specs: list[JsonConfFun],
+                        select_funs: dict[str,SelectFun]
+                       ) -> Optional[LxmlSelect]:
+    """
+    Compile a select chain to run it with lxml. Only chains consisting of
+    the default find, find_all, select and getitem functions with
+    arguments lxml handles the same way as BeautifulSoup are compiled.
+
+    :param fun_specs: The select chain's function specifications.
+    :param select_funs: Dictionary mapping select function names to the
+                        respective functions.
+
+    :return: The compiled chain or None if it has to be run by
+             BeautifulSoup.
+    """
+
+    compilers = {
+        Tag.find: (FIND_PARAMETERS,
+                   lambda named, rest: compile_search(named, rest, True)),
+        Tag.find_all: (FIND_ALL_PARAMETERS,
+                       lambda named, rest: compile_search(named, rest, False)),
+        Tag.select: (SELECT_PARAMETERS, compile_css),
+        getitem: (["item"], compile_getitem)
+    }
+
+    # The whole page is returned by BeautifulSoup anyway
+    if not fun_specs:
+        return None
+    steps = []
+    first_match = None
+    try:
+        for i, fun_spec in enumerate(fun_specs):
+            fun = select_funs.get(fun_spec["function"], None)
+            if fun not in compilers:
+                return None
+            parameters, compile_step = compilers[fun]
+            named, rest = bind_args(parameters, fun_spec["args"],
+                                    fun_spec["kwargs"])
+            steps.append(compile_step(named, rest))
+            # The later steps only look at the found tag and its ancestors
+            if i == 0 and fun is Tag.find and named.get("recursive", True):
+                first_match = compile_match(named, rest)
+    except (Untranslatable, XPathSyntaxError, TypeError):
+        return None
+    return LxmlSelect(steps, first_match)
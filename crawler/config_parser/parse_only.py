@@ -0,0 +1,150 @@
+from __future__ import annotations
+
+from re import compile
+from typing import Any, Optional
+from bs4 import SoupStrainer, Tag
+
+from ..default_functions import SELECT_FUNCTIONS
+from .json_types import JsonConfFun
+from .lxml_select import (MULTI_VALUED, FIND_PARAMETERS, FIND_ALL_PARAMETERS,
+                          SELECT_PARAMETERS, Untranslatable, bind_args)
+from .parsed_types import SelectFun, TagFiltersActions
+
+
+# Selectors only made of tag names, ids and classes combined by descendant
+# and child combinators
+SIMPLE_SELECTOR = compile(r"\s*[\w-]*(#[\w-]+)?(\.[\w-]+)*"
+                          r"(\s*>?\s*[\w-]*(#[\w-]+)?(\.[\w-]+)*)*\s*")
+FIRST_COMPOUND = compile(r"\s*([\w-]*)(?:#([\w-]+))?")
+# Select functions which only look at the descendants of their input
+DESCENDANT_FUNCTIONS = [SELECT_FUNCTIONS[f] for f in ["find", "find_all",
+                                                      "children", "[]"]]
+
+# Tags and attributes a rule needs: {"name": list[str], "attrs": dict}
+ParseOnly = dict[str,Any]
+
+
+def get_find_parse_only(named: dict[str,Any],
+                        rest: dict[str,Any]) -> ParseOnly:
+    """
+    Return the tags a find or find_all step starting at the page needs.
+
+    :param named: The step's named arguments.
+    :param rest: The step's keyword arguments filtering attributes.
+
+    :return: The needed tags.
+    """
+
+    name = named.get("name", None)
+    attrs = named.get("attrs", None) or {}
+    if not named.get("recursive", True) or not isinstance(attrs, dict):
+        raise Untranslatable()
+
+    if name is None or name is True:
+        names = []
+    elif isinstance(name, str):
+        names = [name]
+    elif isinstance(name, list) and all(isinstance(n, str) for n in name):
+        names = name
+    else:
+        raise Untranslatable()
+
+    # Multi-valued attributes are not split yet while the page is parsed
+    attrs = dict((k, v) for k, v in {**attrs, **rest}.items()
+                 if k not in ("class_", "string", "text", "limit")
+                 and not any(k in a for a in MULTI_VALUED.values())
+                 and (v is True or isinstance(v, str)))
+    if not names and not attrs:
+        raise Untranslatable()
+    return {"name": names, "attrs": attrs}
+
+
+def get_select_parse_only(named: dict[str,Any],
+                          rest: dict[str,Any]) -> ParseOnly:
+    """
+    Return the tags a select step starting at the page needs. The tags
+    matching the selector's first compound selector contain all tags the
+    selector can match.
+
+    :param named: The step's named arguments.
+    :param rest: The step's remaining keyword arguments.
+
+    :return: The needed tags.
+    """
+
+    selector = named.get("selector", None)
+    if (rest or named.get("namespaces", None) or not isinstance(selector, str)
+            or not SIMPLE_SELECTOR.fullmatch(selector)):
+        raise Untranslatable()
+
+    name, id = FIRST_COMPOUND.match(selector).groups()
+    if not name and not id:
+        raise Untranslatable()
+    return {"name": [name.lower()] if name else [],
+            "attrs": {"id": id} if id else {}}
+
+
+def get_parse_only(fun_specs: list[JsonConfFun],
+                   select_funs: dict[str,SelectFun]) -> Optional[ParseOnly]:
+    """
+    Return the tags a select chain can reach. Only chains starting with a
+    search for specific tags whose other steps only look at the
+    descendants of the found tags can be restricted.
+
+    :param fun_specs: The select chain's function specifications.
+    :param select_funs: Dictionary mapping select function names to the
+                        respective functions.
+
+    :return: The tags the chain needs or None if it needs the whole page.
+    """
+
+    first_steps = {
+        Tag.find: (FIND_PARAMETERS, get_find_parse_only),
+        Tag.find_all: (FIND_ALL_PARAMETERS, get_find_parse_only),
+        Tag.select: (SELECT_PARAMETERS, get_select_parse_only)
+    }
+
+    if not fun_specs:
+        return None
+    funs = [select_funs.get(fun_spec["function"], None)
+            for fun_spec in fun_specs]
+    if (funs[0] not in first_steps
+            or any(f not in DESCENDANT_FUNCTIONS for f in funs[1:])):
+        return None
+
+    parameters, get_first_parse_only = first_steps[funs[0]]
+    try:
+        return get_first_parse_only(*bind_args(parameters,
+                                               fun_specs[0]["args"],
+                                               fun_specs[0]["kwargs"]))
+    except (Untranslatable, TypeError):
+        return None
+
+
+def get_strainer(tfas: list[TagFiltersActions]) -> Optional[SoupStrainer]:
+    """
+    Return a strainer parsing only the tags all rules of a page can reach.
+    Rules with different attribute filters are merged by their tag names.
+
+    :param tfas: The rules for the page.
+
+    :return: The strainer or None if the whole page has to be parsed.
+    """
+
+    parse_onlys = [tfa.parse_only for tfa in tfas]
+    if not parse_onlys or None in parse_onlys:
+        return None
+
+    attrs = parse_onlys[0]["attrs"]
+    if any(p["attrs"] != attrs for p in parse_onlys):
+        attrs = {}
+    names = []
+    for p in parse_onlys:
+        # Any tag can be reached
+        if not p["name"]:
+            names = None
+            break
+        names += [n for n in p["name"] if n not in names]
+    if not names and not attrs:
+        return None
+    return SoupStrainer(names or None, attrs)
@@ -1,4 +1,4 @@
-from typing import NamedTuple, Callable, Union, Any
+from typing import NamedTuple, Callable, Optional, Union, Any
 from bs4 import Tag
 
 
@@ -10,14 +10,29 @@ FiltersActions = NamedTuple( # TODO Find better name
     "FiltersActions",
     [
         ("filters", list[FilterFun]),
-        ("actions", list[ActionFun])
+        ("actions", list[ActionFun]),
+        # Paths of the pair and its functions in the config
+        ("path", str),
+        ("filter_paths", list[str]),
+        ("action_paths", list[str])
     ]
 )
 TagFiltersActions = NamedTuple( # TODO Find better name
     "TagFiltersActions",
     [
         ("select", list[SelectFun]),
-        ("filters_actions", list[FiltersActions])
+        # Nodes of the select chain's steps in the url's trie of chains
+        ("select_path", list[Any]),
+        # The select chain compiled for lxml or None if it can't be compiled
+        ("lxml_select", Optional[Callable[[Any],Any]]),
+        # The tags the select chain can reach or None if it needs the page
+        ("parse_only", Optional[dict[str,Any]]),
+        ("filters_actions", list[FiltersActions]),
+        # Stable identity of the select chain
+        ("key", str),
+        # Paths of the rule and its select steps in the config
+        ("path", str),
+        ("select_paths", list[str])
     ]
 )
 
@@ -0,0 +1,66 @@
+from __future__ import annotations
+
+from json import dumps
+from typing import Optional
+
+from .json_types import JsonConfFun
+from .parsed_types import SelectFun
+
+
+class SelectNode:
+    """
+    Node of a prefix trie of the select chains of a url's rules. Every
+    node is a step shared by all chains starting with the steps on the
+    path to it, so the result of the step only has to be computed once
+    per page.
+
+    :param fun: The step's select function or None for the root.
+    """
+
+    __slots__ = ["fun", "_children"]
+
+    def __init__(self: SelectNode, fun: Optional[SelectFun] = None) -> None:
+        self.fun = fun
+        self._children: dict[tuple[SelectFun,str],SelectNode] = {}
+
+    def add_chain(self: SelectNode, fun_specs: list[JsonConfFun],
+                  funs: list[SelectFun],
+                  select_funs: dict[str,SelectFun]) -> list[SelectNode]:
+        """
+        Add a select chain below this node. Steps calling the same function
+        with the same arguments are shared with the chains added before.
+
+        :param fun_specs: The select chain's function specifications.
+        :param funs: The select chain's parsed functions.
+        :param select_funs: Dictionary mapping select function names to the
+                            respective functions.
+
+        :return: The nodes of the chain's steps.
+        """
+
+        path = []
+        node = self
+        for fun_spec, fun in zip(fun_specs, funs):
+            key = SelectNode.get_step_key(fun_spec, select_funs)
+            if key not in node._children:
+                node._children[key] = SelectNode(fun)
+            node = node._children[key]
+            path.append(node)
+        return path
+
+    @staticmethod
+    def get_step_key(fun_spec: JsonConfFun,
+                     select_funs: dict[str,SelectFun]) -> tuple[SelectFun,str]:
+        """
+        Return the normalized specification of a step. Different names of
+        the same function result in the same key.
+
+        :param fun_spec: The step's function specification.
+        :param select_funs: Dictionary mapping select function names to the
+                            respective functions.
+
+        :return: The step's key.
+        """
+
+        return (select_funs[fun_spec["function"]],
+                dumps([fun_spec["args"], fun_spec["kwargs"]], sort_keys=True))
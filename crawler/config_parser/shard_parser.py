@@ -0,0 +1,118 @@
+from __future__ import annotations
+
+from hashlib import sha256
+from threading import Lock
+from typing import Iterator, Optional
+from urllib.parse import urlsplit
+
+from .base_parser import BaseParser
+from .parsed_types import SelectFun, FilterFun, ActionFun, Config
+from .streaming_json_parser import StreamingJSONParser
+
+
+def get_shard(url: str, shards: int) -> int:
+    """
+    Return the shard of a url. All urls of a host belong to the same
+    shard, so the politeness limits per host hold across the shards. The
+    shard only depends on the host and the number of shards.
+
+    :param url: The url.
+    :param shards: The number of shards.
+
+    :return: The shard's index.
+    """
+
+    assert shards > 0, "The number of shards has to be positive"
+
+    host = (urlsplit(url).hostname or "").encode()
+    return int.from_bytes(sha256(host).digest()[:8], "big") % shards
+
+
+class ShardParser(BaseParser):
+    """
+    Restricts the config of another parser to the urls of one shard. The
+    urls are partitioned by their host, so every host is crawled by one
+    shard only.
+
+    :param parser: The parser of the whole config.
+    :param shard: The shard's index.
+    :param shards: The number of shards.
+    """
+
+    __slots__ = ["_parser", "_shard", "_shards", "_lock", "_parsed_config"]
+
+    def __init__(self: ShardParser, parser: BaseParser, shard: int,
+                 shards: int) -> None:
+        assert 0 <= shard < shards, "The shard has to be one of the shards"
+
+        self._parser = parser
+        self._shard = shard
+        self._shards = shards
+        # The shard's config is only filtered once
+        self._lock = Lock()
+        self._parsed_config: Optional[Config] = None
+
+    def is_in_shard(self: ShardParser, url: str) -> bool:
+        """
+        Return whether a url belongs to the shard.
+
+        :param url: The url.
+
+        :return: True if the url belongs to the shard.
+        """
+
+        return get_shard(url, self._shards) == self._shard
+
+    def get_parsed_config(self: ShardParser) -> Config:
+        """
+        Return the parsed config of the shard's urls.
+
+        :return: The parsed config.
+        """
+
+        with self._lock:
+            if self._parsed_config is None:
+                self._parsed_config = dict(
+                        (url, tfas) for url, tfas
+                        in self._parser.get_parsed_config().items()
+                        if self.is_in_shard(url))
+            return self._parsed_config
+
+    def get_urls(self: ShardParser) -> Iterator[str]:
+        """
+        Return iterator over the shard's urls. The urls are returned as
+        soon as the wrapped parser returns them.
+
+        :return: The iterator over the urls.
+        """
+
+        return (url for url in self._parser.get_urls()
+                if self.is_in_shard(url))
+
+    @staticmethod
+    def create_parser(config_path: str,
+                      select_funs: dict[str,SelectFun],
+                      filter_funs: dict[str,FilterFun],
+                      action_funs: dict[str,ActionFun],
+                      shard: int = 0, shards: int = 1) -> ShardParser:
+        """
+        Factory method to create a parser of a shard of the config in a
+        json config file.
+
+        :param config_path: The config file's path.
+        :param select_funs: Dictionary mapping select function names to the
+                            respective functions.
+        :param filter_funs: Dictionary mapping filter function names to the
+                            respective functions.
+        :param action_funs: Dictionary mapping action function names to the
+                            respective functions.
+        :param shard: The shard's index.
+        :param shards: The number of shards.
+
+        :return: The shard parser created from the given parameters.
+        """
+
+        return ShardParser(StreamingJSONParser.create_parser(
+                                   config_path, select_funs, filter_funs,
+                                   action_funs),
+                           shard, shards)
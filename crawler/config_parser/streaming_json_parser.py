@@ -0,0 +1,151 @@
+from __future__ import annotations
+
+from threading import Condition
+from typing import Iterator, TextIO
+
+from .json_parser import JSONParser
+from .json_stream import JSONObjectStream
+from .select_trie import SelectNode
+from .parsed_types import SelectFun, FilterFun, ActionFun, Config
+
+
+class StreamingJSONParser(JSONParser):
+    """
+    Class for parsing json config file in "default" format while it is
+    read. The urls are available as soon as they are read, so the pages
+    can be downloaded before the whole config is read. Every url's rules
+    are checked and parsed in the background right after they are read.
+    All errors in the config are raised together by get_parsed_config.
+
+    :param config_file: The opened json config file. It is closed after
+                        it was read.
+    :param select_funs: Dictionary mapping select function names to the
+                        respective functions.
+    :param filter_funs: Dictionary mapping filter function names to the
+                        respective functions.
+    :param action_funs: Dictionary mapping action function names to the
+                        respective functions.
+    """
+
+    __slots__ = ["_urls", "_urls_read", "_urls_condition"]
+
+    def __init__(self: StreamingJSONParser, config_file: TextIO,
+                 select_funs: dict[str,SelectFun],
+                 filter_funs: dict[str,FilterFun],
+                 action_funs: dict[str,ActionFun]) -> None:
+
+        # The config is read by a single thread
+        self._init_parsing(select_funs, filter_funs, action_funs, 1)
+
+        # Normalized urls in the order they were read
+        self._urls: list[str] = []
+        self._urls_read = False
+        # Notifies get_urls about new urls
+        self._urls_condition = Condition()
+
+        # Start reading and parsing config in background
+        self._parsed_config_future = self._executor.submit(self.parse_config,
+                                                           config_file)
+
+    def parse_config(self: StreamingJSONParser,
+                     config_file: TextIO) -> Config:
+        """
+        Read, check and parse the config entry by entry and return the
+        result.
+
+        :param config_file: The opened json config file.
+
+        :return: The parsed config.
+        """
+
+        parsed_config: Config = {}
+        # The select chains of a url share their common prefixes
+        select_tries: dict[str,SelectNode] = {}
+        errors = []
+        try:
+            for url,tfa_list in JSONObjectStream(config_file):
+                n_url = JSONParser.normalize_url(url)
+                # Duplicate urls are merged
+                if n_url not in parsed_config:
+                    parsed_config[n_url] = []
+                    select_tries[n_url] = SelectNode()
+                    self._add_url(n_url)
+
+                if (url_errors := JSONParser.check_json_config({url: tfa_list})):
+                    errors += url_errors
+                    continue
+                try:
+                    parsed_config[n_url] += [
+                            JSONParser.get_tfa(tfa, self._select_funs,
+                                               self._filter_funs,
+                                               self._action_funs,
+                                               select_tries[n_url],
+                                               f"toplevel -> {url} -> {i}",
+                                               self._prepared_funs)
+                            for i,tfa in enumerate(tfa_list)]
+                except ValueError as e:
+                    errors.append(f"toplevel -> {url}: {e}")
+        except ValueError as e:
+            errors.append(f"toplevel: {e}")
+        finally:
+            config_file.close()
+            with self._urls_condition:
+                self._urls_read = True
+                self._urls_condition.notify_all()
+
+        if errors:
+            raise ValueError("\n".join(errors))
+        return parsed_config
+
+    def _add_url(self: StreamingJSONParser, url: str) -> None:
+        """
+        Make a url available to get_urls.
+
+        :param url: The normalized url.
+        """
+
+        with self._urls_condition:
+            self._urls.append(url)
+            self._urls_condition.notify_all()
+
+    def get_urls(self: StreamingJSONParser) -> Iterator[str]:
+        """
+        Return iterator over the urls from the config. Every url is
+        returned as soon as it is read and the iterator blocks until the
+        next url is read.
+
+        :return: The iterator over the urls in the config.
+        """
+
+        i = 0
+        while True:
+            with self._urls_condition:
+                self._urls_condition.wait_for(
+                        lambda: i < len(self._urls) or self._urls_read)
+                if i >= len(self._urls):
+                    return
+                urls = self._urls[i:]
+            yield from urls
+            i += len(urls)
+
+    @staticmethod
+    def create_parser(config_path: str,
+                      select_funs: dict[str,SelectFun],
+                      filter_funs: dict[str,FilterFun],
+                      action_funs: dict[str,ActionFun]) -> StreamingJSONParser:
+        """
+        Factory method to create a parser from a config file path.
+
+        :param config_path: The config file's path.
+        :param select_funs: Dictionary mapping select function names to the
+                            respective functions.
+        :param filter_funs: Dictionary mapping filter function names to the
+                            respective functions.
+        :param action_funs: Dictionary mapping action function names to the
+                            respective functions.
+
+        :return: The json config parser created from the given parameters.
+        """
+
+        return StreamingJSONParser(open(config_path, "r"), select_funs,
+                                   filter_funs, action_funs)
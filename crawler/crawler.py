@@ -1,84 +1,683 @@
 from __future__ import annotations
 
+from concurrent.futures import Future, FIRST_COMPLETED, as_completed, wait
+from contextlib import nullcontext
 from sys import stderr
 from traceback import print_exception
-from bs4 import BeautifulSoup, Tag
+from typing import Any, Callable, Iterable, Iterator, Optional, Union
+from bs4 import BeautifulSoup
+from lxml.etree import _Element
+from requests import Response
 
-from .config_parser import BaseParser, SelectFun
+from .config_parser import (BaseParser, FilterFun,
+                            TagFiltersActions, Config)
+from .config_parser.parse_only import get_strainer
+from .default_functions import RegexFilter
+from .fingerprint import Fingerprinter
+from .fragments import (dump_fragment, hash_fragment, is_large_fragment,
+                        load_fragment)
+from .metrics import Metrics, get_metrics
 from .pages_downloader import BaseDownloader
+from .parsed_page import ParsedPage, lazy_page
+from .profiler import PageProfiler
+from .select_pool import SelectPool
 from .storage_handler import Storage
+from .structural_hash import HASH_SCHEME, hash_selected
+from .tags import Tags
 
 
 # TODO: Proper handling of missing tags
 
 
+# Response headers saved with the pages to revalidate them on the next run
+CACHE_HEADERS = ["ETag", "Last-Modified", "Cache-Control", "Expires"]
+
+
 class Crawler:
     """
     Crawler to check websites for updates.
 
     Crawler(config_parser: BaseParser, downloader: Downloader,
-            storage: Storage)
+            storage: Storage, fingerprinter: Fingerprinter, workers: int,
+            profiler: PageProfiler)
 
     :param config_parser: The config parser to get the config from
     :param downloader: The downloader to use for downloading the pages
     :param storage: The storage with the previous page versions
+    :param fingerprinter: Computes the fingerprints used to skip pages
+                          whose content did not change
+    :param workers: Number of worker processes parsing the pages and
+                    running the select chains. The pages are processed in
+                    the main process if it is 0. The workers are forked
+                    by the first fetch_pages before the downloads start,
+                    so the downloads wait for the config
+    :param profiler: Profiles the processing of the pages. No page is
+                     profiled if it is None
     """
 
     def __init__(self: Crawler, config_parser: BaseParser,
-                 downloader: Downloader, storage: Storage):
+                 downloader: Downloader, storage: Storage,
+                 fingerprinter: Fingerprinter = None, workers: int = 0,
+                 profiler: PageProfiler = None):
+        assert workers >= 0, "The number of workers can't be negative"
+
         self._config_parser = config_parser
         self._storage = storage
         self._pages_downloader = downloader
+        self._fingerprinter = fingerprinter or Fingerprinter()
+        self._workers = workers
+        self._profiler = profiler or PageProfiler(0)
+        # Forked by fetch_pages and kept until the downloader is closed
+        self._pool: Optional[SelectPool] = None
+        # Whether pages equal to their saved version are left out
+        self._changed_only = False
+
+    def get_urls(self: Crawler) -> list[str]:
+        """
+        Return the urls in the config. Blocks until the config is parsed.
+
+        :return: The list of urls.
+        """
+
+        return list(self._config_parser.get_parsed_config().keys())
+
+    def fetch_pages(self: Crawler, *args, urls: Iterable[str] = None,
+                    early_stop: bool = False, **kwargs) -> None:
+        """
+        Start downloading the pages. The arguments are passed to the
+        downloader's init_download.
+
+        :param urls: The urls to download or None for all urls in the
+                     config.
+        :param early_stop: Whether the pages are streamed and their
+                           downloads stop as soon as the tags selected by
+                           the rules were downloaded completely. Only the
+                           downloaded part of such pages is saved.
+        """
+
+        if urls is None:
+            urls = self._config_parser.get_urls()
+        # Revalidate saved pages instead of downloading them again
+        url_headers = {}
+        def add_headers(urls: Iterable[str]) -> Iterator[str]:
+            # Headers are added while the urls are passed to the downloader,
+            # so urls still being read can be downloaded immediately
+            for url in urls:
+                headers = Crawler.get_conditional_headers(
+                        self._storage.get_meta(url))
+                if headers:
+                    url_headers[url] = headers
+                yield url
+
+        if early_stop:
+            kwargs = {**kwargs, "stream": True,
+                      "stop_tests": self.get_stop_tests}
+        # Forking after the downloads started threads may deadlock the
+        # workers
+        if self._workers and self._pool is None:
+            self._pool = SelectPool(self._config_parser.get_parsed_config(),
+                                    Crawler.get_changed_tags, self._workers)
+        self._pages_downloader.init_download(
+                add_headers(urls), *args,
+                url_headers=url_headers, **kwargs)
+
+    def get_stop_tests(self: Crawler, url: str
+                      ) -> Optional[list[Callable[[_Element],bool]]]:
+        """
+        Return the tests of the tags found by the first steps of a url's
+        rules. The results of the rules' select chains are complete as
+        soon as the first tag passing each test was downloaded completely.
+        Blocks until the config is parsed.
+
+        :param url: The url.
+
+        :return: The tests or None if a rule may need the whole page.
+        """
+
+        tests = [tfa.lxml_select and tfa.lxml_select.first_match
+                 for tfa in self._config_parser.get_parsed_config().get(url,
+                                                                        [])]
+        if not tests or not all(tests):
+            return None
+        return tests
 
-    def fetch_pages(self: Crawler, *args, **kwargs) -> None:
-        self._pages_downloader.init_download(self._config_parser.get_urls(),
-                                             *args, **kwargs)
+    def process_pages(self: Crawler, close: bool = True,
+                      save_pages: Callable[[Storage,list[str]],None] = None,
+                      batch_size: int = 64,
+                      changed_only: bool = False) -> None:
+        """
+        Handle every downloaded page exactly once: run the rules on it and
+        add it to the new storage. The responses are released as soon as
+        they are processed.
 
-    def process_pages(self: Crawler):
-        config = self._config_parser.get_parsed_config()
-        with self._pages_downloader as pd:
+        :param close: Whether the downloader is closed afterwards. Open
+                      downloaders reuse their connections for the next
+                      fetch_pages.
+        :param save_pages: Function saving the pages of the given urls from
+                           the new storage. If given, the processed pages
+                           are saved in batches and removed from the new
+                           storage, so only the pages in flight are kept in
+                           memory.
+        :param batch_size: The number of processed pages saved together.
+        :param changed_only: Whether only the pages which differ from their
+                             saved version are passed to save_pages, e.g.
+                             if the saved storage is updated. The saved
+                             versions of the other pages are not read.
+        """
+
+        assert batch_size > 0, "The batch size has to be positive"
+
+        self._new_storage = Storage({})
+        # Urls of the pages of the new version, including the saved ones
+        self._page_urls: set[str] = set()
+        self._changed_only = save_pages is not None and changed_only
+        # Urls whose current version was confirmed by the server
+        self._checked_urls: set[str] = set()
+        metrics = get_metrics()
+        pool = self._pool
+        # Futures of pages processed by the pool
+        selecting = set()
+        with (self._pages_downloader if close
+              else nullcontext(self._pages_downloader)) as pd:
+            # Stops the downloads if the config is invalid
+            config = self._config_parser.get_parsed_config()
             for future in pd:
+                if (save_pages is not None
+                        and len(self._new_storage) - len(selecting)
+                        >= batch_size):
+                    self.save_processed_pages(save_pages, selecting)
+                url = future.original_url
                 try:
-                    page = BeautifulSoup(future.result().text, features="lxml")
+                    response = future.result()
                 except Exception as e:
                     print_exception(None, e, e.__traceback__, file=stderr)
+                    metrics.count("download_errors", url=url)
+                    self.keep_saved_page(url)
                     continue
 
-                for tfa in config[future.original_url]:
-                    try:
-                        tag = Crawler.get_tag(page, tfa.select)
-                    except Exception as e:
-                        print_exception(None, e, e.__traceback__, file=stderr)
-                        continue
-
-                    try:
-                        old_tag = Crawler.get_tag(self._storage[future.original_url],
-                                                  tfa.select)
-                    except Exception as e:
-                        old_tag = None
-
-                    if old_tag and tag and old_tag.prettify() == tag.prettify():
-                        continue
-                    for fa in tfa.filters_actions:
-                        if not all(map(lambda f: f((tag,old_tag,)), fa.filters)):
-                            continue
-                        for action in fa.actions:
-                            action((tag,old_tag,))
-
-    def new_pages_storage(self: Crawler):
-        storage = {}
-        with self._pages_downloader as pd:
-            for future in pd:
+                metrics.status(url, response.status_code)
+                # Saved page is still up to date
+                if Crawler.is_not_modified(response):
+                    metrics.count("not_modified", url=url)
+                    self.keep_saved_page(url, response)
+                    self._checked_urls.add(url)
+                    continue
+
+                # The page is passed to the parsers undecoded
+                content = response.content
+                encoding = BaseDownloader.get_declared_encoding(
+                        response.headers)
+                metrics.count("bytes", len(content), url)
                 try:
-                    storage[future.original_url] = future.result().text
+                    with metrics.time("fingerprint", url), \
+                            self._profiler.profile(url):
+                        fingerprint = self._fingerprinter.fingerprint(content)
                 except Exception as e:
-                    storage[future.original_url] = self._storage[future.original_url].prettify()
-        return Storage(storage)
+                    print_exception(None, e, e.__traceback__, file=stderr)
+                    self.keep_saved_page(url)
+                    continue
+                if Crawler.is_successful(response):
+                    self._checked_urls.add(url)
+                # The metadata of saved pages may be decoded on every read
+                saved_meta = self._storage.get_meta(url)
+                saved_fragments = saved_meta.get("fragments", {})
+                self._new_storage[url] = content
+                self._new_storage.set_meta(url, {
+                        "headers": Crawler.get_cache_headers(response),
+                        "encoding": encoding,
+                        "fingerprint": fingerprint,
+                        "fragments": saved_fragments})
+
+                # Saved page has the same content
+                if fingerprint == saved_meta.get("fingerprint", None):
+                    metrics.count("unchanged", url=url)
+                    continue
+                if pool is None:
+                    with self._profiler.profile(url):
+                        self.process_page(url, content, encoding,
+                                          config[url],
+                                          getattr(response, "tree", None))
+                    continue
+
+                # The saved page is only needed for rules without saved
+                # fragments or with fragments only saved as hash
+                old_content = None
+                if any("fragment" not in saved_fragments.get(tfa.key, {})
+                       for tfa in config[url]):
+                    old_content = self._storage.get_content(url)
+                selecting.add(pool.submit(
+                        url, content, encoding, old_content,
+                        self._storage.get_encoding(url), saved_fragments,
+                        isinstance(metrics, Metrics),
+                        self._profiler.is_sampled(url)))
+                # Limit the number of pages waiting for the workers
+                if len(selecting) >= 2 * self._workers:
+                    done, selecting = wait(selecting,
+                                           return_when=FIRST_COMPLETED)
+                    self.process_selected(done, config)
+
+        if pool is not None:
+            self.process_selected(as_completed(selecting), config)
+            if close:
+                pool.close()
+                self._pool = None
+        if save_pages is not None:
+            self.save_processed_pages(save_pages, set())
+
+    def save_processed_pages(self: Crawler,
+                             save_pages: Callable[[Storage,list[str]],None],
+                             selecting: set[Future]) -> None:
+        """
+        Save the processed pages of the new storage and remove them from
+        it. Pages still processed by the pool are kept.
+
+        :param save_pages: Function saving the pages of the given urls from
+                           the new storage.
+        :param selecting: The futures of the pages processed by the pool.
+        """
+
+        selected = set(future.original_url for future in selecting)
+        urls = [url for url in self._new_storage.get_urls()
+                if url not in selected]
+        if not urls:
+            return
+
+        # Fingerprints and fragments are part of the metadata, so pages
+        # with the same metadata are equal to their saved version
+        changed = [url for url in urls if not self._changed_only
+                   or (self._new_storage.get_meta(url)
+                       != self._storage.get_meta(url))]
+        if changed:
+            save_pages(self._new_storage, changed)
+        self._page_urls.update(urls)
+        for url in urls:
+            del self._new_storage[url]
+
+    def process_page(self: Crawler, url: str, content: Union[str,bytes],
+                     encoding: Optional[str], tfas: list[TagFiltersActions],
+                     tree: Optional[_Element] = None) -> None:
+        """
+        Run the rules for a single downloaded page and save the selected
+        fragments in the new storage.
+
+        :param url: The page's url.
+        :param content: The downloaded page's raw content or html.
+        :param encoding: The encoding declared by the server or None.
+        :param tfas: The rules for the page.
+        :param tree: The page parsed by lxml while it was downloaded or
+                     None if it wasn't.
+        """
+
+        # Only the tags the rules can reach are parsed
+        parse_only = get_strainer(tfas)
+        page = ParsedPage(content, encoding, parse_only, tree)
+        get_old_page = lazy_page(lambda: self._storage.get_content(url),
+                                 self._storage.get_encoding(url), parse_only)
+        saved_fragments = self._storage.get_meta(url).get("fragments", {})
+        fragments = {}
+        metrics = get_metrics()
+        for tfa in tfas:
+            try:
+                # Includes parsing the pages for the first rule
+                with metrics.time("select", url):
+                    fragments[tfa.key], tags = Crawler.get_changed_tags(
+                            page, get_old_page, tfa,
+                            saved_fragments.get(tfa.key, None))
+            except Exception as e:
+                metrics.count("select_errors", url=url)
+                print_exception(None, e, e.__traceback__, file=stderr)
+                Crawler.keep_saved_fragment(fragments, saved_fragments,
+                                            tfa.key)
+                continue
+
+            if tags is not None:
+                Crawler.run_filters_actions(tfa, *tags)
+        self.set_fragments(url, fragments)
+
+    def process_selected(self: Crawler, futures: Iterable[Future],
+                         config: Config) -> None:
+        """
+        Run the filters and actions for pages processed by the pool and
+        save the selected fragments in the new storage. The metrics and
+        profiles recorded by the workers are added.
+
+        :param futures: The completed futures returned by the pool.
+        :param config: The parsed config.
+        """
+
+        for future in futures:
+            url = future.original_url
+            try:
+                results, report, stats = future.result()
+            except Exception as e:
+                print_exception(None, e, e.__traceback__, file=stderr)
+                continue
+            if report is not None:
+                get_metrics().merge(report)
+            if stats is not None:
+                self._profiler.add_stats(url, stats)
+
+            saved_fragments = self._storage.get_meta(url).get("fragments", {})
+            fragments = {}
+            for tfa, result in zip(config[url], results):
+                if result is None:
+                    Crawler.keep_saved_fragment(fragments, saved_fragments,
+                                                tfa.key)
+                    continue
+
+                fragments[tfa.key], changed = result
+                if changed is None:
+                    continue
+                # Sending the tags is part of the rule's cost
+                with get_metrics().rule_cost(tfa.path, calls=0):
+                    tags = (load_fragment(changed[0]),
+                            load_fragment(changed[1]))
+                Crawler.run_filters_actions(tfa, *tags)
+            self.set_fragments(url, fragments)
+
+    def set_fragments(self: Crawler, url: str,
+                      fragments: dict[str,dict[str,Any]]) -> None:
+        """
+        Save the selected fragments of a page in the new storage.
+
+        :param url: The page's url.
+        :param fragments: Dictionary mapping rule keys to the fragments and
+                          their hashes.
+        """
+
+        self._new_storage.set_meta(url, {**self._new_storage.get_meta(url),
+                                         "fragments": fragments})
 
     @staticmethod
-    def get_tag(base: Tag, select: list[SelectFun]):
-        for f in select:
-            if not base:
-                return base
-            base = f(base)
+    def keep_saved_fragment(fragments: dict[str,dict[str,Any]],
+                            saved_fragments: dict[str,dict[str,Any]],
+                            key: str) -> None:
+        """
+        Keep the saved fragment of a rule whose select chain failed.
+
+        :param fragments: The new fragments.
+        :param saved_fragments: The saved fragments.
+        :param key: The rule's key.
+        """
+
+        if key in saved_fragments:
+            fragments[key] = saved_fragments[key]
+
+    @staticmethod
+    def run_filters_actions(tfa: TagFiltersActions, tag: Any,
+                            old_tag: Any) -> None:
+        """
+        Run the actions of every filters actions pair whose filters all
+        accept the selected tags. Identical filters are shared by the
+        pairs, so every filter only runs once.
+
+        :param tfa: The rule.
+        :param tag: The tag selected from the downloaded page.
+        :param old_tag: The tag selected from the saved page.
+        """
+
+        metrics = get_metrics()
+        with metrics.rule_cost(tfa.path, calls=0):
+            tags = Tags(tag, old_tag)
+            # Regex filters matching the same value scan it only once
+            with metrics.time("filters"):
+                results = RegexFilter.run_batch(list(dict.fromkeys(
+                        f for fa in tfa.filters_actions for f in fa.filters)),
+                        tags)
+            def accepts(f: FilterFun) -> bool:
+                if f not in results:
+                    with metrics.time("filters"):
+                        results[f] = f(tags)
+                return results[f]
+
+            for fa in tfa.filters_actions:
+                if not all(map(accepts, fa.filters)):
+                    continue
+                for action in fa.actions:
+                    with metrics.time("actions"):
+                        action(tags)
+
+    def keep_saved_page(self: Crawler, url: str,
+                        response: Response = None) -> None:
+        """
+        Add the saved version of a page to the new storage if there is no
+        newer version.
+
+        :param url: The page's url.
+        :param response: The response confirming the saved page is up to
+                         date, if there is one.
+        """
+
+        if not self._storage.has_page(url):
+            return
+
+        saved_meta = self._storage.get_meta(url)
+        meta = dict(saved_meta)
+        if response is not None:
+            # A 304 response may update the cache headers
+            meta["headers"] = {**meta.get("headers", {}),
+                               **Crawler.get_cache_headers(response)}
+        # The saved page is only read if it is saved again
+        if self._changed_only and meta == saved_meta:
+            self._page_urls.add(url)
+            return
+
+        self._new_storage[url] = self._storage.get_content(url)
+        self._new_storage.set_meta(url, meta)
+
+    def new_page_urls(self: Crawler) -> set[str]:
+        """
+        Return the urls of all pages of the new version, including the
+        pages saved by process_pages and the pages which were left out
+        because they equal their saved version. Only available after
+        process_pages was called.
+
+        :return: The set of urls.
+        """
+
+        assert hasattr(self, "_page_urls"), "The pages were not processed yet"
+
+        return self._page_urls | set(self._new_storage.get_urls())
+
+    def new_pages_storage(self: Crawler) -> Storage:
+        """
+        Return the storage with the newest version of every page. Only
+        available after process_pages was called. Pages saved by
+        process_pages are not contained.
+
+        :return: The new storage.
+        """
+
+        assert hasattr(self, "_new_storage"), \
+                "The pages were not processed yet"
+
+        return self._new_storage
+
+    def checked_urls(self: Crawler) -> set[str]:
+        """
+        Return the urls whose pages were downloaded successfully or
+        confirmed to be up to date by the last process_pages. The pages of
+        the other urls failed to download or were error responses.
+
+        :return: The set of urls.
+        """
+
+        assert hasattr(self, "_checked_urls"), \
+                "The pages were not processed yet"
+
+        return self._checked_urls
+
+    @staticmethod
+    def is_successful(response: Response) -> bool:
+        """
+        Return whether a response contains the current version of a page.
+
+        :param response: The response.
+
+        :return: True if the response's status is 2xx.
+        """
+
+        return 200 <= response.status_code < 300
+
+    @staticmethod
+    def is_not_modified(response: Response) -> bool:
+        """
+        Return whether the server confirmed that the saved page is still up
+        to date.
+
+        :param response: The response to a conditional request.
+
+        :return: True if the response's status is 304 Not Modified.
+        """
+
+        return response.status_code == 304
+
+    @staticmethod
+    def get_cache_headers(response: Response) -> dict[str,str]:
+        """
+        Return the response headers needed to revalidate the page later.
+
+        :param response: The response containing the page.
+
+        :return: Dictionary mapping header names to values.
+        """
+
+        return dict((h, response.headers[h]) for h in CACHE_HEADERS
+                    if h in response.headers)
+
+    @staticmethod
+    def get_conditional_headers(meta: dict[str,Any]) -> dict[str,str]:
+        """
+        Return the request headers to revalidate a saved page.
+
+        :param meta: The saved page's metadata.
+
+        :return: Dictionary mapping header names to values.
+        """
+
+        cache_headers = meta.get("headers", {})
+        headers = {}
+        if "ETag" in cache_headers:
+            headers["If-None-Match"] = cache_headers["ETag"]
+        if "Last-Modified" in cache_headers:
+            headers["If-Modified-Since"] = cache_headers["Last-Modified"]
+        return headers
+
+    @staticmethod
+    def get_changed_tags(page: ParsedPage,
+                         get_old_page: Callable[[],Optional[ParsedPage]],
+                         tfa: TagFiltersActions,
+                         saved_fragment: Optional[dict[str,Any]]
+                        ) -> tuple[dict[str,Any],Optional[tuple[Any,Any]]]:
+        """
+        Run a select chain on a page and compare the result with the saved
+        fragment. Rules without saved fragment are compared with the saved
+        page instead. Large fragments are only saved as hash, the saved
+        page is used if their old tags are needed.
+
+        :param page: The downloaded page.
+        :param get_old_page: Function returning the saved page or None if
+                             there is none.
+        :param tfa: The rule.
+        :param saved_fragment: The rule's saved fragment and its hash or
+                               None if there is none.
+
+        :return: The new fragment with its hash and the new and old
+                 selected tags or None if they are equal.
+        """
+
+        tag = Crawler.select_tag(page, tfa)
+        # Large selections are expensive to serialize and hash
+        with get_metrics().rule_cost(tfa.path, calls=0):
+            # Iterators would be exhausted by dumping them
+            if isinstance(tag, Iterator):
+                tag = list(tag)
+            new_fragment = {"hash": hash_selected(tag, page.hashes),
+                            "scheme": HASH_SCHEME}
+            # Whole pages are saved as page anyway
+            if not isinstance(tag, BeautifulSoup):
+                fragment = dump_fragment(tag)
+                if not is_large_fragment(fragment):
+                    new_fragment["fragment"] = fragment
+
+        if saved_fragment is not None:
+            if tag and Crawler.is_same_fragment(saved_fragment, new_fragment):
+                get_metrics().count("fragment_hits")
+                return new_fragment, None
+            get_metrics().count("fragment_misses")
+            if "fragment" in saved_fragment:
+                saved_tag = load_fragment(saved_fragment["fragment"])
+                return new_fragment, (tag, saved_tag)
+
+        try:
+            old_page = get_old_page()
+            old_tag = Crawler.select_tag(old_page, tfa)
+            if isinstance(old_tag, Iterator):
+                old_tag = list(old_tag)
+        except Exception as e:
+            old_tag = None
+
+        # Saved fragments were already compared
+        if (saved_fragment is None and old_tag and tag
+                and hash_selected(old_tag, old_page.hashes)
+                == new_fragment["hash"]):
+            return new_fragment, None
+        return new_fragment, (tag, old_tag)
+
+    @staticmethod
+    def is_same_fragment(saved_fragment: dict[str,Any],
+                         new_fragment: dict[str,Any]) -> bool:
+        """
+        Return whether a saved fragment equals a new fragment. Fragments
+        saved before structural hashes were used are compared by the hash
+        of their serialization, which large new fragments don't have.
+
+        :param saved_fragment: The saved fragment and its hash.
+        :param new_fragment: The new fragment and its hash.
+
+        :return: True if the fragments' hashes are equal.
+        """
+
+        scheme = saved_fragment.get("scheme", None)
+        if scheme is None:
+            return ("fragment" in new_fragment and saved_fragment["hash"]
+                    == hash_fragment(new_fragment["fragment"]))
+        return (scheme == new_fragment["scheme"]
+                and saved_fragment["hash"] == new_fragment["hash"])
+
+    @staticmethod
+    def select_tag(page: ParsedPage, tfa: TagFiltersActions) -> Any:
+        """
+        Run a rule's select chain on a page. Chains compiled for lxml are
+        run on the page parsed by lxml, all others by BeautifulSoup. The
+        results of steps shared by several rules are cached in the page.
+
+        :param page: The page.
+        :param tfa: The rule.
+
+        :return: The select chain's result.
+        """
+
+        metrics = get_metrics()
+        # Parsing the page is not part of the rule's cost
+        if tfa.lxml_select is not None and page.tree is not None:
+            with metrics.rule_cost(tfa.path):
+                return tfa.lxml_select(page.tree)
+
+        # Steps shared with other rules are only run once per page
+        base = page.soup
+        with metrics.rule_cost(tfa.path):
+            for node, step in zip(tfa.select_path, tfa.select_paths):
+                if not base:
+                    return base
+                if node in page.results:
+                    metrics.count("select_cache_hits")
+                    base = page.results[node]
+                    continue
+                metrics.count("select_cache_misses")
+                with metrics.rule_cost(tfa.path, step):
+                    base = node.fun(base)
+                # Iterators would be exhausted by the first rule using them
+                if not isinstance(base, Iterator):
+                    page.results[node] = base
         return base
@@ -1,6 +1,13 @@
-from typing import Any as Any
+from __future__ import annotations
+
+from functools import lru_cache as lru_cache
+from typing import Any as Any, Callable as Callable
 from bs4 import Tag as Tag
-from re import match as match, search as search
+from re import (Pattern as Pattern, UNICODE as UNICODE, compile as compile,
+                error as error)
+
+from .structural_hash import get_changed_paths as get_changed_paths
+from .tags import Tags as Tags
 
 
 def getitem(tag: Tag, item: str) -> Any:
@@ -14,6 +21,150 @@ def getitem(tag: Tag, item: str) -> Any:
     return tag[item]
 
 
+class RegexFilter:
+    """
+    Filter matching a regular expression against the new tag's html, text
+    or string. The expression is compiled once when the config is parsed.
+
+    :param search: Whether the expression may match anywhere instead of
+                   only at the beginning.
+    :param value: The value matched: str, text or string.
+    """
+
+    __slots__ = ["_search", "_value"]
+
+    def __init__(self: RegexFilter, search: bool, value: str) -> None:
+        self._search = search
+        self._value = value
+
+    def prepare(self: RegexFilter, re: str) -> tuple[tuple,dict]:
+        """
+        Compile the expression. Called once for every filter in the config.
+
+        :param re: The regular expression.
+
+        :return: The arguments and keyword arguments the filter is called
+                 with.
+        """
+
+        try:
+            return (compile(re),), {}
+        except error as e:
+            raise ValueError(f"Invalid regular expression {re!r}: {e}")
+
+    def __call__(self: RegexFilter, tags: tuple[Any,Any],
+                 re: Pattern) -> bool:
+        """
+        Check whether the expression matches the new tag.
+
+        :param tags: The new and old tag.
+        :param re: The compiled or uncompiled regular expression.
+        """
+
+        if not isinstance(re, Pattern):
+            re = compile(re)
+        value = Tags.get(tags, 0, self._value)
+        if self._search:
+            return re.search(value) is not None
+        return re.match(value) is not None
+
+    @staticmethod
+    def run_batch(filters: list[Callable], tags: tuple[Any,Any]
+                 ) -> dict[Callable,bool]:
+        """
+        Evaluate the regex filters matching the same value of the same tag
+        together, so the value is scanned once instead of once per filter.
+        Filters that can't be combined are left out.
+
+        :param filters: The prepared filters of a rule.
+        :param tags: The new and old tag.
+
+        :return: Dictionary mapping the combined filters to their results.
+        """
+
+        groups: dict[tuple[bool,str],list[Callable]] = {}
+        for f in filters:
+            base_fun = getattr(f, "base_fun", None)
+            if (isinstance(base_fun, RegexFilter) and len(f.args) == 1
+                    and not f.kwargs and RegexFilter.can_combine(f.args[0])):
+                groups.setdefault((base_fun._search, base_fun._value),
+                                  []).append(f)
+
+        results = {}
+        for (search, value), group in groups.items():
+            if len(group) < 2:
+                continue
+            try:
+                matched = RegexFilter.scan(Tags.get(tags, 0, value),
+                                           tuple(f.args[0] for f in group),
+                                           search)
+            except (AttributeError, TypeError):
+                # The filters raise the error when they are run one by one
+                continue
+            results.update((f, i in matched) for i, f in enumerate(group))
+        return results
+
+    @staticmethod
+    def can_combine(re: Any) -> bool:
+        """
+        Return whether a pattern can be part of a combined pattern without
+        changing its meaning. Groups would be renumbered and global flags
+        would apply to all patterns.
+
+        :param re: The compiled regular expression.
+
+        :return: True if the pattern can be combined.
+        """
+
+        return (isinstance(re, Pattern) and isinstance(re.pattern, str)
+                and re.groups == 0 and re.flags == UNICODE)
+
+    @staticmethod
+    def scan(value: str, patterns: tuple[Pattern,...],
+             search: bool) -> set[int]:
+        """
+        Find the patterns matching a value with combined patterns. After
+        every match, the matched pattern is removed and the scan continues
+        at the match's start, where no other pattern can match earlier.
+
+        :param value: The scanned value.
+        :param patterns: The patterns.
+        :param search: Whether the patterns may match anywhere instead of
+                       only at the beginning.
+
+        :return: The indices of the matching patterns.
+        """
+
+        remaining = list(range(len(patterns)))
+        matched = set()
+        pos = 0
+        while remaining:
+            combined = RegexFilter.combine(tuple(patterns[i]
+                                                 for i in remaining))
+            m = (combined.search(value, pos) if search
+                 else combined.match(value))
+            if m is None:
+                break
+            matched.add(remaining.pop(int(m.lastgroup[1:])))
+            pos = m.start()
+        return matched
+
+    @staticmethod
+    @lru_cache(maxsize=1024)
+    def combine(patterns: tuple[Pattern,...]) -> Pattern:
+        """
+        Combine patterns without groups into one alternation, whose named
+        groups tell which pattern matched.
+
+        :param patterns: The patterns.
+
+        :return: The combined pattern.
+        """
+
+        return compile("|".join(f"(?P<p{i}>{p.pattern})"
+                                for i, p in enumerate(patterns)))
+
+
 # Select functions can return anything but will be chained, so the next
 # function has to be able to handle the previous function's output
 SELECT_FUNCTIONS = {
@@ -36,13 +187,14 @@ SELECT_FUNCTIONS = {
 }
 
 # Filter functions must return a boolean
+# Functions with a prepare method get their arguments from it
 FILTER_FUNCTIONS = {
-    "re_match": (lambda tags,re: match(re,str(tags[0])) is not None),
-    "re_match_text": (lambda tags,re: match(re,tags[0].text) is not None),
-    "re_match_string": (lambda tags,re: match(re,tags[0].string) is not None),
-    "re_search": (lambda tags,re: search(re,str(tags[0])) is not None),
-    "re_search_text": (lambda tags,re: search(re,tags[0].text) is not None),
-    "re_search_string": (lambda tags,re: search(re,tags[0].string) is not None)
+    "re_match": RegexFilter(False, "str"),
+    "re_match_text": RegexFilter(False, "text"),
+    "re_match_string": RegexFilter(False, "string"),
+    "re_search": RegexFilter(True, "str"),
+    "re_search_text": RegexFilter(True, "text"),
+    "re_search_string": RegexFilter(True, "string")
 }
 
 # Action functions should not return anything
@@ -50,5 +202,6 @@ FILTER_FUNCTIONS = {
 ACTION_FUNCTIONS = {
     "print_no_tag": (lambda tags,*args,**kwargs: print(*args, **kwargs)),
     "print_tag": (lambda tags,*args,**kwargs: print(tags[0], *args, **kwargs)),
-    "print_tags": (lambda tags,sep,*args,**kwargs: print(f"{tags[0]}{sep}{tags[1]}", *args, **kwargs))
+    "print_tags": (lambda tags,sep,*args,**kwargs: print(f"{tags[0]}{sep}{tags[1]}", *args, **kwargs)),
+    "print_changed": (lambda tags,*args,**kwargs: print(", ".join(get_changed_paths(tags[0], tags[1])), *args, **kwargs))
 }
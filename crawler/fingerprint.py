@@ -0,0 +1,49 @@
+from __future__ import annotations
+
+from hashlib import sha256
+from re import compile
+
+
+# Runs of whitespace are collapsed before hashing
+WHITESPACE = compile(rb"\s+")
+
+
+class Fingerprinter:
+    """
+    Computes fingerprints of raw page contents to recognize unchanged pages
+    without parsing them.
+
+    :param ignore_patterns: Regular expressions matching dynamic parts of
+                            the pages (e.g. nonces, csrf tokens or
+                            timestamps), which are removed before the
+                            fingerprint is computed.
+    """
+
+    __slots__ = ["_ignore_patterns"]
+
+    def __init__(self: Fingerprinter, ignore_patterns: list[str] = []) -> None:
+        self._ignore_patterns = [compile(p.encode()) for p in ignore_patterns]
+
+    def normalize(self: Fingerprinter, content: bytes) -> bytes:
+        """
+        Remove ignored parts and collapse whitespace.
+
+        :param content: The raw page content.
+
+        :return: The normalized page content.
+        """
+
+        for pattern in self._ignore_patterns:
+            content = pattern.sub(b"", content)
+        return WHITESPACE.sub(b" ", content).strip()
+
+    def fingerprint(self: Fingerprinter, content: bytes) -> str:
+        """
+        Return the fingerprint of a page's raw content.
+
+        :param content: The raw page content.
+
+        :return: The hex digest of the normalized content.
+        """
+
+        return sha256(self.normalize(content)).hexdigest()
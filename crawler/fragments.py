@@ -0,0 +1,112 @@
+from __future__ import annotations
+
+from collections.abc import Iterator
+from hashlib import sha256
+from json import dumps
+from typing import Any, Union
+from bs4 import BeautifulSoup, NavigableString, Tag
+
+
+# Json serializable representation of a select chain's result
+Fragment = Union[None,dict[str,Any]]
+
+# Fragments with more characters are only saved as hash. The saved page is
+# used instead if the fragment is needed
+MAX_FRAGMENT_SIZE = 1 << 16
+
+
+def dump_fragment(selected: Any) -> Fragment:
+    """
+    Convert the result of a select chain to a json serializable fragment.
+    Tags are stored as html, lists and iterators are stored element by
+    element.
+
+    :param selected: The select chain's result.
+
+    :return: The fragment.
+    """
+
+    if selected is None:
+        return None
+    if isinstance(selected, BeautifulSoup):
+        return {"page": str(selected)}
+    if isinstance(selected, Tag):
+        return {"tag": str(selected)}
+    if isinstance(selected, NavigableString):
+        return {"string": str(selected)}
+    if isinstance(selected, str):
+        return {"str": selected}
+    if isinstance(selected, (list, tuple, Iterator)):
+        return {"list": [dump_fragment(s) for s in selected]}
+    if isinstance(selected, (int, float, bool)):
+        return {"value": selected}
+    return {"str": str(selected)}
+
+
+def load_fragment(fragment: Fragment) -> Any:
+    """
+    Convert a fragment back to a select chain result. Tags are parsed
+    again and detached from the page they were selected from.
+
+    :param fragment: The fragment created by dump_fragment.
+
+    :return: The select chain's result.
+    """
+
+    if fragment is None:
+        return None
+    if "page" in fragment:
+        return BeautifulSoup(fragment["page"], features="lxml")
+    if "tag" in fragment:
+        # html.parser does not add html and body tags around the fragment
+        return BeautifulSoup(fragment["tag"], features="html.parser").contents[0]
+    if "string" in fragment:
+        return NavigableString(fragment["string"])
+    if "str" in fragment:
+        return fragment["str"]
+    if "list" in fragment:
+        return [load_fragment(f) for f in fragment["list"]]
+    return fragment["value"]
+
+
+def hash_fragment(fragment: Fragment) -> str:
+    """
+    Return the hash of a fragment. Equal fragments have equal hashes.
+
+    :param fragment: The fragment created by dump_fragment.
+
+    :return: The fragment's hash.
+    """
+
+    return sha256(dumps(fragment, sort_keys=True).encode()).hexdigest()
+
+
+def get_fragment_size(fragment: Fragment) -> int:
+    """
+    Return the number of characters of the html and strings in a fragment.
+
+    :param fragment: The fragment created by dump_fragment.
+
+    :return: The fragment's size.
+    """
+
+    if fragment is None or "value" in fragment:
+        return 0
+    if "list" in fragment:
+        return sum(get_fragment_size(f) for f in fragment["list"])
+    return len(next(iter(fragment.values())))
+
+
+def is_large_fragment(fragment: Fragment) -> bool:
+    """
+    Return whether a fragment is too large to be saved. Whole pages are
+    always too large, they are saved as page anyway.
+
+    :param fragment: The fragment created by dump_fragment.
+
+    :return: True if only the fragment's hash should be saved.
+    """
+
+    return (fragment is not None
+            and ("page" in fragment
+                 or get_fragment_size(fragment) > MAX_FRAGMENT_SIZE))
@@ -0,0 +1,412 @@
+from __future__ import annotations
+
+from collections import defaultdict
+from contextlib import contextmanager, nullcontext
+from functools import wraps
+from json import dump
+from os import replace
+from threading import Lock
+from time import perf_counter, thread_time, time
+from typing import Any, Callable, ContextManager, Iterator, Optional
+
+
+# Returned by the disabled metrics instead of a timer
+NULL_TIMER = nullcontext()
+
+
+class NullMetrics:
+    """
+    Metrics which are not recorded. Used while no metrics are enabled, so
+    the instrumented code only pays for a method call.
+    """
+
+    __slots__ = []
+
+    def time(self: NullMetrics, stage: str,
+             url: Optional[str] = None) -> ContextManager[None]:
+        """
+        Return a context manager measuring the time spent in a stage.
+
+        :param stage: The stage's name.
+        :param url: The url the time is spent for or None.
+
+        :return: The context manager.
+        """
+
+        return NULL_TIMER
+
+    def record(self: NullMetrics, stage: str, seconds: float,
+               url: Optional[str] = None) -> None:
+        """
+        Record time spent in a stage.
+
+        :param stage: The stage's name.
+        :param seconds: The time.
+        :param url: The url the time was spent for or None.
+        """
+
+        pass
+
+    def count(self: NullMetrics, counter: str, value: float = 1,
+              url: Optional[str] = None) -> None:
+        """
+        Increase a counter, like the number of downloaded bytes or cache
+        hits.
+
+        :param counter: The counter's name.
+        :param value: The increment.
+        :param url: The url the counter belongs to or None.
+        """
+
+        pass
+
+    def status(self: NullMetrics, url: str, status_code: int) -> None:
+        """
+        Record the status code of a response.
+
+        :param url: The requested url.
+        :param status_code: The status code.
+        """
+
+        pass
+
+    def rule_cost(self: NullMetrics, rule: str, step: Optional[str] = None,
+                  calls: int = 1) -> ContextManager[None]:
+        """
+        Return a context manager measuring the CPU time spent for a rule
+        or one of its select steps.
+
+        :param rule: The rule's path in the config.
+        :param step: The step's path in the config or None for the rule.
+        :param calls: The number of calls the time is spent in.
+
+        :return: The context manager.
+        """
+
+        return NULL_TIMER
+
+    def record_rule(self: NullMetrics, rule: str, seconds: float,
+                    step: Optional[str] = None, calls: int = 1) -> None:
+        """
+        Record CPU time spent for a rule or one of its select steps.
+
+        :param rule: The rule's path in the config.
+        :param seconds: The CPU time.
+        :param step: The step's path in the config or None for the rule.
+        :param calls: The number of calls the time was spent in.
+        """
+
+        pass
+
+    def merge(self: NullMetrics, report: dict[str,Any]) -> None:
+        """
+        Add the metrics of a run report, like the report of a worker
+        process.
+
+        :param report: The report.
+        """
+
+        pass
+
+
+class Metrics(NullMetrics):
+    """
+    Timings and counters of a crawl run, in total and per url. Can be
+    recorded from several threads and exported as a json run report or as
+    a Prometheus textfile.
+    """
+
+    __slots__ = ["_lock", "_start", "_stages", "_counters", "_statuses",
+                 "_urls", "_rules"]
+
+    def __init__(self: Metrics) -> None:
+        self._lock = Lock()
+        self._start = time()
+        # Number of calls and total seconds by stage
+        self._stages: dict[str,list[float]] = defaultdict(lambda: [0, 0.0])
+        self._counters: dict[str,float] = defaultdict(int)
+        self._statuses: dict[int,int] = defaultdict(int)
+        # Stage seconds, counters and status code by url
+        self._urls: dict[str,dict[str,Any]] = defaultdict(
+                lambda: defaultdict(int))
+        # Number of calls and CPU seconds of the rules and of their steps
+        # by path
+        self._rules: dict[str,dict[str,Any]] = defaultdict(
+                lambda: {"calls": 0, "seconds": 0.0,
+                         "steps": defaultdict(lambda: [0, 0.0])})
+
+    @contextmanager
+    def time(self: Metrics, stage: str,
+             url: Optional[str] = None) -> Iterator[None]:
+        """
+        Measure the time spent in a stage.
+        """
+
+        start = perf_counter()
+        try:
+            yield
+        finally:
+            self.record(stage, perf_counter() - start, url)
+
+    def record(self: Metrics, stage: str, seconds: float,
+               url: Optional[str] = None) -> None:
+        """
+        Record time spent in a stage.
+        """
+
+        with self._lock:
+            stats = self._stages[stage]
+            stats[0] += 1
+            stats[1] += seconds
+            if url is not None:
+                self._urls[url][f"{stage}_seconds"] += seconds
+
+    def count(self: Metrics, counter: str, value: float = 1,
+              url: Optional[str] = None) -> None:
+        """
+        Increase a counter.
+        """
+
+        with self._lock:
+            self._counters[counter] += value
+            if url is not None:
+                self._urls[url][counter] += value
+
+    def status(self: Metrics, url: str, status_code: int) -> None:
+        """
+        Record the status code of a response.
+        """
+
+        with self._lock:
+            self._statuses[status_code] += 1
+            self._urls[url]["status"] = status_code
+
+    @contextmanager
+    def rule_cost(self: Metrics, rule: str, step: Optional[str] = None,
+                  calls: int = 1) -> Iterator[None]:
+        """
+        Measure the CPU time spent for a rule or one of its select steps.
+        Only the current thread's time is measured, so downloads running
+        at the same time don't count. The time spent in worker processes
+        is added by merging their reports.
+        """
+
+        start = thread_time()
+        try:
+            yield
+        finally:
+            self.record_rule(rule, thread_time() - start, step, calls)
+
+    def record_rule(self: Metrics, rule: str, seconds: float,
+                    step: Optional[str] = None, calls: int = 1) -> None:
+        """
+        Record CPU time spent for a rule or one of its select steps.
+        """
+
+        with self._lock:
+            cost = self._rules[rule]
+            if step is None:
+                cost["calls"] += calls
+                cost["seconds"] += seconds
+            else:
+                stats = cost["steps"][step]
+                stats[0] += calls
+                stats[1] += seconds
+
+    def merge(self: Metrics, report: dict[str,Any]) -> None:
+        """
+        Add the metrics of a run report, like the report of a worker
+        process.
+        """
+
+        with self._lock:
+            for stage, stats in report["stages"].items():
+                totals = self._stages[stage]
+                totals[0] += stats["calls"]
+                totals[1] += stats["seconds"]
+            for counter, value in report["counters"].items():
+                self._counters[counter] += value
+            for code, n in report["statuses"].items():
+                self._statuses[int(code)] += n
+            for url, values in report["urls"].items():
+                for key, value in values.items():
+                    if key == "status":
+                        self._urls[url][key] = value
+                    else:
+                        self._urls[url][key] += value
+            for rule, cost in report["rules"].items():
+                totals = self._rules[rule]
+                totals["calls"] += cost["calls"]
+                totals["seconds"] += cost["seconds"]
+                for step, stats in cost["steps"].items():
+                    step_totals = totals["steps"][step]
+                    step_totals[0] += stats["calls"]
+                    step_totals[1] += stats["seconds"]
+
+    def slowest_rules(self: Metrics, n: int) -> list[tuple[str,dict[str,Any]]]:
+        """
+        Return the rules which took the most CPU time.
+
+        :param n: The number of rules.
+
+        :return: The paths and costs of the rules, slowest first. The
+                 costs contain the calls and CPU seconds of the rule and
+                 of each of its select steps.
+        """
+
+        with self._lock:
+            rules = list(self._get_rules().items())
+        rules.sort(key=lambda r: r[1]["seconds"], reverse=True)
+        return rules[:n]
+
+    def format_slowest_rules(self: Metrics, n: int) -> str:
+        """
+        Return a readable report of the rules which took the most CPU time.
+
+        :param n: The number of rules.
+
+        :return: The report.
+        """
+
+        lines = [f"Top {n} slowest rules (CPU seconds, calls):"]
+        for rank, (rule, cost) in enumerate(self.slowest_rules(n), 1):
+            lines.append(f"{rank:>3}. {cost['seconds']:.6f}s "
+                         f"{cost['calls']:>8} {rule}")
+            # Steps of the chain are listed from the slowest
+            for step, stats in sorted(cost["steps"].items(),
+                                      key=lambda s: s[1]["seconds"],
+                                      reverse=True):
+                lines.append(f"     {stats['seconds']:.6f}s "
+                             f"{stats['calls']:>8}   {step}")
+        return "\n".join(lines)
+
+    def report(self: Metrics) -> dict[str,Any]:
+        """
+        Return the run report.
+
+        :return: The json serializable report.
+        """
+
+        with self._lock:
+            return {"start": self._start,
+                    "duration": time() - self._start,
+                    "stages": dict((stage, {"calls": calls,
+                                            "seconds": seconds})
+                                   for stage, (calls, seconds)
+                                   in sorted(self._stages.items())),
+                    "counters": dict(sorted(self._counters.items())),
+                    "statuses": dict((str(code), n) for code, n
+                                     in sorted(self._statuses.items())),
+                    "urls": dict((url, dict(values))
+                                 for url, values in self._urls.items()),
+                    "rules": self._get_rules()}
+
+    def _get_rules(self: Metrics) -> dict[str,dict[str,Any]]:
+        """
+        Return the costs of the rules. The lock has to be held.
+
+        :return: The json serializable costs by the rules' paths.
+        """
+
+        return dict((rule, {"calls": cost["calls"],
+                            "seconds": cost["seconds"],
+                            "steps": dict((step, {"calls": calls,
+                                                  "seconds": seconds})
+                                          for step, (calls, seconds)
+                                          in sorted(cost["steps"].items()))})
+                    for rule, cost in self._rules.items())
+
+    def to_prometheus(self: Metrics) -> str:
+        """
+        Return the metrics in the Prometheus text format. Urls are left
+        out, so the number of series doesn't grow with the config.
+
+        :return: The metrics.
+        """
+
+        report = self.report()
+        lines = ["# HELP crawler_run_duration_seconds Duration of the run.",
+                 "# TYPE crawler_run_duration_seconds gauge",
+                 f"crawler_run_duration_seconds {report['duration']}",
+                 "# HELP crawler_stage_seconds_total Time spent in a stage.",
+                 "# TYPE crawler_stage_seconds_total counter"]
+        lines += [f'crawler_stage_seconds_total{{stage="{stage}"}} '
+                  f'{stats["seconds"]}'
+                  for stage, stats in report["stages"].items()]
+        lines += ["# HELP crawler_stage_calls_total Number of times a stage "
+                  "was run.",
+                  "# TYPE crawler_stage_calls_total counter"]
+        lines += [f'crawler_stage_calls_total{{stage="{stage}"}} '
+                  f'{stats["calls"]}'
+                  for stage, stats in report["stages"].items()]
+        lines += ["# HELP crawler_events_total Counted events and amounts.",
+                  "# TYPE crawler_events_total counter"]
+        lines += [f'crawler_events_total{{counter="{counter}"}} {value}'
+                  for counter, value in report["counters"].items()]
+        lines += ["# HELP crawler_responses_total Responses by status code.",
+                  "# TYPE crawler_responses_total counter"]
+        lines += [f'crawler_responses_total{{status="{code}"}} {n}'
+                  for code, n in report["statuses"].items()]
+        return "\n".join(lines) + "\n"
+
+    def export(self: Metrics, path: str, format: str = "json") -> None:
+        """
+        Write the metrics to a file. The file is replaced at once, so
+        readers like the node exporter never see partial files.
+
+        :param path: The file's path.
+        :param format: json for the run report or prometheus for a
+                       Prometheus textfile.
+        """
+
+        assert format in ["json", "prometheus"], "Unknown metrics format"
+
+        with open(f"{path}.tmp", "w") as file:
+            if format == "json":
+                dump(self.report(), file)
+            else:
+                file.write(self.to_prometheus())
+        replace(f"{path}.tmp", path)
+
+
+# Metrics of the current run, disabled by default
+_metrics: NullMetrics = NullMetrics()
+
+
+def get_metrics() -> NullMetrics:
+    """
+    Return the metrics the crawler records to.
+
+    :return: The metrics.
+    """
+
+    return _metrics
+
+
+def set_metrics(metrics: Optional[NullMetrics]) -> None:
+    """
+    Set the metrics the crawler records to.
+
+    :param metrics: The metrics or None to disable them.
+    """
+
+    global _metrics
+    _metrics = NullMetrics() if metrics is None else metrics
+
+
+def timed(stage: str) -> Callable[[Callable],Callable]:
+    """
+    Return a decorator measuring the time spent in a function as a stage.
+
+    :param stage: The stage's name.
+
+    :return: The decorator.
+    """
+
+    def decorator(fun: Callable) -> Callable:
+        @wraps(fun)
+        def wrapper(*args: Any, **kwargs: Any) -> Any:
+            with get_metrics().time(stage):
+                return fun(*args, **kwargs)
+        return wrapper
+    return decorator
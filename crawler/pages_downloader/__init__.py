@@ -1,2 +1,6 @@
 from .base_downloader import BaseDownloader
+from .host_scheduler import HostScheduler
+from .host_dispatcher import HostDispatcher
 from .futures_downloader import FuturesDownloader
+from .async_downloader import AsyncDownloader
+from .stream_parser import StreamParser, ResponseTooLarge
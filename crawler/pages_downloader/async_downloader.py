@@ -0,0 +1,263 @@
+from __future__ import annotations
+
+from asyncio import Semaphore, new_event_loop, run_coroutine_threadsafe
+from concurrent.futures import Future
+from datetime import timedelta
+from threading import Thread
+from typing import Any, Callable, Iterable, Optional
+
+from aiohttp import ClientSession, TCPConnector
+from requests import Response
+from requests.structures import CaseInsensitiveDict
+from requests.utils import get_encoding_from_headers
+
+from ..metrics import get_metrics
+from .base_downloader import BaseDownloader, MAX_PENDING
+from .host_scheduler import HostScheduler
+from .stream_parser import CHUNK_SIZE, StreamParser
+
+
+class AsyncDownloader(BaseDownloader):
+    """
+    Downloads web pages with asyncio and acts as an iterator over them.
+    All requests run on a single event loop in a background thread, so
+    the number of requests in flight is only bounded by the concurrency
+    limit and not by the size of a thread pool. The download starts as
+    soon as init_download is called. The iterator blocks and returns the
+    next result as soon as it is available.
+    The requests are scheduled per host by a HostScheduler. The event loop
+    and the session are reused by later calls of init_download until the
+    downloader is closed.
+    """
+
+    __slots__ = ["_scheduler", "_loop", "_thread", "_semaphore", "_session"]
+
+    def init_download(self: AsyncDownloader, urls: Iterable[str],
+                      max_concurrency: int = 100,
+                      max_pending: int = MAX_PENDING,
+                      session_kwargs: dict = {},
+                      get_kwargs: dict = {},
+                      url_headers: dict[str,dict[str,str]] = {},
+                      scheduler: HostScheduler = None, stream: bool = False,
+                      max_bytes: Optional[int] = None,
+                      stop_tests: Callable[[str],Optional[list]] = None
+                     ) -> None:
+        """
+        Initialize and start the downloader with the respective URLs and
+        arguments. The session is only created by the first call, later
+        calls ignore the arguments configuring it.
+
+        :param urls: The urls to download the web pages from.
+        :param max_concurrency: The maximum number of requests in flight
+        at the same time.
+        :param max_pending: The maximum number of pages submitted but not
+        returned by the iterator yet.
+        :param session_kwargs: Passed to aiohttp.ClientSession.__init__ as
+        kwargs. ClientSession is used internally to download the web pages.
+        :param get_kwargs: Passed to aiohttp.ClientSession.get as kwargs.
+        :param url_headers: Dictionary mapping urls to additional request
+        headers.
+        :param scheduler: The scheduler limiting the requests per host.
+        :param stream: Whether the bodies are read in chunks and parsed by
+        lxml while they are downloaded. The parsed page is stored in the
+        response's tree attribute.
+        :param max_bytes: The maximum size of a body when streaming.
+        Larger responses are aborted with a ResponseTooLarge error.
+        :param stop_tests: Function returning the stop tests of a url
+        when streaming (see StreamParser). Downloads stop as soon as the
+        tests are passed.
+        """
+
+        assert max_concurrency > 0, "The concurrency limit has to be positive"
+        assert max_bytes is None or max_bytes > 0, \
+                "The maximum size has to be positive"
+        assert stream or (max_bytes is None and stop_tests is None), \
+                "Size limits and stop tests require streaming"
+
+        if getattr(self, "_loop", None) is None or self._loop.is_closed():
+            self._open(max_concurrency, session_kwargs, scheduler)
+        def submit(u: str) -> Future:
+            kwargs = BaseDownloader.get_request_kwargs(u, get_kwargs,
+                                                       url_headers)
+            get = (self._get_stream(u, kwargs, max_bytes, stop_tests)
+                   if stream else self._get(u, kwargs))
+            return run_coroutine_threadsafe(get, self._loop)
+
+        # Futures containing fully downloaded web pages
+        self._start_tracking(HostScheduler.order(urls), submit, max_pending)
+
+    def _open(self: AsyncDownloader, max_concurrency: int,
+              session_kwargs: dict, scheduler: HostScheduler) -> None:
+        """
+        Start the event loop and create the session used by all downloads
+        until the downloader is closed.
+
+        :param max_concurrency: The maximum number of requests in flight
+        at the same time.
+        :param session_kwargs: Passed to aiohttp.ClientSession.__init__ as
+        kwargs.
+        :param scheduler: The scheduler limiting the requests per host.
+        """
+
+        self._scheduler = scheduler or HostScheduler()
+
+        # Event loop running all downloads. Runs until close is called
+        self._loop = new_event_loop()
+        self._thread = Thread(target=self._loop.run_forever, daemon=True)
+        self._thread.start()
+        # Global limit for requests in flight
+        self._semaphore = Semaphore(max_concurrency)
+        # The session has to be created inside of the running loop
+        self._session: ClientSession = run_coroutine_threadsafe(
+                AsyncDownloader._create_session(max_concurrency,
+                                                self._scheduler.max_per_host,
+                                                session_kwargs),
+                self._loop).result()
+
+    @staticmethod
+    async def _create_session(max_concurrency: int, max_per_host: int,
+                              session_kwargs: dict) -> ClientSession:
+        """
+        Create the session used to download the web pages.
+
+        :param max_concurrency: The maximum number of open connections.
+        :param max_per_host: The maximum number of open connections per
+        host.
+        :param session_kwargs: Passed to aiohttp.ClientSession.__init__ as
+        kwargs.
+
+        :return: The created session.
+        """
+
+        return ClientSession(connector=TCPConnector(limit=max_concurrency,
+                                                    limit_per_host=max_per_host),
+                             **session_kwargs)
+
+    async def _get(self: AsyncDownloader, url: str,
+                   get_kwargs: dict) -> Response:
+        """
+        Download a single web page.
+
+        :param url: The web page's url.
+        :param get_kwargs: Passed to aiohttp.ClientSession.get as kwargs.
+
+        :return: The downloaded web page.
+        """
+
+        metrics = get_metrics()
+        start = self._loop.time()
+        # Wait for the host first to not block requests to other hosts
+        async with self._scheduler.async_slot(url), self._semaphore:
+            metrics.record("host_wait", self._loop.time() - start, url)
+            start = self._loop.time()
+            async with self._session.get(url, **get_kwargs) as resp:
+                elapsed = self._loop.time() - start
+                content = await resp.read()
+            metrics.record("download", self._loop.time() - start, url)
+
+        return AsyncDownloader._to_response(resp, content, elapsed)
+
+    async def _get_stream(self: AsyncDownloader, url: str, get_kwargs: dict,
+                          max_bytes: Optional[int],
+                          stop_tests: Callable[[str],Optional[list]]
+                         ) -> Response:
+        """
+        Download a single web page in chunks and parse it while it is
+        downloaded. The connection is closed if the body is not read
+        completely.
+
+        :param url: The web page's url.
+        :param get_kwargs: Passed to aiohttp.ClientSession.get as kwargs.
+        :param max_bytes: The maximum size of the body or None.
+        :param stop_tests: Function returning the stop tests of a url or
+        None.
+
+        :return: The downloaded web page with the parsed page.
+        """
+
+        # Getting the tests may wait for the config
+        tests = None
+        if stop_tests is not None:
+            tests = await self._loop.run_in_executor(None, stop_tests, url)
+
+        metrics = get_metrics()
+        start = self._loop.time()
+        async with self._scheduler.async_slot(url), self._semaphore:
+            metrics.record("host_wait", self._loop.time() - start, url)
+            start = self._loop.time()
+            async with self._session.get(url, **get_kwargs) as resp:
+                elapsed = self._loop.time() - start
+                parser = StreamParser(
+                        str(resp.url),
+                        BaseDownloader.get_declared_encoding(resp.headers),
+                        max_bytes, tests)
+                try:
+                    parser.check_length(resp.headers.get("Content-Length",
+                                                         None))
+                    async for chunk in resp.content.iter_chunked(CHUNK_SIZE):
+                        if parser.feed(chunk):
+                            # The rest of the body is not needed
+                            resp.close()
+                            break
+                except Exception:
+                    resp.close()
+                    raise
+                content, tree = parser.close()
+            metrics.record("download", self._loop.time() - start, url)
+
+        response = AsyncDownloader._to_response(resp, content, elapsed)
+        response.tree = tree
+        return response
+
+    @staticmethod
+    def _to_response(resp: Any, content: bytes, elapsed: float) -> Response:
+        """
+        Convert an aiohttp response to a requests response, so the result
+        can be used exactly like the results of the other downloaders.
+
+        :param resp: The aiohttp response.
+        :param content: The response's body.
+        :param elapsed: Seconds between sending the request and receiving
+        the response headers.
+
+        :return: The requests response.
+        """
+
+        response = Response()
+        response.status_code = resp.status
+        response.reason = resp.reason
+        response.url = str(resp.url)
+        response.headers = CaseInsensitiveDict(resp.headers)
+        response.encoding = get_encoding_from_headers(response.headers)
+        response.elapsed = timedelta(seconds=elapsed)
+        response._content = content
+        return response
+
+    def close(self: AsyncDownloader) -> None:
+        """
+        Closes all open connections and stops the event loop.
+        """
+
+        self._stop_tracking()
+        if getattr(self, "_loop", None) is None or self._loop.is_closed():
+            return
+
+        # Close used session with all open connections
+        run_coroutine_threadsafe(self._session.close(), self._loop).result()
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join()
+        self._loop.close()
+
+    def __enter__(self: AsyncDownloader) -> AsyncDownloader:
+        """
+        Enable use in contexts.
+        """
+
+        return self
+
+    def __exit__(self: AsyncDownloader, *args: Any) -> None:
+        """
+        Enable use in contexts.
+        """
+
+        self.close()
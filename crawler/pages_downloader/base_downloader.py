@@ -2,30 +2,81 @@ from __future__ import annotations
 
 from abc import ABC, abstractmethod
 from concurrent.futures._base import Future
-from typing import Iterator, Generator
+from queue import SimpleQueue
+from threading import Lock, Semaphore, Thread
+from typing import Callable, Iterable, Iterator, Any, Mapping, Optional
 
 
 # Remove requirement for page to be returned as Future
 
+# Default maximum number of pages submitted but not returned yet
+MAX_PENDING = 1024
+
 
 class BaseDownloader(ABC):
     """
     Base class for all downloader classes.
     """
 
+    __slots__ = ["_done", "_lock", "_pending", "_window", "_feeding",
+                 "_stopped", "_error"]
+
     @abstractmethod
-    def init_download(self: BaseDownloader, urls: list[str], *args: Any,
+    def init_download(self: BaseDownloader, urls: Iterable[str], *args: Any,
                       **kwargs: Any) -> None:
         """
         Initialize the downloader with the respective URLs and arguments.
 
-        :param urls: The list of urls to download the web pages from
+        :param urls: The urls to download the web pages from. Downloads
+                     should start while the urls are still iterated
         :param args: Arbitrary arguments accepted by the child class
-        :param kwargs: Arbitrary keyword arguments accepted by the child class
+        :param kwargs: Arbitrary keyword arguments accepted by the child class.
+                       All child classes accept url_headers, a dictionary
+                       mapping urls to additional request headers (e.g.
+                       for conditional requests).
         """
 
         raise NotImplementedError()
 
+    @staticmethod
+    def get_request_kwargs(url: str, get_kwargs: dict,
+                           url_headers: dict[str,dict[str,str]]) -> dict:
+        """
+        Return the keyword arguments for the request of a single url with
+        the url's additional headers merged into the common headers.
+
+        :param url: The requested url.
+        :param get_kwargs: The keyword arguments shared by all requests.
+        :param url_headers: Dictionary mapping urls to additional headers.
+
+        :return: The keyword arguments for the request.
+        """
+
+        if url not in url_headers:
+            return get_kwargs
+
+        headers = dict(get_kwargs.get("headers", None) or {})
+        headers.update(url_headers[url])
+        return {**get_kwargs, "headers": headers}
+
+    @staticmethod
+    def get_declared_encoding(headers: Mapping[str,str]) -> Optional[str]:
+        """
+        Return the charset of a response's Content-Type header. Unlike
+        requests, no default encoding is assumed, so the parsers can use
+        the encoding declared in the page instead.
+
+        :param headers: The response's headers.
+
+        :return: The declared encoding or None if there is none.
+        """
+
+        for param in headers.get("Content-Type", "").split(";")[1:]:
+            name, _, value = param.partition("=")
+            if name.strip().lower() == "charset":
+                return value.strip().strip("\"'") or None
+        return None
+
     def __enter__(self: BaseDownloader) -> BaseDownloader:
         """
         Enable use in contexts.
@@ -40,19 +91,110 @@ class BaseDownloader(ABC):
 
         pass
 
-    @abstractmethod
+    def _start_tracking(self: BaseDownloader, urls: Iterable[str],
+                        submit: Callable[[str],Future],
+                        max_pending: int = MAX_PENDING) -> None:
+        """
+        Start the downloads of the urls in a background thread, so
+        init_download returns immediately. A download is only started
+        when less than max_pending pages were submitted but not returned
+        by the iterator yet, so the pages kept in memory are bounded.
+        Must be called by init_download.
+
+        :param urls: The urls to download the web pages from.
+        :param submit: Function starting the download of a url and
+                       returning the future containing the page.
+        :param max_pending: The maximum number of pages submitted but not
+                            returned by the iterator yet.
+        """
+
+        assert max_pending > 0, "The number of pending pages has to be positive"
+
+        # Futures in the order they completed, None after the last url
+        self._done: SimpleQueue[Optional[Future]] = SimpleQueue()
+        # Protects the attributes below
+        self._lock = Lock()
+        # Number of submitted futures that were not returned yet
+        self._pending = 0
+        # Released as soon as the iterator returns a future
+        self._window = Semaphore(max_pending)
+        # Whether urls may still be submitted
+        self._feeding = True
+        self._stopped = False
+        # Raised by the iterator if reading the urls failed
+        self._error: Optional[Exception] = None
+        Thread(target=self._feed, args=(urls, submit), daemon=True).start()
+
+    def _feed(self: BaseDownloader, urls: Iterable[str],
+              submit: Callable[[str],Future]) -> None:
+        """
+        Submit the downloads of the urls. Only the iterator keeps a
+        reference to a future, so the page is released as soon as it was
+        processed.
+
+        :param urls: The urls to download the web pages from.
+        :param submit: Function starting the download of a url and
+                       returning the future containing the page.
+        """
+
+        try:
+            for url in urls:
+                self._window.acquire()
+                if self._stopped:
+                    break
+                future = submit(url)
+                future.original_url = url
+                with self._lock:
+                    self._pending += 1
+                future.add_done_callback(self._done.put)
+        except Exception as e:
+            with self._lock:
+                self._error = e
+        finally:
+            with self._lock:
+                self._feeding = False
+            # Wakes up the iterator if it waits for the next page
+            self._done.put(None)
+
+    def _stop_tracking(self: BaseDownloader) -> None:
+        """
+        Stop submitting the remaining urls. Should be called when the
+        downloader is closed.
+        """
+
+        if getattr(self, "_window", None) is None:
+            return
+
+        self._stopped = True
+        self._window.release()
+
     def __iter__(self: BaseDownloader) -> Iterator[Future]:
         """
-        Enable conversion to iterator. Must return iterator from the
-        start in concurrent calls.
+        Enable conversion to iterator. Iterating consumes the downloaded
+        pages, every page is only returned once.
         """
 
-        raise NotImplementedError()
+        return self
 
-    @abstractmethod
     def __next__(self: BaseDownloader) -> Future:
         """
-        Enable use as iterable. Must be reusable after last element
+        Enable use as iterable. Blocks until the next page is downloaded.
         """
 
-        raise NotImplementedError()
+        while True:
+            with self._lock:
+                if self._error is not None:
+                    error, self._error = self._error, None
+                    raise error
+                if not self._feeding and not self._pending:
+                    raise StopIteration()
+
+            future = self._done.get()
+            # The urls were read completely
+            if future is None:
+                continue
+
+            with self._lock:
+                self._pending -= 1
+            self._window.release()
+            return future
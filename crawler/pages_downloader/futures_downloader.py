@@ -1,15 +1,35 @@
 from __future__ import annotations
 
-from concurrent.futures import as_completed
-from concurrent.futures._base import Future
+from concurrent.futures import Future, ThreadPoolExecutor
+from functools import partial
+from requests import Response, Session
+from requests.adapters import HTTPAdapter
 from requests_futures.sessions import FuturesSession
-from typing import Iterator, Generator, Any
+from typing import Any, Callable, Iterable, Optional
 
-from .base_downloader import BaseDownloader
+from ..metrics import get_metrics
+from .base_downloader import BaseDownloader, MAX_PENDING
+from .host_dispatcher import HostDispatcher
+from .host_scheduler import HostScheduler, ORDER_WINDOW
+from .stream_parser import CHUNK_SIZE, StreamParser
 
 
 # TODO Maybe remove cookies by passing custom subclass of Session to FuturesSessions
-# TODO Use __slots__
+
+
+class TimedSession(Session):
+    """
+    Session recording the duration of every request.
+    """
+
+    def request(self: TimedSession, method: str, url: str, *args: Any,
+                **kwargs: Any) -> Response:
+        """
+        Send a request and record its duration.
+        """
+
+        with get_metrics().time("download", url):
+            return super().request(method, url, *args, **kwargs)
 
 
 class FuturesDownloader(BaseDownloader):
@@ -17,37 +37,158 @@ class FuturesDownloader(BaseDownloader):
     Downloads web pages concurrently and acts as an iterator over them
     The download starts as soon as init_download is called. The iterator
     blocks and returns the next result as soon as it is available.
+    The requests are scheduled per host by a HostScheduler and only handed
+    to the threads when their host allows them, so the threads never wait
+    for a host. Every host gets its own connection pool. The sessions are
+    reused by later calls of init_download until the downloader is closed.
     """
 
-    def init_download(self: FuturesDownloader, urls: list[str],
-                      futures_session_kwargs: dict = {}, get_kwargs: dict = {}
+    __slots__ = ["_scheduler", "_timed_session", "_executor", "_dispatcher",
+                 "_session"]
+
+    def init_download(self: FuturesDownloader, urls: Iterable[str],
+                      futures_session_kwargs: dict = {}, get_kwargs: dict = {},
+                      url_headers: dict[str,dict[str,str]] = {},
+                      max_concurrency: int = 8,
+                      max_pending: int = MAX_PENDING,
+                      scheduler: HostScheduler = None, stream: bool = False,
+                      max_bytes: Optional[int] = None,
+                      stop_tests: Callable[[str],Optional[list]] = None
                      ) -> None:
         """
         Initialize and start the downloader with the respective URLs and
-        arguments.
+        arguments. The sessions are only created by the first call, later
+        calls ignore the arguments configuring them.
 
-        :param urls: The list of urls to download the web pages from.
+        :param urls: The urls to download the web pages from.
         :param futures_session_kwargs: Passed to
         requests_futures.sessions.FuturesSession.__init__ as kwargs.
         FuturesSession is used internally to download the web pages.
+        :param get_kwargs: Passed to FuturesSession.get as kwargs.
+        :param url_headers: Dictionary mapping urls to additional request
+        headers.
+        :param max_concurrency: The number of threads downloading the pages.
+        :param max_pending: The maximum number of pages submitted but not
+        returned by the iterator yet.
+        :param scheduler: The scheduler limiting the requests per host.
+        :param stream: Whether the bodies are read in chunks and parsed by
+        lxml while they are downloaded. The parsed page is stored in the
+        response's tree attribute.
+        :param max_bytes: The maximum size of a body when streaming.
+        Larger responses are aborted with a ResponseTooLarge error.
+        :param stop_tests: Function returning the stop tests of a url
+        when streaming (see StreamParser). Downloads stop as soon as the
+        tests are passed.
+        """
+
+        assert max_concurrency > 0, "The concurrency limit has to be positive"
+        assert max_bytes is None or max_bytes > 0, \
+                "The maximum size has to be positive"
+        assert stream or (max_bytes is None and stop_tests is None), \
+                "Size limits and stop tests require streaming"
+
+        if getattr(self, "_session", None) is None:
+            self._open(futures_session_kwargs, max_concurrency, scheduler)
+        def submit(u: str) -> Future:
+            kwargs = BaseDownloader.get_request_kwargs(u, get_kwargs,
+                                                       url_headers)
+            if stream:
+                # The body is read by the hook in the downloading thread
+                kwargs = {**kwargs, "stream": True, "hooks": {
+                        "response": partial(FuturesDownloader._read_body,
+                                            original_url=u,
+                                            max_bytes=max_bytes,
+                                            stop_tests=stop_tests)}}
+            return self._dispatcher.submit(
+                    u, partial(self._session.get, u, **kwargs))
+
+        # Futures containing fully downloaded web pages
+        self._start_tracking(HostScheduler.order(urls), submit, max_pending)
+
+    @staticmethod
+    def _read_body(response: Response, *args: Any, original_url: str,
+                   max_bytes: Optional[int],
+                   stop_tests: Callable[[str],Optional[list]],
+                   **kwargs: Any) -> Response:
+        """
+        Read the body of a streamed response in chunks and parse it while
+        it is downloaded. The connection is closed if the body is not read
+        completely.
+
+        :param response: The streamed response.
+        :param original_url: The requested url.
+        :param max_bytes: The maximum size of the body or None.
+        :param stop_tests: Function returning the stop tests of a url or
+        None.
+
+        :return: The response with its body and the parsed page.
+        """
+
+        # Redirects are followed by requests
+        if response.is_redirect:
+            return response
+
+        parser = StreamParser(
+                response.url,
+                BaseDownloader.get_declared_encoding(response.headers),
+                max_bytes, stop_tests and stop_tests(original_url))
+        try:
+            parser.check_length(response.headers.get("Content-Length", None))
+            for chunk in response.iter_content(CHUNK_SIZE):
+                if parser.feed(chunk):
+                    # The rest of the body is not needed
+                    response.close()
+                    break
+        except Exception:
+            response.close()
+            raise
+
+        response._content, response.tree = parser.close()
+        response._content_consumed = True
+        return response
+
+    def _open(self: FuturesDownloader, futures_session_kwargs: dict,
+              max_concurrency: int, scheduler: HostScheduler) -> None:
+        """
+        Create the sessions used by all downloads until the downloader is
+        closed.
+
+        :param futures_session_kwargs: Passed to
+        requests_futures.sessions.FuturesSession.__init__ as kwargs.
+        :param max_concurrency: The number of threads downloading the pages.
+        :param scheduler: The scheduler limiting the requests per host.
         """
 
+        self._scheduler = scheduler or HostScheduler()
+        # Session sending the requests with one connection pool per host
+        self._timed_session = TimedSession()
+        # Keep the pools of all hosts that can be ordered at the same time
+        adapter = HTTPAdapter(pool_connections=ORDER_WINDOW,
+                              pool_maxsize=self._scheduler.max_per_host)
+        self._timed_session.mount("http://", adapter)
+        self._timed_session.mount("https://", adapter)
+        self._executor = ThreadPoolExecutor(max_workers=max_concurrency)
+        self._dispatcher = HostDispatcher(self._scheduler, self._executor)
         # Session used to fetch web pages. Only stored to gracefully close it later
-        self._session: FuturesSession = FuturesSession(*futures_session_kwargs)
-        # Iterator over all Futures containing fully downloaded web pages
-        futures = []
-        for u in urls:
-            futures.append(self._session.get(u, **get_kwargs))
-            futures[-1].original_url = u
-        self._futures: Iterator[Future] = futures
+        self._session: FuturesSession = FuturesSession(
+                executor=self._executor, session=self._timed_session,
+                **futures_session_kwargs)
 
     def close(self: FuturesDownloader) -> None:
         """
         Closes all open connections.
         """
 
-        # Close used session with all open connections
+        self._stop_tracking()
+        if getattr(self, "_session", None) is None:
+            return
+
+        # Close used sessions with all open connections
+        self._dispatcher.close()
+        self._executor.shutdown(cancel_futures=True)
         self._session.close()
+        self._timed_session.close()
+        self._session = None
 
     def __enter__(self: FuturesDownloader) -> FuturesDownloader:
         """
@@ -62,24 +203,3 @@ class FuturesDownloader(BaseDownloader):
         """
 
         self.close()
-
-    def __iter__(self: FuturesDownloader) -> Generator[Future,None,None]:
-        """
-        Enable conversion to iterator.
-        """
-
-        return as_completed(self._futures)
-
-    def __next__(self: FuturesDownloader) -> Future:
-        """
-        Enable use as iterable.
-        """
-
-        if not hasattr(self.__next__, "it"):
-            self.__next__.it = as_completed(self._futures)
-
-        try:
-            return next(self.__next__.it)
-        except StopIteration as e:
-            del self.__next__.it
-            raise e
@@ -0,0 +1,172 @@
+from __future__ import annotations
+
+from collections import OrderedDict, deque
+from concurrent.futures import Executor, Future
+from math import inf
+from sys import stderr
+from threading import Condition, Thread
+from time import monotonic
+from traceback import print_exception
+from typing import Callable, Optional
+
+from ..metrics import get_metrics
+from .host_scheduler import HostScheduler
+
+
+class HostDispatcher:
+    """
+    Starts requests as soon as the limits of their host allow them. A
+    single thread waits for the hosts, so the threads sending the requests
+    never wait for a host and requests to a host with a long delay don't
+    block the requests to other hosts.
+
+    :param scheduler: The scheduler limiting the requests per host.
+    :param executor: Executor downloading the hosts' robots.txt files.
+    """
+
+    __slots__ = ["_scheduler", "_executor", "_condition", "_waiting",
+                 "_fetching", "_closed", "_thread"]
+
+    def __init__(self: HostDispatcher, scheduler: HostScheduler,
+                 executor: Executor) -> None:
+        self._scheduler = scheduler
+        self._executor = executor
+        # Protects the attributes below and wakes up the dispatching thread
+        self._condition = Condition()
+        # Requests waiting for their host, hosts in the order they are tried
+        self._waiting: OrderedDict[str,deque[tuple[
+                str,Callable[[],Future],Future,float]]] = OrderedDict()
+        # Hosts whose delay is being determined
+        self._fetching: set[str] = set()
+        self._closed = False
+        self._thread = Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def submit(self: HostDispatcher, url: str,
+               start: Callable[[],Future]) -> Future:
+        """
+        Start a request as soon as its host's limits allow it.
+
+        :param url: The requested url.
+        :param start: Function starting the request without blocking.
+
+        :return: Future containing the result of the request.
+        """
+
+        future = Future()
+        host = HostScheduler.get_host(url)
+        with self._condition:
+            self._waiting.setdefault(host, deque()).append(
+                    (url, start, future, monotonic()))
+            self._condition.notify()
+        return future
+
+    def _run(self: HostDispatcher) -> None:
+        """
+        Start the waiting requests until the dispatcher is closed.
+        """
+
+        with self._condition:
+            while not self._closed:
+                self._condition.wait(self._dispatch())
+
+    def _dispatch(self: HostDispatcher) -> Optional[float]:
+        """
+        Start every waiting request whose host's limits allow it. Must be
+        called with the condition acquired.
+
+        :return: The number of seconds until the next host may allow a
+                 request or None if only finished requests, new requests
+                 and known delays allow more requests.
+        """
+
+        timeout = inf
+        for host in list(self._waiting):
+            delay = self._scheduler.get_cached_delay(host)
+            if delay is None:
+                # The robots.txt is downloaded without blocking other hosts
+                if host not in self._fetching:
+                    self._fetching.add(host)
+                    self._executor.submit(self._fetch_delay, host)
+                continue
+
+            requests = self._waiting[host]
+            while requests:
+                wait = self._scheduler.try_acquire(host, delay)
+                if wait:
+                    timeout = min(timeout, wait)
+                    break
+                self._start(host, *requests.popleft())
+            if not requests:
+                del self._waiting[host]
+        return None if timeout == inf else timeout
+
+    def _start(self: HostDispatcher, host: str, url: str,
+               start: Callable[[],Future], future: Future,
+               queued: float) -> None:
+        """
+        Start a request whose host was acquired. The host is released as
+        soon as the request is finished.
+
+        :param host: The request's host.
+        :param url: The requested url.
+        :param start: Function starting the request without blocking.
+        :param future: Future receiving the result of the request.
+        :param queued: The time the request was submitted.
+        """
+
+        if not future.set_running_or_notify_cancel():
+            self._release(host)
+            return
+
+        get_metrics().record("host_wait", monotonic() - queued, url)
+        def finish(request: Future) -> None:
+            self._release(host)
+            if request.cancelled():
+                future.cancel()
+            elif request.exception() is not None:
+                future.set_exception(request.exception())
+            else:
+                future.set_result(request.result())
+
+        try:
+            start().add_done_callback(finish)
+        except Exception as e:
+            self._release(host)
+            future.set_exception(e)
+
+    def _release(self: HostDispatcher, host: str) -> None:
+        """
+        Release a host after a request and wake up the dispatching thread.
+
+        :param host: The request's host.
+        """
+
+        self._scheduler.release(host)
+        with self._condition:
+            self._condition.notify()
+
+    def _fetch_delay(self: HostDispatcher, host: str) -> None:
+        """
+        Determine a host's delay and wake up the dispatching thread.
+
+        :param host: The host.
+        """
+
+        try:
+            self._scheduler.get_delay(host)
+        except Exception as e:
+            print_exception(None, e, e.__traceback__, file=stderr)
+        with self._condition:
+            self._fetching.discard(host)
+            self._condition.notify()
+
+    def close(self: HostDispatcher) -> None:
+        """
+        Stop the dispatching thread. Waiting requests are not started.
+        """
+
+        with self._condition:
+            self._closed = True
+            self._condition.notify()
+        self._thread.join()
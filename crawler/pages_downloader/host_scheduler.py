@@ -0,0 +1,257 @@
+from __future__ import annotations
+
+from asyncio import (AbstractEventLoop, Semaphore as AsyncSemaphore,
+                     get_running_loop, sleep as async_sleep)
+from contextlib import asynccontextmanager
+from collections import OrderedDict, deque
+from math import inf
+from threading import Lock
+from time import monotonic
+from typing import AsyncIterator, Iterable, Iterator, Optional
+from urllib.parse import urlsplit
+from urllib.request import urlopen
+from urllib.robotparser import RobotFileParser
+from weakref import WeakKeyDictionary
+
+
+# Number of urls read ahead to order them by host
+ORDER_WINDOW = 1024
+
+
+class HostScheduler:
+    """
+    Schedules the requests of a downloader per host. Limits the number of
+    concurrent requests to the same host and the time between them, so
+    many urls of the same site can be downloaded without being throttled
+    while urls of different hosts are still downloaded concurrently.
+    The crawl delays from the hosts' robots.txt files are fetched once per
+    host and cached.
+
+    :param max_per_host: Maximum number of concurrent requests per host.
+    :param min_delay: Minimum number of seconds between the starts of two
+                      requests to the same host.
+    :param obey_robots: Whether a longer crawl delay from a host's
+                        robots.txt is used instead of min_delay.
+    :param user_agent: The user agent whose crawl delay is used.
+    :param robots_timeout: Timeout in seconds for downloading a robots.txt.
+    """
+
+    __slots__ = ["_max_per_host", "_min_delay", "_obey_robots", "_user_agent",
+                 "_robots_timeout", "_lock", "_delays", "_delay_locks",
+                 "_next_start", "_running", "_async_semaphores"]
+
+    def __init__(self: HostScheduler, max_per_host: int = 8,
+                 min_delay: float = 0, obey_robots: bool = True,
+                 user_agent: str = "*", robots_timeout: float = 5) -> None:
+        assert max_per_host > 0, "The concurrency limit has to be positive"
+        assert min_delay >= 0, "The delay can't be negative"
+
+        self._max_per_host = max_per_host
+        self._min_delay = min_delay
+        self._obey_robots = obey_robots
+        self._user_agent = user_agent
+        self._robots_timeout = robots_timeout
+        # Protects the dictionaries below
+        self._lock = Lock()
+        # Cached delays per host
+        self._delays: dict[str,float] = {}
+        # Ensure every robots.txt is only downloaded once
+        self._delay_locks: dict[str,Lock] = {}
+        # Earliest time the next request to a host may start
+        self._next_start: dict[str,float] = {}
+        # Number of running requests per host
+        self._running: dict[str,int] = {}
+        # Asyncio semaphores are bound to the loop they are first used in
+        self._async_semaphores: WeakKeyDictionary[
+                AbstractEventLoop,dict[str,AsyncSemaphore]] = \
+                WeakKeyDictionary()
+
+    @property
+    def max_per_host(self: HostScheduler) -> int:
+        """
+        The maximum number of concurrent requests per host.
+        """
+
+        return self._max_per_host
+
+    @staticmethod
+    def get_host(url: str) -> str:
+        """
+        Return the host a url belongs to.
+
+        :param url: The url.
+
+        :return: The url's scheme and network location.
+        """
+
+        parts = urlsplit(url)
+        return f"{parts.scheme}://{parts.netloc.lower()}"
+
+    @staticmethod
+    def order(urls: Iterable[str], window: int = ORDER_WINDOW
+             ) -> Iterator[str]:
+        """
+        Order urls alternating between hosts, so requests waiting for the
+        same host don't block requests to other hosts. Only the next urls
+        are reordered, so urls can still be read while they are ordered.
+
+        :param urls: The urls.
+        :param window: The number of urls read ahead.
+
+        :return: Iterator over the reordered urls.
+        """
+
+        urls = iter(urls)
+        # Hosts in the order their next url is returned
+        groups: OrderedDict[str,deque[str]] = OrderedDict()
+        buffered = 0
+        for url in urls:
+            groups.setdefault(HostScheduler.get_host(url), deque()).append(url)
+            buffered += 1
+            if buffered >= window:
+                break
+
+        while groups:
+            host, group = groups.popitem(last=False)
+            yield group.popleft()
+            if group:
+                groups[host] = group
+            url = next(urls, None)
+            if url is not None:
+                groups.setdefault(HostScheduler.get_host(url),
+                                  deque()).append(url)
+
+    def get_cached_delay(self: HostScheduler, host: str) -> Optional[float]:
+        """
+        Return the minimum number of seconds between two requests to a
+        host if it is already known.
+
+        :param host: The host.
+
+        :return: The delay in seconds or None if the host's robots.txt was
+                 not downloaded yet.
+        """
+
+        return self._delays.get(host, None)
+
+    def get_delay(self: HostScheduler, host: str) -> float:
+        """
+        Return the minimum number of seconds between two requests to a
+        host. Downloads the host's robots.txt on the first call.
+
+        :param host: The host.
+
+        :return: The delay in seconds.
+        """
+
+        if host in self._delays:
+            return self._delays[host]
+
+        with self._lock:
+            lock = self._delay_locks.setdefault(host, Lock())
+        with lock:
+            if host not in self._delays:
+                delay = self._min_delay
+                if self._obey_robots:
+                    delay = max(delay, self.get_robots_delay(host))
+                self._delays[host] = delay
+        return self._delays[host]
+
+    def get_robots_delay(self: HostScheduler, host: str) -> float:
+        """
+        Download a host's robots.txt and return its crawl delay.
+
+        :param host: The host.
+
+        :return: The crawl delay in seconds or 0 if there is none.
+        """
+
+        robots = RobotFileParser()
+        try:
+            with urlopen(f"{host}/robots.txt",
+                         timeout=self._robots_timeout) as response:
+                robots.parse(response.read().decode("utf-8",
+                                                    "replace").splitlines())
+        except Exception as e:
+            return 0
+
+        delay = robots.crawl_delay(self._user_agent) or 0
+        rate = robots.request_rate(self._user_agent)
+        if rate and rate.requests:
+            delay = max(delay, rate.seconds / rate.requests)
+        return float(delay)
+
+    def reserve(self: HostScheduler, host: str, delay: float) -> float:
+        """
+        Reserve the next start time for a request to a host.
+
+        :param host: The host.
+        :param delay: The host's delay.
+
+        :return: The number of seconds to wait before the request starts.
+        """
+
+        with self._lock:
+            now = monotonic()
+            start = max(now, self._next_start.get(host, now))
+            self._next_start[host] = start + delay
+        return start - now
+
+    def try_acquire(self: HostScheduler, host: str, delay: float) -> float:
+        """
+        Start a request to a host if the host's limits allow it. Never
+        blocks, every started request has to be released.
+
+        :param host: The host.
+        :param delay: The host's delay.
+
+        :return: 0 if the request was started, otherwise the number of
+                 seconds until it may start or infinity if it has to wait
+                 for a running request to the host.
+        """
+
+        with self._lock:
+            if self._running.get(host, 0) >= self._max_per_host:
+                return inf
+            now = monotonic()
+            start = self._next_start.get(host, now)
+            if start > now:
+                return start - now
+            self._next_start[host] = now + delay
+            self._running[host] = self._running.get(host, 0) + 1
+        return 0
+
+    def release(self: HostScheduler, host: str) -> None:
+        """
+        Finish a request started by try_acquire.
+
+        :param host: The request's host.
+        """
+
+        with self._lock:
+            self._running[host] -= 1
+            if not self._running[host]:
+                del self._running[host]
+
+    @asynccontextmanager
+    async def async_slot(self: HostScheduler, url: str) -> AsyncIterator[None]:
+        """
+        Asynchronous context in which a request to the url may run. Waits
+        until the host's limits allow the request. Requests in different
+        event loops are limited separately.
+
+        :param url: The requested url.
+        """
+
+        host = HostScheduler.get_host(url)
+        delay = self._delays.get(host, None)
+        if delay is None:
+            delay = await get_running_loop().run_in_executor(
+                    None, self.get_delay, host)
+        semaphores = self._async_semaphores.setdefault(get_running_loop(), {})
+        semaphore = semaphores.setdefault(host,
+                                          AsyncSemaphore(self._max_per_host))
+
+        async with semaphore:
+            await async_sleep(self.reserve(host, delay))
+            yield
@@ -0,0 +1,148 @@
+from __future__ import annotations
+
+from typing import Callable, Optional
+from lxml.etree import HTMLParser, HTMLPullParser, XMLSyntaxError, _Element
+
+
+# Number of bytes read from a response at once
+CHUNK_SIZE = 1 << 16
+
+
+class ResponseTooLarge(IOError):
+    """
+    Raised if the body of a response is larger than the allowed size.
+    """
+
+
+class StreamParser:
+    """
+    Collects the body of a response chunk by chunk and feeds every chunk
+    into an incremental lxml parser, so the page is parsed while it is
+    downloaded. Downloads can be aborted as soon as the body gets too
+    large or as soon as the tags selected by the page's rules were parsed
+    completely.
+
+    :param url: The requested url.
+    :param encoding: The encoding declared by the response's headers or
+                     None to detect it.
+    :param max_bytes: The maximum size of the decoded body or None for no
+                      limit.
+    :param stop_tests: Tests of the tags found by the first step of every
+                       rule's select chain or None if the whole body is
+                       needed.
+    """
+
+    __slots__ = ["_url", "_max_bytes", "_stop_tests",
+                 "_parser", "_chunks", "_size", "_found", "_unfinished",
+                 "stopped"]
+
+    def __init__(self: StreamParser, url: str, encoding: Optional[str],
+                 max_bytes: Optional[int] = None,
+                 stop_tests: Optional[list[Callable[[_Element],bool]]] = None
+                ) -> None:
+        self._url = url
+        self._max_bytes = max_bytes
+        self._stop_tests = stop_tests
+        try:
+            # Parser events are only needed to stop early
+            self._parser = (HTMLPullParser(events=("start", "end"),
+                                           encoding=encoding)
+                            if stop_tests else HTMLParser(encoding=encoding))
+        except LookupError:
+            # The page is parsed from the decoded body instead
+            self._parser = None
+        self._chunks: list[bytes] = []
+        self._size = 0
+        # First element passing each test
+        self._found: list[Optional[_Element]] = [None] * len(stop_tests or [])
+        # Found elements whose end tag was not parsed yet
+        self._unfinished: list[_Element] = []
+        # Whether the rest of the body is not needed
+        self.stopped = False
+
+    def check_size(self: StreamParser, size: int) -> None:
+        """
+        Abort the download if the body is too large.
+
+        :param size: The body's size.
+        """
+
+        if self._max_bytes is not None and size > self._max_bytes:
+            raise ResponseTooLarge(
+                    f"{self._url} is larger than {self._max_bytes} bytes")
+
+    def check_length(self: StreamParser, length: Optional[str]) -> None:
+        """
+        Abort the download before reading the body if its declared length
+        is too large. Compressed bodies are not larger than the decoded
+        ones.
+
+        :param length: The value of the Content-Length header or None if
+                       there is none.
+        """
+
+        if length is not None and length.strip().isdigit():
+            self.check_size(int(length))
+
+    def feed(self: StreamParser, chunk: bytes) -> bool:
+        """
+        Add the next chunk of the body.
+
+        :param chunk: The chunk.
+
+        :return: True if the rest of the body is not needed.
+        """
+
+        self._size += len(chunk)
+        self.check_size(self._size)
+        self._chunks.append(chunk)
+        if self._parser is None:
+            return False
+
+        try:
+            self._parser.feed(chunk)
+        except XMLSyntaxError:
+            # The page is parsed again from the collected body
+            self._parser = None
+            return False
+        if self._stop_tests:
+            self.stopped = self._is_satisfied()
+        return self.stopped
+
+    def _is_satisfied(self: StreamParser) -> bool:
+        """
+        Handle the parser's new events.
+
+        :return: True if every test was passed by an element which was
+                 parsed completely.
+        """
+
+        for event, element in self._parser.read_events():
+            if event == "end":
+                if element in self._unfinished:
+                    self._unfinished.remove(element)
+                continue
+            for i, test in enumerate(self._stop_tests):
+                if self._found[i] is None and test(element):
+                    self._found[i] = element
+                    if element not in self._unfinished:
+                        self._unfinished.append(element)
+        return None not in self._found and not self._unfinished
+
+    def close(self: StreamParser) -> tuple[bytes,Optional[_Element]]:
+        """
+        Finish parsing the collected body.
+
+        :return: The body and the root element of the parsed page or None
+                 if the page could not be parsed.
+        """
+
+        content = b"".join(self._chunks)
+        self._chunks = []
+        root = None
+        if self._parser is not None:
+            try:
+                root = self._parser.close()
+            except XMLSyntaxError:
+                pass
+        return content, root
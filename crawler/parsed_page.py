@@ -0,0 +1,176 @@
+from __future__ import annotations
+
+from codecs import lookup
+from typing import Any, Callable, Optional, Union
+from bs4 import BeautifulSoup, SoupStrainer
+from bs4.dammit import EncodingDetector
+from lxml.etree import ParserError, _Element
+from lxml.html import HTMLParser, document_fromstring
+
+from .metrics import get_metrics
+
+
+# Encoding of pages without declared encoding, like requests assumes it
+DEFAULT_ENCODING = "iso-8859-1"
+
+class ParsedPage:
+    """
+    A page which is parsed by BeautifulSoup or lxml when its tree is used
+    for the first time. Pages whose select chains were all compiled for
+    lxml are never parsed by BeautifulSoup. Pages downloaded as bytes are
+    passed to the parsers undecoded, so they are decoded by the parsers
+    and never by Python.
+
+    :param content: The page's html or its raw content.
+    :param encoding: The encoding of a raw content declared by the server
+                     or None if the page declares it.
+    :param parse_only: Strainer restricting the tags parsed by
+                       BeautifulSoup or None to parse the whole page.
+    :param tree: The root element of the page if it was already parsed by
+                 lxml while it was downloaded.
+    """
+
+    __slots__ = ["_content", "_encoding", "_parse_only", "_soup", "_tree",
+                 "_tree_parsed", "results", "hashes"]
+
+    def __init__(self: ParsedPage, content: Union[str,bytes],
+                 encoding: Optional[str] = None,
+                 parse_only: Optional[SoupStrainer] = None,
+                 tree: Optional[_Element] = None) -> None:
+        self._content = content
+        self._encoding = (get_encoding(content, encoding)
+                          if isinstance(content, bytes) else None)
+        self._parse_only = parse_only
+        self._soup: Optional[BeautifulSoup] = None
+        self._tree = tree
+        self._tree_parsed = tree is not None
+        # Results of the select steps shared by several rules
+        self.results: dict[Any,Any] = {}
+        # Structural hashes of the selected tags by id
+        self.hashes: dict[int,tuple[Any,bytes]] = {}
+
+    @property
+    def content(self: ParsedPage) -> Union[str,bytes]:
+        """
+        The page's html or its raw content.
+        """
+
+        return self._content
+
+    @property
+    def soup(self: ParsedPage) -> BeautifulSoup:
+        """
+        The page parsed by BeautifulSoup. Only contains the tags allowed by
+        the strainer.
+        """
+
+        if self._soup is None:
+            with get_metrics().time("parse_soup"):
+                self._soup = BeautifulSoup(self._content, features="lxml",
+                                           parse_only=self._parse_only,
+                                           from_encoding=self._encoding)
+        return self._soup
+
+    @property
+    def tree(self: ParsedPage) -> Optional[_Element]:
+        """
+        The root element of the page parsed by lxml or None if lxml can't
+        parse the page.
+        """
+
+        if not self._tree_parsed:
+            with get_metrics().time("parse_lxml"):
+                self._parse_tree()
+        return self._tree
+
+    def _parse_tree(self: ParsedPage) -> None:
+        """
+        Parse the page with lxml.
+        """
+
+        self._tree_parsed = True
+        if isinstance(self._content, bytes):
+            self._tree = ParsedPage.parse_bytes(self._content, self._encoding)
+            return
+        try:
+            self._tree = document_fromstring(self._content)
+        except ValueError:
+            # Strings with an xml encoding declaration are parsed as bytes
+            self._tree = ParsedPage.parse_bytes(
+                    self._content.encode("utf-8", "surrogateescape"), "utf-8")
+        except ParserError:
+            pass
+
+    @staticmethod
+    def parse_bytes(content: bytes,
+                    encoding: Optional[str]) -> Optional[_Element]:
+        """
+        Parse a raw page with lxml.
+
+        :param content: The page's raw content.
+        :param encoding: The page's encoding or None to detect it.
+
+        :return: The root element of the page or None if lxml can't parse
+                 the page.
+        """
+
+        try:
+            return document_fromstring(content,
+                                       parser=HTMLParser(encoding=encoding))
+        except LookupError:
+            # Encodings lxml doesn't know are detected instead
+            return ParsedPage.parse_bytes(content, None) if encoding else None
+        except (ParserError, ValueError):
+            return None
+
+
+def get_encoding(content: bytes, encoding: Optional[str]) -> str:
+    """
+    Return the encoding a raw page is decoded with: the encoding declared
+    by the server, a byte order mark or the page itself, if Python knows
+    it, or the default encoding otherwise. Only the beginning of the page
+    is searched for a declaration.
+
+    :param content: The page's raw content.
+    :param encoding: The encoding declared by the server or None.
+
+    :return: The encoding's name.
+    """
+
+    for declared in [encoding,
+                     EncodingDetector.strip_byte_order_mark(content[:4])[1],
+                     EncodingDetector.find_declared_encoding(content,
+                                                             is_html=True)]:
+        try:
+            if declared is not None:
+                return lookup(declared).name
+        except LookupError:
+            continue
+    return DEFAULT_ENCODING
+
+
+def lazy_page(get_content: Callable[[],Optional[Union[str,bytes]]],
+              encoding: Optional[str] = None,
+              parse_only: Optional[SoupStrainer] = None
+             ) -> Callable[[],Optional[ParsedPage]]:
+    """
+    Create a function returning a page, which gets the page's content on
+    its first call.
+
+    :param get_content: Function returning the page's html or raw content
+                        or None if there is none.
+    :param encoding: The encoding of the raw content or None to detect it.
+    :param parse_only: Strainer restricting the tags parsed by
+                       BeautifulSoup or None to parse the whole page.
+
+    :return: Function returning the page or None if there is none.
+    """
+
+    page = []
+    def get_page() -> Optional[ParsedPage]:
+        if not page:
+            content = get_content()
+            page.append(None if content is None
+                        else ParsedPage(content, encoding, parse_only))
+        return page[0]
+    return get_page
@@ -0,0 +1,245 @@
+from __future__ import annotations
+
+from cProfile import Profile
+from collections import defaultdict
+from contextlib import nullcontext
+from hashlib import sha256
+from heapq import heappop, heappush
+from itertools import count
+from json import dump
+from os import makedirs, path
+from pstats import Stats
+from typing import Any, ContextManager, Optional
+
+
+# Returned for pages which are not profiled
+NULL_PROFILE = nullcontext()
+
+# Stacks are cut off below this depth
+MAX_DEPTH = 128
+# Frames with less time on a stack are left out of the collapsed stacks
+MIN_SECONDS = 1e-6
+# Maximum number of frames expanded into stacks. Functions reached over
+# many paths (e.g. diamond-shaped call graphs) would otherwise make the
+# number of stacks grow exponentially with their depth
+MAX_FRAMES = 100000
+
+
+class ProfileStats:
+    """
+    Stats of a profile recorded in another process. Can be loaded by
+    pstats.Stats like a profile.
+
+    :param stats: The stats of the profile after create_stats.
+    """
+
+    __slots__ = ["stats"]
+
+    def __init__(self: ProfileStats, stats: dict[tuple,Any]) -> None:
+        self.stats = stats
+
+    def create_stats(self: ProfileStats) -> None:
+        """
+        Called by pstats.Stats, the stats were already created.
+        """
+
+        pass
+
+
+class PageProfiler:
+    """
+    Profiles the processing of every page separately with cProfile. Only
+    a share of the urls is profiled, chosen by a stable hash of the url,
+    so the same pages are profiled in every run and the overhead stays
+    low for large configs. Profiles of pages processed in worker
+    processes are added as stats.
+
+    :param sample_rate: The share of urls which are profiled.
+    """
+
+    __slots__ = ["_sample_rate", "_profiles", "_stats"]
+
+    def __init__(self: PageProfiler, sample_rate: float = 1) -> None:
+        assert 0 <= sample_rate <= 1, "The sample rate has to be a share"
+
+        self._sample_rate = sample_rate
+        self._profiles: dict[str,Profile] = {}
+        # Stats of the profiles recorded in other processes
+        self._stats: dict[str,list[dict[tuple,Any]]] = defaultdict(list)
+
+    def is_sampled(self: PageProfiler, url: str) -> bool:
+        """
+        Return whether a url is profiled.
+
+        :param url: The url.
+
+        :return: True if the url is profiled.
+        """
+
+        if self._sample_rate <= 0:
+            return False
+        if self._sample_rate >= 1:
+            return True
+        share = int.from_bytes(sha256(url.encode()).digest()[:8], "big")
+        return share < self._sample_rate * (1 << 64)
+
+    def profile(self: PageProfiler, url: str) -> ContextManager[None]:
+        """
+        Return a context manager profiling the processing of a page. The
+        profiles of the same url are added up.
+
+        :param url: The page's url.
+
+        :return: The context manager.
+        """
+
+        if not self.is_sampled(url):
+            return NULL_PROFILE
+        if url not in self._profiles:
+            self._profiles[url] = Profile()
+        return self._profiles[url]
+
+    def add_stats(self: PageProfiler, url: str,
+                  stats: dict[tuple,Any]) -> None:
+        """
+        Add the stats of a profile of a page recorded in another process.
+
+        :param url: The page's url.
+        :param stats: The stats of the profile after create_stats.
+        """
+
+        self._stats[url].append(stats)
+
+    def write(self: PageProfiler, directory: str) -> None:
+        """
+        Write the profiles to a directory: total.pstats with the stats of
+        all pages added up, one pstats file per url in urls/ listed in
+        index.json with the url's total time, and the collapsed stacks of
+        all pages in total.collapsed and rooted at their url in
+        urls.collapsed for flamegraph tools.
+
+        :param directory: The directory's path.
+        """
+
+        makedirs(path.join(directory, "urls"), exist_ok=True)
+        total: Optional[Stats] = None
+        index = {}
+        total_stacks: dict[str,float] = defaultdict(float)
+        url_stacks: dict[str,float] = {}
+        urls = list(self._profiles) + [url for url in self._stats
+                                       if url not in self._profiles]
+        for url in urls:
+            # Loading the stats must not change the added stats
+            profiles = [ProfileStats(dict(s))
+                        for s in self._stats.get(url, [])]
+            if url in self._profiles:
+                profiles = [self._profiles[url]] + profiles
+            stats = Stats(*profiles)
+            name = f"{sha256(url.encode()).hexdigest()[:16]}.pstats"
+            stats.dump_stats(path.join(directory, "urls", name))
+            index[url] = {"file": name, "seconds": stats.total_tt}
+
+            stacks = get_collapsed_stacks(stats)
+            for stack, seconds in stacks.items():
+                total_stacks[stack] += seconds
+                url_stacks[f"{get_frame_name(url)};{stack}"] = seconds
+            if total is None:
+                total = stats
+            else:
+                total.add(stats)
+
+        with open(path.join(directory, "index.json"), "w") as file:
+            dump(index, file)
+        if total is not None:
+            total.dump_stats(path.join(directory, "total.pstats"))
+        write_collapsed_stacks(path.join(directory, "total.collapsed"),
+                               total_stacks)
+        write_collapsed_stacks(path.join(directory, "urls.collapsed"),
+                               url_stacks)
+
+
+def get_frame_name(name: str) -> str:
+    """
+    Return a frame name usable in collapsed stacks, which separate frames
+    by semicolons and end with a space and the count.
+
+    :param name: The name.
+
+    :return: The usable name.
+    """
+
+    return name.replace(";", ":").replace("\n", " ")
+
+
+def get_collapsed_stacks(stats: Stats) -> dict[str,float]:
+    """
+    Return the time spent in every stack of a profile. cProfile only
+    records the callers of every function, so the time of a function
+    called from several places is split between the stacks by the share
+    of the time spent in the calls from each caller. The stacks with the
+    most time are expanded first, at most MAX_FRAMES frames are expanded.
+
+    :param stats: The profile's stats.
+
+    :return: Dictionary mapping stacks, frames separated by semicolons,
+             to the seconds spent in the stack's last frame.
+    """
+
+    # Callees and the time spent in their calls by the caller
+    callees: dict[tuple,list[tuple[tuple,float]]] = defaultdict(list)
+    for fun, (_, _, _, _, callers) in stats.stats.items():
+        for caller, (_, _, _, cumtime) in callers.items():
+            callees[caller].append((fun, cumtime))
+
+    stacks: dict[str,float] = defaultdict(float)
+    # Frames to expand by the time of their stack, the counter keeps equal
+    # times from comparing the frames
+    frames: list[tuple[float,int,tuple,tuple[str,...],frozenset[tuple],
+                       float]] = []
+    order = count()
+    def push_frame(fun: tuple, stack: tuple[str,...],
+                   on_stack: frozenset[tuple], share: float) -> None:
+        heappush(frames, (-stats.stats[fun][3] * share, next(order), fun,
+                          stack, on_stack, share))
+
+    for fun, (_, _, _, _, callers) in stats.stats.items():
+        if not callers:
+            push_frame(fun, (), frozenset(), 1)
+
+    for _ in range(MAX_FRAMES):
+        if not frames:
+            break
+        _, _, fun, stack, on_stack, share = heappop(frames)
+        tottime = stats.stats[fun][2]
+        filename, line, name = fun
+        stack = stack + (get_frame_name(f"{name} ({filename}:{line})"),)
+        if tottime * share >= MIN_SECONDS:
+            stacks[";".join(stack)] += tottime * share
+        if len(stack) >= MAX_DEPTH:
+            continue
+
+        on_stack = on_stack | {fun}
+        for callee, call_time in callees[fun]:
+            callee_time = stats.stats[callee][3]
+            # Recursive calls are part of the outer call's time
+            if (callee in on_stack or not callee_time
+                    or call_time * share < MIN_SECONDS):
+                continue
+            push_frame(callee, stack, on_stack,
+                       min(1, call_time * share / callee_time))
+    return stacks
+
+
+def write_collapsed_stacks(file_path: str, stacks: dict[str,float]) -> None:
+    """
+    Write collapsed stacks, one stack per line followed by the time spent
+    in it in microseconds.
+
+    :param file_path: The file's path.
+    :param stacks: Dictionary mapping stacks to seconds.
+    """
+
+    with open(file_path, "w") as file:
+        for stack, seconds in sorted(stacks.items()):
+            if (microseconds := round(seconds * 1e6)):
+                file.write(f"{stack} {microseconds}\n")
@@ -0,0 +1,205 @@
+from __future__ import annotations
+
+from concurrent.futures import Future, ProcessPoolExecutor
+from contextlib import nullcontext
+from cProfile import Profile
+from multiprocessing import get_context
+from sys import stderr
+from traceback import print_exception
+from typing import Any, Callable, Optional, Union
+
+from .config_parser import Config
+from .config_parser.parse_only import get_strainer
+from .fragments import Fragment, dump_fragment
+from .metrics import Metrics, NullMetrics, get_metrics, set_metrics
+from .parsed_page import ParsedPage, lazy_page
+
+
+# Set in every worker process by _init_worker
+_config: Config = {}
+_get_changed_tags: Callable = None
+
+
+def _init_worker(config: Config, get_changed_tags: Callable) -> None:
+    """
+    Save the rules in the worker process.
+
+    :param config: The parsed config.
+    :param get_changed_tags: Function returning the new fragment of a rule
+                             and the new and old selected tags or None if
+                             they did not change.
+    """
+
+    global _config, _get_changed_tags
+    _config = config
+    _get_changed_tags = get_changed_tags
+
+
+def _select(url: str, content: Union[str,bytes], encoding: Optional[str],
+            old_content: Optional[Union[str,bytes]],
+            old_encoding: Optional[str],
+            saved_fragments: dict[str,dict[str,Any]],
+            record_metrics: bool = False, profile: bool = False
+           ) -> tuple[list[Optional[tuple[dict[str,Any],Optional[tuple[Fragment,Fragment]]]]],
+                      Optional[dict[str,Any]],Optional[dict[tuple,Any]]]:
+    """
+    Parse a page and run the select chains of all rules for the page's
+    url. The metrics and the profile of the page are recorded in the
+    worker and sent back with the results.
+
+    :param url: The page's url.
+    :param content: The downloaded page's raw content or html.
+    :param encoding: The downloaded page's declared encoding or None.
+    :param old_content: The saved page's raw content or html or None if it
+                        is not needed.
+    :param old_encoding: The saved page's declared encoding or None.
+    :param saved_fragments: Dictionary mapping rule keys to the saved
+                            fragments and their hashes.
+    :param record_metrics: Whether the metrics of the page are recorded.
+    :param profile: Whether the page is profiled.
+
+    :return: For each rule the new fragment with its hash and the new and
+             old selected tags as fragments or None if nothing changed.
+             None instead if the selection failed. Then the run report of
+             the page's metrics and the stats of its profile or None if
+             they were not recorded.
+    """
+
+    # Every page is recorded separately, so the parent adds it only once
+    metrics = Metrics() if record_metrics else NullMetrics()
+    set_metrics(metrics)
+    profiler = Profile() if profile else nullcontext()
+    with profiler:
+        results = _select_rules(url, content, encoding, old_content,
+                                old_encoding, saved_fragments)
+    if profile:
+        profiler.create_stats()
+    return (results, metrics.report() if record_metrics else None,
+            profiler.stats if profile else None)
+
+
+def _select_rules(url: str, content: Union[str,bytes],
+                  encoding: Optional[str],
+                  old_content: Optional[Union[str,bytes]],
+                  old_encoding: Optional[str],
+                  saved_fragments: dict[str,dict[str,Any]]
+                 ) -> list[Optional[tuple[dict[str,Any],Optional[tuple[Fragment,Fragment]]]]]:
+    """
+    Parse a page and run the select chains of all rules for the page's
+    url. Takes the same arguments as _select.
+
+    :return: For each rule the new fragment with its hash and the new and
+             old selected tags as fragments or None if nothing changed.
+             None instead if the selection failed.
+    """
+
+    # Only the tags the rules can reach are parsed
+    parse_only = get_strainer(_config[url])
+    page = ParsedPage(content, encoding, parse_only)
+    get_old_page = lazy_page(lambda: old_content, old_encoding, parse_only)
+
+    results = []
+    metrics = get_metrics()
+    for tfa in _config[url]:
+        try:
+            # Includes parsing the pages for the first rule
+            with metrics.time("select", url):
+                new_fragment, tags = _get_changed_tags(
+                        page, get_old_page, tfa,
+                        saved_fragments.get(tfa.key, None))
+        except Exception as e:
+            print_exception(None, e, e.__traceback__, file=stderr)
+            metrics.count("select_errors", url=url)
+            results.append(None)
+            continue
+        if tags is None:
+            results.append((new_fragment, None))
+            continue
+        # The new fragment may only be saved as hash
+        with metrics.rule_cost(tfa.path, calls=0):
+            results.append((new_fragment, (dump_fragment(tags[0]),
+                                           dump_fragment(tags[1]))))
+    return results
+
+
+class SelectPool:
+    """
+    Parses pages and runs their select chains in worker processes, so
+    parsing and selecting is not limited by the GIL. Only the selected
+    fragments are sent back.
+    The workers are forked to inherit the rules, which usually can't be
+    pickled, so the pool is only available on Unix systems. All workers
+    are forked when the pool is created, so it should be created before
+    other threads are started.
+
+    :param config: The parsed config.
+    :param get_changed_tags: Function returning the new fragment of a rule
+                             and the new and old selected tags or None if
+                             they did not change.
+    :param workers: The number of worker processes.
+    """
+
+    __slots__ = ["_executor"]
+
+    def __init__(self: SelectPool, config: Config,
+                 get_changed_tags: Callable, workers: int) -> None:
+        assert workers > 0, "The number of workers has to be positive"
+
+        self._executor = ProcessPoolExecutor(
+                max_workers=workers, mp_context=get_context("fork"),
+                initializer=_init_worker,
+                initargs=(config, get_changed_tags))
+        # Forking workers for the first task forks all of them
+        self._executor.submit(int).result()
+
+    def submit(self: SelectPool, url: str, content: Union[str,bytes],
+               encoding: Optional[str],
+               old_content: Optional[Union[str,bytes]],
+               old_encoding: Optional[str],
+               saved_fragments: dict[str,dict[str,Any]],
+               record_metrics: bool = False, profile: bool = False
+              ) -> Future:
+        """
+        Start selecting the fragments of a page in a worker process.
+
+        :param url: The page's url.
+        :param content: The downloaded page's raw content or html.
+        :param encoding: The downloaded page's declared encoding or None.
+        :param old_content: The saved page's raw content or html or None if
+                            it is not needed.
+        :param old_encoding: The saved page's declared encoding or None.
+        :param saved_fragments: Dictionary mapping rule keys to the saved
+                                fragments and their hashes.
+        :param record_metrics: Whether the metrics of the page are recorded.
+        :param profile: Whether the page is profiled.
+
+        :return: Future containing the results of _select.
+        """
+
+        future = self._executor.submit(_select, url, content, encoding,
+                                       old_content, old_encoding,
+                                       saved_fragments, record_metrics,
+                                       profile)
+        future.original_url = url
+        return future
+
+    def close(self: SelectPool) -> None:
+        """
+        Wait for all pages and stop the worker processes.
+        """
+
+        self._executor.shutdown()
+
+    def __enter__(self: SelectPool) -> SelectPool:
+        """
+        Enable use in contexts.
+        """
+
+        return self
+
+    def __exit__(self: SelectPool, *args: Any) -> None:
+        """
+        Enable use in contexts.
+        """
+
+        self.close()
@@ -1,3 +1,5 @@
 from .storage import Storage
 from .base_handler import BaseHandler
 from .json_handler import JSONHandler
+from .sqlite_handler import SQLiteHandler
+from .blob_handler import BlobHandler
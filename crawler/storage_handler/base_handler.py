@@ -1,6 +1,9 @@
 from __future__ import annotations
 
 from abc import ABC, abstractmethod
+from contextlib import contextmanager
+from functools import partial
+from typing import Callable, Iterable, Iterator
 
 from .storage import Storage
 
@@ -10,6 +13,9 @@ class BaseHandler(ABC):
     Base class for all storage loader classes.
     """
 
+    # Whether save_pages only writes the given pages
+    SAVES_SINGLE_PAGES = False
+
     @staticmethod
     @abstractmethod
     def save_storage(storage_path: str, storage: Storage) -> None:
@@ -22,6 +28,40 @@ class BaseHandler(ABC):
 
         raise NotImplementedError()
 
+    @classmethod
+    def save_pages(cls: type, storage_path: str, storage: Storage,
+                   urls: Iterable[str]) -> None:
+        """
+        Save the changes of some pages to a saved storage. Pages not in the
+        storage anymore are removed. Saves the whole storage unless the
+        handler can save single pages.
+
+        :param storage_path: The path to the storage file.
+        :param storage: The storage containing the pages.
+        :param urls: The urls of the changed pages.
+        """
+
+        cls.save_storage(storage_path, storage)
+
+    @classmethod
+    @contextmanager
+    def pages_saver(cls: type, storage_path: str
+                   ) -> Iterator[Callable[[Storage,Iterable[str]],None]]:
+        """
+        Context providing a function which saves the changes of some pages
+        like save_pages. Handlers keep their connection or index open until
+        the context exits, so saving many batches of pages only opens the
+        storage once. The changes may only be complete once the context
+        exited.
+
+        :param storage_path: The path to the storage file.
+
+        :return: The function taking the storage containing the pages and
+                 the urls of the changed pages.
+        """
+
+        yield partial(cls.save_pages, storage_path)
+
     @staticmethod
     @abstractmethod
     def load_storage(storage_path: str) -> Storage:
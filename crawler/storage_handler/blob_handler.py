@@ -0,0 +1,343 @@
+from __future__ import annotations
+
+from collections.abc import Mapping
+from contextlib import contextmanager
+from hashlib import sha256
+from json import dump, dumps, load, loads
+from os import listdir, makedirs, path, remove, replace, rmdir
+from typing import Any, Callable, Iterable, Iterator, Union
+from zlib import compress as zlib_compress, decompress as zlib_decompress
+
+try:
+    from zstandard import ZstdCompressor, ZstdDecompressor
+except ImportError:
+    ZstdCompressor = ZstdDecompressor = None
+
+from ..metrics import get_metrics, timed
+from .base_handler import BaseHandler
+from .storage import Storage
+
+
+INDEX_FILE = "index.json"
+BLOBS_DIR = "blobs"
+# Metadata with more characters, like large fragments, is saved as blob
+# instead of in the index
+MAX_INLINE_META = 4096
+
+
+class BlobPages(Mapping):
+    """
+    Read only mapping from urls to the pages saved in a blob storage.
+    Blobs are only read and decompressed when the page is requested.
+
+    :param storage_path: The path to the storage directory.
+    :param index: Dictionary mapping urls to the index entries of their
+                  pages.
+    """
+
+    __slots__ = ["_storage_path", "_index"]
+
+    def __init__(self: BlobPages, storage_path: str,
+                 index: dict[str,dict[str,Any]]) -> None:
+        self._storage_path = storage_path
+        self._index = index
+
+    @timed("storage_read")
+    def __getitem__(self: BlobPages, url: str) -> Union[str,bytes]:
+        entry = self._index[url]
+        content = BlobHandler.read_blob(self._storage_path, entry["blob"])
+        # Raw pages are returned undecoded
+        return content if entry.get("raw", False) else content.decode()
+
+    def __contains__(self: BlobPages, url: str) -> bool:
+        return url in self._index
+
+    def __iter__(self: BlobPages) -> Iterator[str]:
+        return iter(self._index)
+
+    def __len__(self: BlobPages) -> int:
+        return len(self._index)
+
+
+class BlobMeta(BlobPages):
+    """
+    Read only mapping from urls to the metadata of the pages saved in a
+    blob storage. Metadata saved as blob is only read when it is
+    requested.
+
+    :param storage_path: The path to the storage directory.
+    :param index: Dictionary mapping urls to the index entries of their
+                  pages.
+    """
+
+    __slots__ = []
+
+    def __getitem__(self: BlobMeta, url: str) -> dict[str,Any]:
+        entry = self._index[url]
+        if "meta_blob" not in entry:
+            return entry["meta"]
+        with get_metrics().time("storage_read"):
+            return loads(BlobHandler.read_blob(self._storage_path,
+                                               entry["meta_blob"]))
+
+
+class BlobHandler(BaseHandler):
+    """
+    Class for loading content addressed blob storages.
+    The storage is a directory with an index mapping every url to the hash
+    of its page and the page's metadata. Html strings are saved encoded as
+    utf-8, raw pages as they are. Every distinct page is saved once
+    as a blob named after its hash and compressed with zstd if the
+    zstandard package is available or zlib otherwise. Blobs no url refers
+    to are removed when the storage is saved.
+    """
+
+    SAVES_SINGLE_PAGES = True
+
+    @staticmethod
+    def get_blob_path(storage_path: str, blob_hash: str,
+                      extension: str) -> str:
+        """
+        Return the path of a blob.
+
+        :param storage_path: The path to the storage directory.
+        :param blob_hash: The hash of the blob's content.
+        :param extension: The extension of the blob's compression.
+
+        :return: The blob's path.
+        """
+
+        return path.join(storage_path, BLOBS_DIR, blob_hash[:2],
+                         f"{blob_hash}.{extension}")
+
+    @staticmethod
+    def read_blob(storage_path: str, blob_hash: str) -> bytes:
+        """
+        Read and decompress a blob.
+
+        :param storage_path: The path to the storage directory.
+        :param blob_hash: The hash of the blob's content.
+
+        :return: The blob's content.
+        """
+
+        zst_path = BlobHandler.get_blob_path(storage_path, blob_hash, "zst")
+        if path.exists(zst_path):
+            assert ZstdDecompressor, "zstandard is needed to read zstd blobs"
+            with open(zst_path, "rb") as file:
+                return ZstdDecompressor().decompress(file.read())
+
+        with open(BlobHandler.get_blob_path(storage_path, blob_hash, "zz"),
+                  "rb") as file:
+            return zlib_decompress(file.read())
+
+    @staticmethod
+    def write_blob(storage_path: str, content: bytes) -> str:
+        """
+        Compress and write a blob if it doesn't exist yet.
+
+        :param storage_path: The path to the storage directory.
+        :param content: The blob's content.
+
+        :return: The hash of the blob's content.
+        """
+
+        blob_hash = sha256(content).hexdigest()
+        if any(path.exists(BlobHandler.get_blob_path(storage_path, blob_hash,
+                                                     extension))
+               for extension in ["zst", "zz"]):
+            return blob_hash
+
+        if ZstdCompressor:
+            blob_path = BlobHandler.get_blob_path(storage_path, blob_hash,
+                                                  "zst")
+            compressed = ZstdCompressor().compress(content)
+        else:
+            blob_path = BlobHandler.get_blob_path(storage_path, blob_hash,
+                                                  "zz")
+            compressed = zlib_compress(content)
+
+        makedirs(path.dirname(blob_path), exist_ok=True)
+        # Never leave partially written blobs
+        with open(f"{blob_path}.tmp", "wb") as file:
+            file.write(compressed)
+        replace(f"{blob_path}.tmp", blob_path)
+        return blob_hash
+
+    @staticmethod
+    def write_entry(storage_path: str, storage: Storage,
+                    url: str) -> dict[str,Any]:
+        """
+        Write the blob of a page and return the page's index entry.
+
+        :param storage_path: The path to the storage directory.
+        :param storage: The storage containing the page.
+        :param url: The page's url.
+
+        :return: The index entry.
+        """
+
+        content = storage.get_content(url)
+        entry = {"blob": BlobHandler.write_blob(
+                         storage_path, content if isinstance(content, bytes)
+                         else content.encode())}
+        meta = dumps(storage.get_meta(url), sort_keys=True)
+        # Keeps the index small, it is read and written as a whole
+        if len(meta) > MAX_INLINE_META:
+            entry["meta_blob"] = BlobHandler.write_blob(storage_path,
+                                                        meta.encode())
+        else:
+            entry["meta"] = loads(meta)
+        if isinstance(content, bytes):
+            entry["raw"] = True
+        return entry
+
+    @staticmethod
+    def get_entry_blobs(entry: dict[str,Any]) -> list[str]:
+        """
+        Return the hashes of the blobs an index entry refers to.
+
+        :param entry: The index entry.
+
+        :return: The hashes.
+        """
+
+        return [entry[key] for key in ["blob", "meta_blob"] if key in entry]
+
+    @staticmethod
+    def collect_garbage(storage_path: str, blob_hashes: set[str]) -> None:
+        """
+        Remove all blobs that are not referenced.
+
+        :param storage_path: The path to the storage directory.
+        :param blob_hashes: The hashes of the referenced blobs.
+        """
+
+        blobs_path = path.join(storage_path, BLOBS_DIR)
+        if not path.isdir(blobs_path):
+            return
+
+        for prefix in listdir(blobs_path):
+            prefix_path = path.join(blobs_path, prefix)
+            for name in listdir(prefix_path):
+                if name.split(".")[0] not in blob_hashes:
+                    remove(path.join(prefix_path, name))
+            if not listdir(prefix_path):
+                rmdir(prefix_path)
+
+    @staticmethod
+    @timed("storage_save")
+    def save_storage(storage_path: str, storage: Storage) -> None:
+        """
+        Save storage to directory.
+
+        :param storage_path: The path to the storage directory.
+        :param storage: The storage to save.
+        """
+
+        assert storage_path, "Invalid path"
+
+        makedirs(storage_path, exist_ok=True)
+        index = dict((url, BlobHandler.write_entry(storage_path, storage, url))
+                     for url, _ in storage)
+
+        index_path = path.join(storage_path, INDEX_FILE)
+        with open(f"{index_path}.tmp", "w") as file:
+            dump(index, file)
+        replace(f"{index_path}.tmp", index_path)
+
+        BlobHandler.collect_garbage(storage_path,
+                                    set(blob_hash for e in index.values()
+                                        for blob_hash
+                                        in BlobHandler.get_entry_blobs(e)))
+
+    @staticmethod
+    def save_pages(storage_path: str, storage: Storage,
+                   urls: Iterable[str]) -> None:
+        """
+        Save the changes of some pages to a saved storage. Only the blobs of
+        the given urls are written and only the blobs they replace are
+        removed.
+
+        :param storage_path: The path to the storage directory.
+        :param storage: The storage containing the pages.
+        :param urls: The urls of the changed pages.
+        """
+
+        with BlobHandler.pages_saver(storage_path) as save_pages:
+            save_pages(storage, urls)
+
+    @staticmethod
+    @contextmanager
+    def pages_saver(storage_path: str
+                   ) -> Iterator[Callable[[Storage,Iterable[str]],None]]:
+        """
+        Context providing a function which saves the changes of some pages
+        like save_pages. The blobs are written by every call, the index is
+        only read when the context is entered and written when it exits.
+        The replaced blobs are removed afterwards, so the saved index
+        never refers to missing blobs.
+
+        :param storage_path: The path to the storage directory.
+
+        :return: The function taking the storage containing the pages and
+                 the urls of the changed pages.
+        """
+
+        assert storage_path, "Invalid path"
+
+        makedirs(storage_path, exist_ok=True)
+        index_path = path.join(storage_path, INDEX_FILE)
+        index = {}
+        if path.exists(index_path):
+            with open(index_path, "r") as file:
+                index = load(file)
+
+        replaced = set()
+        def save_pages(storage: Storage, urls: Iterable[str]) -> None:
+            with get_metrics().time("storage_save"):
+                for url in urls:
+                    if url in index:
+                        replaced.update(BlobHandler.get_entry_blobs(
+                                index.pop(url)))
+                    if storage.has_page(url):
+                        index[url] = BlobHandler.write_entry(storage_path,
+                                                             storage, url)
+
+        yield save_pages
+
+        with get_metrics().time("storage_save"):
+            with open(f"{index_path}.tmp", "w") as file:
+                dump(index, file)
+            replace(f"{index_path}.tmp", index_path)
+
+            # Blobs may still be referenced by other urls
+            referenced = set(blob_hash for e in index.values()
+                             for blob_hash in BlobHandler.get_entry_blobs(e))
+            for blob_hash in replaced - referenced:
+                for extension in ["zst", "zz"]:
+                    blob_path = BlobHandler.get_blob_path(
+                            storage_path, blob_hash, extension)
+                    if path.exists(blob_path):
+                        remove(blob_path)
+
+    @staticmethod
+    @timed("storage_load")
+    def load_storage(storage_path: str) -> Storage:
+        """
+        Load storage from directory and return the storage object.
+
+        :param storage_path: The path to the storage directory.
+
+        :return: The storage object.
+        """
+
+        index_path = path.join(storage_path, INDEX_FILE)
+        if not path.exists(index_path):
+            return Storage({})
+
+        with open(index_path, "r") as file:
+            index = load(file)
+
+        return Storage(BlobPages(storage_path, index),
+                       BlobMeta(storage_path, index))
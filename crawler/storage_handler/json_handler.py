@@ -2,6 +2,7 @@ from __future__ import annotations
 
 from json import load, dump
 
+from ..metrics import timed
 from .base_handler import BaseHandler
 from .storage import Storage
 
@@ -9,9 +10,13 @@ from .storage import Storage
 class JSONHandler(BaseHandler):
     """
     Class for loading json storages.
+    Each url is mapped to an object containing the page and its metadata.
+    Raw pages are saved decoded. Storage files mapping urls directly to
+    the pages can still be loaded.
     """
 
     @staticmethod
+    @timed("storage_save")
     def save_storage(storage_path: str, storage: Storage) -> None:
         """
         Save storage to file.
@@ -26,9 +31,12 @@ class JSONHandler(BaseHandler):
         assert storage_path, "Invalid path"
 
         with open(storage_path, "w") as file:
-            dump(dict((url, soup.prettify()) for url, soup in storage), file)
+            dump(dict((url, {"page": storage.get_html(url),
+                             "meta": storage.get_meta(url)})
+                      for url, _ in storage), file)
 
     @staticmethod
+    @timed("storage_load")
     def load_storage(storage_path: str) -> Storage:
         """
         Load storage from file and return the storage object.
@@ -39,4 +47,16 @@ class JSONHandler(BaseHandler):
         """
 
         with open(storage_path, "r") as file:
-            return Storage(load(file))
+            entries = load(file)
+
+        pages = {}
+        meta = {}
+        for url, entry in entries.items():
+            # Storage files without metadata only contain the pages
+            if isinstance(entry, str):
+                pages[url] = entry
+            else:
+                pages[url] = entry["page"]
+                meta[url] = entry["meta"]
+
+        return Storage(pages, meta)
@@ -0,0 +1,253 @@
+from __future__ import annotations
+
+from collections import OrderedDict
+from collections.abc import Mapping
+from contextlib import contextmanager
+from hashlib import sha256
+from json import dumps, loads
+from sqlite3 import Connection, connect
+from threading import Lock
+from typing import Any, Callable, Iterable, Iterator, Union
+
+from ..metrics import get_metrics, timed
+from .base_handler import BaseHandler
+from .storage import Storage
+
+
+CREATE_TABLE = """CREATE TABLE IF NOT EXISTS pages (
+    url TEXT PRIMARY KEY,
+    content TEXT NOT NULL,
+    hash TEXT NOT NULL,
+    meta TEXT NOT NULL
+)"""
+
+UPSERT = """INSERT INTO pages (url, content, hash, meta) VALUES (?, ?, ?, ?)
+ON CONFLICT (url) DO UPDATE SET content = excluded.content,
+    hash = excluded.hash, meta = excluded.meta
+WHERE pages.hash IS NOT excluded.hash OR pages.meta IS NOT excluded.meta"""
+
+
+class SQLiteColumn(Mapping):
+    """
+    Read only mapping from urls to a column of the pages table. Values are
+    only read from the database when they are requested. The most recently
+    requested converted values are cached, so values which are expensive
+    to convert are only converted once.
+
+    :param connection: The connection to the database.
+    :param column: The column's name.
+    :param convert: Function converting the stored value.
+    :param max_cached: Maximum number of cached values.
+    """
+
+    __slots__ = ["_connection", "_column", "_convert", "_max_cached",
+                 "_cached", "_lock"]
+
+    def __init__(self: SQLiteColumn, connection: Connection, column: str,
+                 convert: Callable[[Any],Any] = (lambda v: v),
+                 max_cached: int = 0) -> None:
+        assert max_cached >= 0, "The cache size can't be negative"
+
+        self._connection = connection
+        self._column = column
+        self._convert = convert
+        self._max_cached = max_cached
+        # Least recently used values are removed first
+        self._cached: OrderedDict[str,Any] = OrderedDict()
+        self._lock = Lock()
+
+    def __getitem__(self: SQLiteColumn, url: str) -> Any:
+        with self._lock:
+            if url in self._cached:
+                self._cached.move_to_end(url)
+                return self._cached[url]
+
+        value = self._read(url)
+        if self._max_cached:
+            with self._lock:
+                self._cached[url] = value
+                if len(self._cached) > self._max_cached:
+                    self._cached.popitem(last=False)
+        return value
+
+    @timed("storage_read")
+    def _read(self: SQLiteColumn, url: str) -> Any:
+        """
+        Read and convert a value from the database.
+
+        :param url: The value's url.
+
+        :return: The converted value.
+        """
+
+        row = self._connection.execute(
+                f"SELECT {self._column} FROM pages WHERE url = ?",
+                (url,)).fetchone()
+        if row is None:
+            raise KeyError(url)
+        return self._convert(row[0])
+
+    def __contains__(self: SQLiteColumn, url: str) -> bool:
+        return self._connection.execute("SELECT 1 FROM pages WHERE url = ?",
+                                        (url,)).fetchone() is not None
+
+    def __iter__(self: SQLiteColumn) -> Iterator[str]:
+        return (row[0] for row in
+                self._connection.execute("SELECT url FROM pages").fetchall())
+
+    def __len__(self: SQLiteColumn) -> int:
+        return self._connection.execute(
+                "SELECT COUNT(*) FROM pages").fetchone()[0]
+
+    def close(self: SQLiteColumn) -> None:
+        """
+        Close the connection to the database. Shared by all columns of the
+        same storage.
+        """
+
+        self._connection.close()
+
+
+class SQLiteHandler(BaseHandler):
+    """
+    Class for loading sqlite storages.
+    Every url is stored in its own row with the page, the page's hash and
+    its metadata. Raw pages are stored as blobs. Pages are only read when
+    they are requested and saving only writes the rows that changed.
+    """
+
+    SAVES_SINGLE_PAGES = True
+
+    @staticmethod
+    def hash_content(content: Union[str,bytes]) -> str:
+        """
+        Return the hash of a page.
+
+        :param content: The page's html or raw content.
+
+        :return: The hash.
+        """
+
+        return sha256(content if isinstance(content, bytes)
+                      else content.encode()).hexdigest()
+
+    @staticmethod
+    def connect(storage_path: str) -> Connection:
+        """
+        Open the database and create the pages table if it doesn't exist.
+
+        :param storage_path: The path to the storage file.
+
+        :return: The connection to the database.
+        """
+
+        connection = connect(storage_path, check_same_thread=False)
+        with connection:
+            connection.execute(CREATE_TABLE)
+        return connection
+
+    @staticmethod
+    @timed("storage_save")
+    def save_storage(storage_path: str, storage: Storage) -> None:
+        """
+        Save storage to file.
+
+        :param storage_path: The path to the storage file.
+        :param storage: The storage to save.
+        """
+
+        assert storage_path, "Invalid path"
+
+        connection = SQLiteHandler.connect(storage_path)
+        try:
+            saved = dict((url, (page_hash, meta))
+                         for url, page_hash, meta in connection.execute(
+                                 "SELECT url, hash, meta FROM pages"))
+
+            rows = []
+            for url, html in storage:
+                page_hash = SQLiteHandler.hash_content(html)
+                meta = dumps(storage.get_meta(url), sort_keys=True)
+                if saved.pop(url, None) != (page_hash, meta):
+                    rows.append((url, html, page_hash, meta))
+
+            # Single transaction for all changes
+            with connection:
+                connection.executemany(UPSERT, rows)
+                # Pages not in the storage anymore
+                connection.executemany("DELETE FROM pages WHERE url = ?",
+                                       ((url,) for url in saved))
+        finally:
+            connection.close()
+
+    @staticmethod
+    def save_pages(storage_path: str, storage: Storage,
+                   urls: Iterable[str]) -> None:
+        """
+        Save the changes of some pages to a saved storage. Only the rows of
+        the given urls are written.
+
+        :param storage_path: The path to the storage file.
+        :param storage: The storage containing the pages.
+        :param urls: The urls of the changed pages.
+        """
+
+        with SQLiteHandler.pages_saver(storage_path) as save_pages:
+            save_pages(storage, urls)
+
+    @staticmethod
+    @contextmanager
+    def pages_saver(storage_path: str
+                   ) -> Iterator[Callable[[Storage,Iterable[str]],None]]:
+        """
+        Context providing a function which saves the changes of some pages
+        like save_pages. All calls share one connection and every call
+        writes its pages in a single transaction.
+
+        :param storage_path: The path to the storage file.
+
+        :return: The function taking the storage containing the pages and
+                 the urls of the changed pages.
+        """
+
+        assert storage_path, "Invalid path"
+
+        connection = SQLiteHandler.connect(storage_path)
+        def save_pages(storage: Storage, urls: Iterable[str]) -> None:
+            with get_metrics().time("storage_save"):
+                rows = []
+                removed = []
+                for url in urls:
+                    html = storage.get_content(url)
+                    if html is None:
+                        removed.append((url,))
+                        continue
+                    rows.append((url, html, SQLiteHandler.hash_content(html),
+                                 dumps(storage.get_meta(url), sort_keys=True)))
+
+                # Single transaction for all changes
+                with connection:
+                    connection.executemany(UPSERT, rows)
+                    connection.executemany("DELETE FROM pages WHERE url = ?",
+                                           removed)
+
+        try:
+            yield save_pages
+        finally:
+            connection.close()
+
+    @staticmethod
+    @timed("storage_load")
+    def load_storage(storage_path: str) -> Storage:
+        """
+        Load storage from file and return the storage object.
+
+        :param storage_path: The path to the storage file.
+
+        :return: The storage object.
+        """
+
+        connection = SQLiteHandler.connect(storage_path)
+        # The metadata is read several times per page
+        return Storage(SQLiteColumn(connection, "content"),
+                       SQLiteColumn(connection, "meta", loads, 1024))
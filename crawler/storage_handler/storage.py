@@ -1,25 +1,176 @@
 from __future__ import annotations
+from collections import ChainMap
+from typing import Any, Mapping, Optional, Union
 from bs4 import BeautifulSoup
 
+from ..parsed_page import get_encoding
+
 
 class Storage:
     """
     Storage class for stored pages.
-
-    :param pages_dict: Dictionary mapping utls to html contents
+    The pages are kept as html strings or as the raw bytes they were
+    downloaded as and only parsed when they are requested. The encoding of
+    raw pages is saved in their metadata.
+    The given mappings are never modified and only read when a page is
+    requested, so they can load the pages lazily (e.g. from a database).
+
+    :param pages_dict: Mapping from urls to html strings or raw contents
+    :param meta_dict: Mapping from urls to json serializable metadata of
+                      the stored pages (e.g. cache headers)
     """
 
-    def __init__(self: Storage, pages_dict: dict[str,str]) -> None:
-        self._pages = dict((url, BeautifulSoup(html, features="lxml"))
-                           for url, html in pages_dict.items())
+    def __init__(self: Storage, pages_dict: Mapping[str,Union[str,bytes]],
+                 meta_dict: Mapping[str,dict[str,Any]] = {}) -> None:
+        # Saved pages are written to the first map
+        self._pages = ChainMap({}, pages_dict)
+        self._meta = ChainMap({}, meta_dict)
+
+    @staticmethod
+    def union(storages: list[Storage]) -> Storage:
+        """
+        Return a storage containing the pages of several storages, like
+        the storages of the shards of a crawl. The storages are read
+        lazily. Pages saved in several storages are taken from the first
+        one.
+
+        :param storages: The storages.
 
-    def export(self: Storage) -> dict[str,str]:
+        :return: The union of the storages.
+        """
+
+        return Storage(ChainMap(*(s._pages for s in storages)),
+                       ChainMap(*(s._meta for s in storages)))
+
+    def close(self: Storage) -> None:
+        """
+        Release the resources of the mappings the pages are read from,
+        like database connections. The storage can't be read afterwards.
+        """
+
+        Storage._close_mapping(self._pages)
+        Storage._close_mapping(self._meta)
+
+    @staticmethod
+    def _close_mapping(mapping: Mapping) -> None:
+        """
+        Close a mapping and the mappings it is made of if they can be
+        closed.
+
+        :param mapping: The mapping.
+        """
+
+        if isinstance(mapping, ChainMap):
+            for m in mapping.maps:
+                Storage._close_mapping(m)
+        elif hasattr(mapping, "close"):
+            mapping.close()
+
+    def export(self: Storage) -> dict[str,Union[str,bytes]]:
         """
         Export storage as dictionary (e.g. to use in storage handler class).
         """
 
-        return dict((url, soup.prettify())
-                    for url, soup in self._pages.items())
+        return dict(self._pages)
+
+    def has_page(self: Storage, url: str) -> bool:
+        """
+        Return whether a page is saved without reading it.
+
+        :param url: The page's url.
+
+        :return: True if the page is saved.
+        """
+
+        return url in self._pages
+
+    def get_urls(self: Storage) -> list[str]:
+        """
+        Return the urls of the saved pages without reading the pages.
+
+        :return: The list of urls.
+        """
+
+        return list(self._pages)
+
+    def get_html(self: Storage, url: str) -> str:
+        """
+        Return a saved web page's html by url or none if the page is not
+        saved. Raw pages are decoded.
+
+        :param url: The page's url.
+
+        :return: The page's html.
+        """
+
+        content = self.get_content(url)
+        if not isinstance(content, bytes):
+            return content
+        return content.decode(get_encoding(content, self.get_encoding(url)),
+                              "replace")
+
+    def get_content(self: Storage, url: str) -> Optional[Union[str,bytes]]:
+        """
+        Return a saved web page's html or raw content by url or none if the
+        page is not saved.
+
+        :param url: The page's url.
+
+        :return: The page's html or raw content.
+        """
+
+        try:
+            return self._pages[url]
+        except KeyError:
+            return None
+
+    def get_encoding(self: Storage, url: str) -> Optional[str]:
+        """
+        Return the encoding of a saved raw page declared by the server or
+        none if there is none.
+
+        :param url: The page's url.
+
+        :return: The page's encoding.
+        """
+
+        return self.get_meta(url).get("encoding", None)
+
+    def export_meta(self: Storage) -> dict[str,dict[str,Any]]:
+        """
+        Export the pages' metadata as dictionary (e.g. to use in storage
+        handler class).
+        """
+
+        return dict((url, self.get_meta(url)) for url in self._pages)
+
+    def get_meta(self: Storage, url: str) -> dict[str,Any]:
+        """
+        Return the metadata of a saved web page by url or an empty
+        dictionary if there is none.
+
+        :param url: The page's url.
+
+        :return: The page's metadata.
+        """
+
+        try:
+            return self._meta[url]
+        except KeyError:
+            return {}
+
+    def set_meta(self: Storage, url: str, meta: dict[str,Any]) -> None:
+        """
+        Save the metadata of a saved web page.
+
+        :param url: The page's url.
+        :param meta: The page's json serializable metadata.
+        """
+
+        assert url in self._pages, "Metadata can only be saved for saved pages"
+        assert isinstance(meta, dict), "The metadata has to be a dictionary"
+
+        self._meta[url] = meta
 
     def __getitem__(self: JSONStorage, url: str) -> BeautifulSoup:
         """
@@ -30,20 +181,47 @@ class Storage:
         :return: The page's BeautifulSoup object.
         """
 
-        return self._pages.get(url, None)
+        content = self.get_content(url)
+        if content is None:
+            return None
+
+        return BeautifulSoup(content, features="lxml", from_encoding=(
+                get_encoding(content, self.get_encoding(url))
+                if isinstance(content, bytes) else None))
 
-    def __setitem__(self: JSONStorage, url: str, page: BeautifulSoup) -> None:
+    def __setitem__(self: JSONStorage, url: str,
+                    page: Union[str,bytes,BeautifulSoup]) -> None:
         """
         Save a web page for a specific url.
 
         :param url: The page's url.
-        :param page: The page's BeautifulSoup object
+        :param page: The page's html, raw content or BeautifulSoup object.
+                     The encoding of a raw content is set in the page's
+                     metadata.
         """
 
         assert isinstance(url, str), "The url has to be a string"
-        assert isinstance(page, BeautifulSoup), "The page has to be a BeautifulSoup object"
+        assert isinstance(page, (str, bytes, BeautifulSoup)), "The page has to be a string, bytes or BeautifulSoup object"
+
+        self._pages[url] = page if isinstance(page, bytes) else str(page)
+
+    def __delitem__(self: Storage, url: str) -> None:
+        """
+        Remove a web page saved with __setitem__ and its metadata. The
+        pages of the mappings the storage was created with are kept.
+
+        :param url: The page's url.
+        """
+
+        self._pages.maps[0].pop(url, None)
+        self._meta.maps[0].pop(url, None)
+
+    def __len__(self: Storage) -> int:
+        """
+        Return the number of saved pages.
+        """
 
-        self._pages[url] = page
+        return len(self._pages)
 
     def __iter__(self):
         """
@@ -0,0 +1,175 @@
+from __future__ import annotations
+
+from collections.abc import Iterator
+from hashlib import sha256
+from json import dumps
+from typing import Any, Optional
+from bs4 import (Comment, Declaration, Doctype, NavigableString, PageElement,
+                 ProcessingInstruction, Tag)
+
+
+# Stored with the hashes, so hashes of other schemes are not compared
+HASH_SCHEME = "merkle-1"
+# Strings which are not part of a page's content
+IGNORED_STRINGS = (Comment, Declaration, Doctype, ProcessingInstruction)
+
+
+def normalize_text(text: str) -> str:
+    """
+    Collapse the whitespace in a text.
+
+    :param text: The text.
+
+    :return: The normalized text.
+    """
+
+    return " ".join(text.split())
+
+
+def get_children(tag: Tag) -> list[PageElement]:
+    """
+    Return the children of a tag which are part of its structure: tags and
+    strings that are not only whitespace.
+
+    :param tag: The tag.
+
+    :return: The children.
+    """
+
+    return [c for c in tag.contents
+            if isinstance(c, Tag) or (not isinstance(c, IGNORED_STRINGS)
+                                      and normalize_text(c))]
+
+
+def hash_node(node: PageElement,
+              cache: Optional[dict[int,tuple[Tag,bytes]]] = None) -> bytes:
+    """
+    Return the Merkle hash of a tag or string. A tag's hash covers its
+    name, its attributes and the hashes of its children, so equal
+    subtrees have equal hashes regardless of formatting. The tree is
+    walked once and the hash of every tag is cached by the tag's id.
+
+    :param node: The tag or string.
+    :param cache: The hashes of already hashed tags. The tags are kept in
+                  the cache, so their ids can't be reused.
+
+    :return: The hash's digest.
+    """
+
+    if cache is None:
+        cache = {}
+    if not isinstance(node, Tag):
+        return sha256(b"T" + normalize_text(str(node)).encode()).digest()
+
+    # Children are hashed before their parents without recursion
+    stack = [(node, None)]
+    while stack:
+        tag, children = stack.pop()
+        if id(tag) in cache:
+            continue
+        if children is None:
+            children = get_children(tag)
+            stack.append((tag, children))
+            stack += [(c, None) for c in children
+                      if isinstance(c, Tag) and id(c) not in cache]
+            continue
+
+        attrs = sorted((k, " ".join(v) if isinstance(v, list) else v)
+                       for k, v in tag.attrs.items())
+        h = sha256(b"E" + dumps([tag.name, attrs]).encode())
+        for c in children:
+            h.update(cache[id(c)][1] if isinstance(c, Tag) else hash_node(c))
+        cache[id(tag)] = (tag, h.digest())
+    return cache[id(node)][1]
+
+
+def hash_selected(selected: Any,
+                  cache: Optional[dict[int,tuple[Tag,bytes]]] = None) -> str:
+    """
+    Return the structural hash of a select chain's result.
+
+    :param selected: The select chain's result. Iterators have to be
+                     converted to lists first.
+    :param cache: The hashes of already hashed tags.
+
+    :return: The hash.
+    """
+
+    return _hash_selected(selected, {} if cache is None else cache).hex()
+
+
+def _hash_selected(selected: Any,
+                   cache: dict[int,tuple[Tag,bytes]]) -> bytes:
+    """
+    Return the digest of a select chain's result's structural hash.
+
+    :param selected: The select chain's result.
+    :param cache: The hashes of already hashed tags.
+
+    :return: The hash's digest.
+    """
+
+    if selected is None:
+        return sha256(b"N").digest()
+    if isinstance(selected, Tag):
+        return hash_node(selected, cache)
+    if isinstance(selected, NavigableString):
+        return sha256(b"S" + normalize_text(selected).encode()).digest()
+    if isinstance(selected, str):
+        return sha256(b"s" + selected.encode()).digest()
+    if isinstance(selected, (list, tuple, Iterator)):
+        h = sha256(b"L")
+        for s in selected:
+            h.update(_hash_selected(s, cache))
+        return h.digest()
+    if isinstance(selected, (int, float, bool)):
+        return sha256(b"V" + dumps(selected).encode()).digest()
+    return sha256(b"s" + str(selected).encode()).digest()
+
+
+def get_changed_paths(selected: Any, old_selected: Any,
+                      limit: int = 16) -> list[str]:
+    """
+    Return the paths of the smallest subtrees that differ between two
+    results of the same select chain. Subtrees are descended into while
+    the tags have the same name, attributes and number of children, so
+    the changed parts can be reported without diffing strings.
+
+    :param selected: The new result.
+    :param old_selected: The old result.
+    :param limit: The maximum number of paths.
+
+    :return: The paths in document order, like div > ul[1] > li[0].
+    """
+
+    cache: dict[int,tuple[Tag,bytes]] = {}
+    root = selected.name if isinstance(selected, Tag) else ""
+    paths = []
+    stack = [(selected, old_selected, root)]
+    while stack and len(paths) < limit:
+        new, old, path = stack.pop()
+        if _hash_selected(new, cache) == _hash_selected(old, cache):
+            continue
+
+        if isinstance(new, list) and isinstance(old, list):
+            pairs = [(f"[{i}]", n, o)
+                     for i, (n, o) in enumerate(zip(new, old))]
+            same_shape = len(new) == len(old)
+        elif (isinstance(new, Tag) and isinstance(old, Tag)
+              and new.name == old.name and new.attrs == old.attrs):
+            new_children = get_children(new)
+            old_children = get_children(old)
+            pairs = [(f"{n.name if isinstance(n, Tag) else '#text'}[{i}]",
+                      n, o) for i, (n, o) in enumerate(zip(new_children,
+                                                           old_children))]
+            same_shape = len(new_children) == len(old_children)
+        else:
+            pairs = []
+            same_shape = False
+
+        if not same_shape:
+            paths.append(path or ".")
+            continue
+        stack += [(n, o, f"{path} > {name}" if path else name)
+                  for name, n, o in reversed(pairs)]
+    return paths
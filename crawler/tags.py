@@ -0,0 +1,42 @@
+from __future__ import annotations
+
+from typing import Any
+
+
+class Tags(tuple):
+    """
+    The new and old tag a rule's filters and actions are run on. Values
+    derived from the tags are computed at most once, no matter how many
+    filters use them.
+
+    :param tag: The tag selected from the downloaded page.
+    :param old_tag: The tag selected from the saved page.
+    """
+
+    def __new__(cls: type, tag: Any, old_tag: Any) -> Tags:
+        tags = super().__new__(cls, (tag, old_tag))
+        # Derived values by tag index and name
+        tags._derived = {}
+        return tags
+
+    @staticmethod
+    def get(tags: tuple[Any,Any], i: int, name: str) -> Any:
+        """
+        Return a value derived from one of the tags. The value is cached if
+        the tags are a Tags instance.
+
+        :param tags: The new and old tag.
+        :param i: The tag's index.
+        :param name: The value's name: str for the tag's html or the name
+                     of one of the tag's attributes like text or string.
+
+        :return: The derived value.
+        """
+
+        if isinstance(tags, Tags) and (i, name) in tags._derived:
+            return tags._derived[(i, name)]
+
+        value = str(tags[i]) if name == "str" else getattr(tags[i], name)
+        if isinstance(tags, Tags):
+            tags._derived[(i, name)] = value
+        return value
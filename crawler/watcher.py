@@ -0,0 +1,155 @@
+from __future__ import annotations
+
+from heapq import heapify, heappop, heappush
+from sys import stderr
+from time import sleep, time
+from traceback import print_exception
+from typing import Any, Callable, Optional
+
+from .crawler import Crawler
+from .storage_handler import Storage
+
+
+class Watcher:
+    """
+    Checks the pages of a crawler's config again and again. Every url is
+    checked when its interval has passed since its last check. The
+    interval of a page is shortened when the page changed and extended
+    when it didn't, within the given bounds. Failed checks keep the
+    interval, so the page is checked again after the same interval. The
+    intervals are saved in the pages' metadata, so they survive restarts.
+    The config, the downloader's connections and the storage are kept
+    between the checks and only the checked pages are saved.
+
+    :param crawler: The crawler checking the pages.
+    :param storage: The storage the crawler was created with. It is
+                    updated after every check.
+    :param save_pages: Function saving the pages of the given urls from
+                       the storage.
+    :param min_interval: Minimum number of seconds between two checks of
+                         the same page.
+    :param max_interval: Maximum number of seconds between two checks of
+                         the same page.
+    :param factor: Factor the interval is divided by after a change and
+                   multiplied by otherwise.
+    """
+
+    __slots__ = ["_crawler", "_storage", "_save_pages", "_min_interval",
+                 "_max_interval", "_factor", "_intervals", "_queue"]
+
+    def __init__(self: Watcher, crawler: Crawler, storage: Storage,
+                 save_pages: Callable[[Storage,list[str]],None],
+                 min_interval: float = 60, max_interval: float = 86400,
+                 factor: float = 2) -> None:
+        assert 0 < min_interval <= max_interval, "Invalid interval bounds"
+        assert factor > 1, "The factor has to be greater than 1"
+
+        self._crawler = crawler
+        self._storage = storage
+        self._save_pages = save_pages
+        self._min_interval = min_interval
+        self._max_interval = max_interval
+        self._factor = factor
+        # Current interval of every url
+        self._intervals: dict[str,float] = {}
+        # Next check time and url, earliest first
+        self._queue: list[tuple[float,str]] = []
+
+    def run(self: Watcher, cycles: Optional[int] = None,
+            **download_kwargs: Any) -> None:
+        """
+        Check the pages until the given number of checks was run. All urls
+        whose next check is due are checked together.
+
+        :param cycles: The number of checks or None to run forever.
+        :param download_kwargs: Passed to the crawler's fetch_pages.
+        """
+
+        now = time()
+        for url in self._crawler.get_urls():
+            watch = self._storage.get_meta(url).get("watch", {})
+            # The bounds may have changed since the last run
+            self._intervals[url] = min(self._max_interval, max(
+                    self._min_interval,
+                    watch.get("interval", self._min_interval)))
+            self._queue.append((watch.get("checked", now)
+                                + self._intervals[url], url))
+        heapify(self._queue)
+
+        while self._queue and cycles != 0:
+            sleep(max(0, self._queue[0][0] - time()))
+            now = time()
+            urls = []
+            while self._queue and self._queue[0][0] <= now:
+                urls.append(heappop(self._queue)[1])
+
+            try:
+                self.check(urls, download_kwargs)
+            except Exception as e:
+                print_exception(None, e, e.__traceback__, file=stderr)
+            for url in urls:
+                heappush(self._queue, (time() + self._intervals[url], url))
+            if cycles is not None:
+                cycles -= 1
+
+    def check(self: Watcher, urls: list[str],
+              download_kwargs: dict[str,Any]) -> None:
+        """
+        Check some pages, adapt their intervals and save them. Only pages
+        the server returned or confirmed to be up to date count as
+        checked, the others keep their interval and metadata.
+
+        :param urls: The urls of the pages.
+        :param download_kwargs: Passed to the crawler's fetch_pages.
+        """
+
+        fingerprints = dict((url, self._storage.get_meta(url).get(
+                "fingerprint", None)) for url in urls)
+        self._crawler.fetch_pages(urls=urls, **download_kwargs)
+        self._crawler.process_pages(close=False)
+        new_storage = self._crawler.new_pages_storage()
+        checked_urls = self._crawler.checked_urls()
+
+        now = time()
+        saved = []
+        for url in urls:
+            # Failed checks are no evidence of the page being unchanged
+            if url not in checked_urls:
+                continue
+            content = new_storage.get_content(url)
+            if content is None:
+                continue
+
+            meta = dict(new_storage.get_meta(url))
+            self._intervals[url] = self.adapt_interval(
+                    self._intervals[url], fingerprints[url],
+                    meta.get("fingerprint", None))
+            meta["watch"] = {"interval": self._intervals[url],
+                             "checked": now}
+            self._storage[url] = content
+            self._storage.set_meta(url, meta)
+            saved.append(url)
+        self._save_pages(self._storage, saved)
+
+    def adapt_interval(self: Watcher, interval: float,
+                       old_fingerprint: Optional[str],
+                       fingerprint: Optional[str]) -> float:
+        """
+        Return the next interval of a page.
+
+        :param interval: The page's current interval.
+        :param old_fingerprint: The fingerprint of the page before the check
+                                or None if there was none.
+        :param fingerprint: The fingerprint of the page after the check.
+
+        :return: The new interval.
+        """
+
+        # The first download is no change
+        if old_fingerprint is None or fingerprint is None:
+            return interval
+        if fingerprint != old_fingerprint:
+            interval /= self._factor
+        else:
+            interval *= self._factor
+        return min(self._max_interval, max(self._min_interval, interval))
@@ -1,26 +1,222 @@
 import argparse
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+from tempfile import TemporaryDirectory
 
-from crawler import Crawler
-from crawler.config_parser import JSONParser
+from crawler import (Crawler, Fingerprinter, Metrics, PageProfiler, Watcher,
+                     set_metrics)
+from crawler.config_parser import ShardParser, StreamingJSONParser
 from crawler.default_functions import (SELECT_FUNCTIONS, FILTER_FUNCTIONS,
                                        ACTION_FUNCTIONS)
-from crawler.pages_downloader import FuturesDownloader
-from crawler.storage_handler import JSONHandler
+from crawler.pages_downloader import (FuturesDownloader, AsyncDownloader,
+                                      HostScheduler)
+from crawler.storage_handler import (JSONHandler, SQLiteHandler, BlobHandler,
+                                     Storage)
+
+# Storage handlers by name
+STORAGE_HANDLERS = {"json": JSONHandler, "sqlite": SQLiteHandler,
+                    "blob": BlobHandler}
+
+# Storage handlers by file extension
+STORAGE_EXTENSIONS = {".sqlite": SQLiteHandler, ".sqlite3": SQLiteHandler,
+                      ".db": SQLiteHandler}
+
+def get_storage_handler(storage_path, storage_format=None):
+    if storage_format:
+        return STORAGE_HANDLERS[storage_format]
+    # Blob storages are directories
+    if os.path.isdir(storage_path):
+        return BlobHandler
+    return STORAGE_EXTENSIONS.get(os.path.splitext(storage_path)[1],
+                                  JSONHandler)
+
+def parse_shard(value):
+    shard, _, shards = value.partition("/")
+    if not shard.isdigit() or not shards.isdigit():
+        raise argparse.ArgumentTypeError("expected i/N")
+    if not int(shard) < int(shards):
+        raise argparse.ArgumentTypeError("i has to be smaller than N")
+    return int(shard), int(shards)
 
 def get_arguments():
     parser = argparse.ArgumentParser()
-    parser.add_argument("-c", "--config", dest="config", required=True)
+    parser.add_argument("-c", "--config", dest="config")
     parser.add_argument("-s", "--storage", dest="storage", required=True)
-    return parser.parse_args()
+    parser.add_argument("-o", "--output", dest="output")
+    parser.add_argument("-f", "--storage-format", dest="storage_format",
+                        choices=list(STORAGE_HANDLERS.keys()))
+    parser.add_argument("-d", "--downloader", dest="downloader",
+                        choices=["futures", "async"], default="futures")
+    parser.add_argument("--concurrency", dest="concurrency", type=int)
+    parser.add_argument("--max-pending", dest="max_pending", type=int)
+    parser.add_argument("--per-host", dest="per_host", type=int, default=8)
+    parser.add_argument("--min-delay", dest="min_delay", type=float,
+                        default=0)
+    parser.add_argument("--ignore-robots", dest="obey_robots",
+                        action="store_false")
+    parser.add_argument("-i", "--ignore-pattern", dest="ignore_patterns",
+                        action="append", default=[])
+    parser.add_argument("-w", "--workers", dest="workers", type=int,
+                        default=0)
+    parser.add_argument("--stream", dest="stream", action="store_true")
+    parser.add_argument("--max-bytes", dest="max_bytes", type=int)
+    parser.add_argument("--early-stop", dest="early_stop",
+                        action="store_true")
+    parser.add_argument("--watch", dest="watch", action="store_true")
+    parser.add_argument("--min-interval", dest="min_interval", type=float,
+                        default=60)
+    parser.add_argument("--max-interval", dest="max_interval", type=float,
+                        default=86400)
+    parser.add_argument("--metrics", dest="metrics")
+    parser.add_argument("--metrics-format", dest="metrics_format",
+                        choices=["json", "prometheus"], default="json")
+    parser.add_argument("--slow-rules", dest="slow_rules", type=int)
+    parser.add_argument("--profile", dest="profile")
+    parser.add_argument("--profile-rate", dest="profile_rate", type=float,
+                        default=1)
+    parser.add_argument("--shard", dest="shard", type=parse_shard)
+    parser.add_argument("--shards", dest="shards", type=int)
+    parser.add_argument("--merge", dest="merge", nargs="+")
+    args = parser.parse_args()
+    if not args.merge and not args.config:
+        parser.error("the following arguments are required: -c/--config")
+    if args.shards is not None and args.shards < 1:
+        parser.error("--shards has to be positive")
+    if args.shards and (args.shard or args.watch):
+        parser.error("--shards can't be combined with --shard or --watch")
+    # Watches only save the changed pages
+    if args.output and args.watch:
+        parser.error("--output can't be combined with --watch")
+    return args
+
+def merge_storages(storage_paths, output, storage_format=None):
+    storage = Storage.union([
+            get_storage_handler(path, storage_format).load_storage(path)
+            for path in storage_paths])
+    get_storage_handler(output, storage_format).save_storage(output, storage)
+    storage.close()
+
+def get_shard_arguments(args, shard, directory):
+    shard_args = argparse.Namespace(**vars(args))
+    shard_args.shard = (shard, args.shards)
+    shard_args.shards = None
+    # Every shard reads the saved pages from the whole storage and saves
+    # its own pages separately
+    shard_args.output = os.path.join(
+            directory,
+            f"shard-{shard}{os.path.splitext(args.output or args.storage)[1]}")
+    if args.metrics:
+        shard_args.metrics = f"{args.metrics}.shard-{shard}"
+    if args.profile:
+        shard_args.profile = os.path.join(args.profile, f"shard-{shard}")
+    return shard_args
+
+def launch_shards(args):
+    output = args.output or args.storage
+    with TemporaryDirectory(
+            dir=os.path.dirname(os.path.abspath(output))) as directory:
+        shard_args = [get_shard_arguments(args, shard, directory)
+                      for shard in range(args.shards)]
+        with ProcessPoolExecutor(args.shards) as pool:
+            for future in [pool.submit(run, a) for a in shard_args]:
+                future.result()
+        merge_storages([a.output for a in shard_args], output,
+                       args.storage_format)
+
+def process_and_save_pages(crawler, storage_handler, storage_path, output):
+    # Pages are saved as soon as they are processed instead of keeping
+    # every page in memory until the end. Unchanged pages only have to be
+    # saved to other storages
+    changed_only = os.path.abspath(output) == os.path.abspath(storage_path)
+    with storage_handler.pages_saver(output) as save_pages:
+        crawler.process_pages(save_pages=save_pages,
+                              changed_only=changed_only)
+
+        # Pages which are not in the config anymore
+        output_storage = storage_handler.load_storage(output)
+        urls = crawler.new_page_urls()
+        removed = [url for url in output_storage.get_urls()
+                   if url not in urls]
+        output_storage.close()
+        if removed:
+            save_pages(crawler.new_pages_storage(), removed)
+
+def crawl(crawler, storage_handler, storage_path, output, download_kwargs):
+    crawler.fetch_pages(**download_kwargs)
+    if storage_handler.SAVES_SINGLE_PAGES:
+        process_and_save_pages(crawler, storage_handler, storage_path, output)
+    else:
+        crawler.process_pages()
+        storage_handler.save_storage(output, crawler.new_pages_storage())
+
+def run(args):
+    metrics = None
+    # The rules' costs are part of the metrics
+    if args.metrics or args.slow_rules:
+        metrics = Metrics()
+        set_metrics(metrics)
+    storage_handler = get_storage_handler(args.storage, args.storage_format)
+    output = args.output or args.storage
+    if args.downloader == "async":
+        downloader = AsyncDownloader()
+    else:
+        downloader = FuturesDownloader()
+    download_kwargs = {"scheduler": HostScheduler(args.per_host,
+                                                  args.min_delay,
+                                                  args.obey_robots)}
+    if args.concurrency is not None:
+        download_kwargs["max_concurrency"] = args.concurrency
+    if args.max_pending is not None:
+        download_kwargs["max_pending"] = args.max_pending
+    # Size limits require streaming
+    if args.stream or args.max_bytes is not None:
+        download_kwargs["stream"] = True
+        download_kwargs["max_bytes"] = args.max_bytes
+    if args.early_stop:
+        download_kwargs["early_stop"] = True
+    profiler = None
+    if args.profile:
+        profiler = PageProfiler(args.profile_rate)
+    storage = storage_handler.load_storage(args.storage)
+    config_parser = StreamingJSONParser.create_parser(args.config,
+                                                      SELECT_FUNCTIONS,
+                                                      FILTER_FUNCTIONS,
+                                                      ACTION_FUNCTIONS)
+    if args.shard:
+        config_parser = ShardParser(config_parser, *args.shard)
+    crawler = Crawler(config_parser, downloader, storage,
+                      Fingerprinter(args.ignore_patterns),
+                      args.workers, profiler)
+    if args.watch:
+        def save_pages(storage, urls):
+            storage_handler.save_pages(output, storage, urls)
+            # Long running watches export the metrics of every cycle
+            if args.metrics:
+                metrics.export(args.metrics, args.metrics_format)
+        watcher = Watcher(crawler, storage, save_pages, args.min_interval,
+                          args.max_interval)
+        with downloader:
+            try:
+                watcher.run(**download_kwargs)
+            except KeyboardInterrupt:
+                pass
+    else:
+        crawl(crawler, storage_handler, args.storage, output, download_kwargs)
+    storage.close()
+    if args.metrics:
+        metrics.export(args.metrics, args.metrics_format)
+    if profiler is not None:
+        profiler.write(args.profile)
+    if args.slow_rules:
+        print(metrics.format_slowest_rules(args.slow_rules), file=sys.stderr)
 
 if __name__ == "__main__":
     args = get_arguments()
-    crawler = Crawler(JSONParser.create_parser(args.config, SELECT_FUNCTIONS,
-                                               FILTER_FUNCTIONS,
-                                               ACTION_FUNCTIONS),
-                      FuturesDownloader(),
-                      JSONHandler.load_storage(args.storage))
-    crawler.fetch_pages()
-    crawler.process_pages()
-    JSONHandler.save_storage(args.storage, crawler.new_pages_storage())
-
+    if args.merge:
+        merge_storages(args.merge, args.output or args.storage,
+                       args.storage_format)
+    elif args.shards:
+        launch_shards(args)
+    else:
+        run(args)
@@ -0,0 +1,76 @@
+from __future__ import annotations
+
+import unittest
+from typing import Any
+from unittest.mock import patch
+
+from crawler.profiler import ProfileStats, get_collapsed_stacks
+
+
+def get_stats(calls: dict[str,dict[str,float]],
+              tottimes: dict[str,float]) -> ProfileStats:
+    """
+    Create the stats of a profile from the time spent in every call.
+
+    :param calls: Dictionary mapping callers to dictionaries mapping their
+                  callees to the time spent in their calls.
+    :param tottimes: Dictionary mapping functions to the time spent in
+                     them without their callees.
+
+    :return: The stats.
+    """
+
+    def get_fun(name: str) -> tuple[str,int,str]:
+        return ("f.py", 1, name)
+
+    cumtimes = dict(tottimes)
+    callers: dict[str,dict[tuple,Any]] = dict((n, {}) for n in tottimes)
+    for caller, callees in calls.items():
+        for callee, seconds in callees.items():
+            cumtimes[caller] += seconds
+            callers[callee][get_fun(caller)] = (1, 1, 0, seconds)
+    return ProfileStats(dict((get_fun(name), (1, 1, tottimes[name],
+                                              cumtimes[name], callers[name]))
+                             for name in tottimes))
+
+
+class CollapsedStacksTest(unittest.TestCase):
+    def test_diamond(self: CollapsedStacksTest) -> None:
+        stats = get_stats({"main": {"a": 4, "b": 8}, "a": {"c": 3},
+                           "b": {"c": 6}},
+                          {"main": 1, "a": 1, "b": 2, "c": 9})
+        stacks = get_collapsed_stacks(stats)
+        self.assertEqual(stacks.keys(), {
+                "main (f.py:1)", "main (f.py:1);a (f.py:1)",
+                "main (f.py:1);b (f.py:1)",
+                "main (f.py:1);a (f.py:1);c (f.py:1)",
+                "main (f.py:1);b (f.py:1);c (f.py:1)"})
+        self.assertAlmostEqual(stacks["main (f.py:1);a (f.py:1);c (f.py:1)"],
+                               3)
+        self.assertAlmostEqual(stacks["main (f.py:1);b (f.py:1);c (f.py:1)"],
+                               6)
+        self.assertAlmostEqual(sum(stacks.values()), 13)
+
+    def test_diamond_chain(self: CollapsedStacksTest) -> None:
+        # Every diamond doubles the number of paths to the functions below
+        depth = 64
+        calls: dict[str,dict[str,float]] = {}
+        tottimes: dict[str,float] = {}
+        for i in range(depth):
+            calls[f"f{i}"] = {f"l{i}": 1e6, f"r{i}": 1e6}
+            calls[f"l{i}"] = {f"f{i + 1}": 1e6}
+            calls[f"r{i}"] = {f"f{i + 1}": 1e6}
+            tottimes.update({f"f{i}": 1, f"l{i}": 1, f"r{i}": 1})
+        tottimes[f"f{depth}"] = 1
+        stats = get_stats(calls, tottimes)
+
+        with patch("crawler.profiler.MAX_FRAMES", 1000):
+            stacks = get_collapsed_stacks(stats)
+        self.assertLessEqual(len(stacks), 1000)
+        # The stacks with the most time are kept
+        self.assertIn("f0 (f.py:1);l0 (f.py:1);f1 (f.py:1)", stacks)
+        self.assertIn("f0 (f.py:1);r0 (f.py:1);f1 (f.py:1)", stacks)
+
+
+if __name__ == "__main__":
+    unittest.main()